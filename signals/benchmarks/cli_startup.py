@@ -0,0 +1,52 @@
+"""
+Benchmark the cold-start time of the CLI, as paid by every scheduled job.
+
+Invoking a probe only imports that probe, whereas the top-level --help still imports
+all of them: it's the cost every invocation paid before probes were registered lazily.
+
+Usage: python signals/benchmarks/cli_startup.py [runs]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+MAIN_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "main.py")
+PROBES_DIR = os.path.join(os.path.dirname(MAIN_PATH), "probes")
+
+
+def time_command(args: list[str], runs: int) -> list[float]:
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, MAIN_PATH, *args],
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def main(runs: int) -> None:
+    probes = sorted(
+        name
+        for name in os.listdir(PROBES_DIR)
+        if os.path.isfile(os.path.join(PROBES_DIR, name, "run.py"))
+    )
+    cases = {"all probes imported (eager)": ["--help"]} | {
+        f"{probe} only (lazy)": [probe, "--help"] for probe in probes
+    }
+    for label, args in cases.items():
+        durations = time_command(args, runs)
+        print(
+            f"{label:<40} median {statistics.median(durations):.3f}s"
+            f"  min {min(durations):.3f}s"
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
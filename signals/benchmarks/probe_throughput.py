@@ -0,0 +1,431 @@
+"""
+Benchmark the probes against synthetic large inputs, with stubbed market data, Strava and Telegram:
+- daily_close over a watchlist of 10k tickers
+- sma_crossover over 1k tickers with 20 years of daily bars each
+- sma_crossover over 1k tickers with 40 years of daily bars each in the OHLCV cache
+- the conversion of a grouped yfinance download of 1k tickers with 20 years of bars each
+- the listing of new runs (strava_to_gcal) over thousands of activities
+- the cold start of the CLI
+
+Each benchmark runs in its own process so that its peak memory (max RSS) is its own.
+A reference workload is measured in the same run, and the throughput, peak memory and startup
+time are compared with baseline.json relative to it, so that the baseline holds on other machines.
+The command fails when one of them regresses past the tolerance.
+
+Usage: python signals/benchmarks/probe_throughput.py run [--size-factor 0.1] [--update-baseline]
+"""
+
+import contextlib
+import io
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tempfile
+from datetime import date, timedelta
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+import polars as pl
+import typer
+from cli_startup import time_command
+from typing_extensions import Annotated
+
+SIGNALS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The probes import their utils as top-level modules, as when run from main.py
+sys.path.insert(0, SIGNALS_DIR)
+
+from utils.cache_utils import get_cache_path, write_cached_ohlcv  # noqa: E402
+from utils.market_data_utils import MarketDataProvider, YFinanceProvider  # noqa: E402
+
+BASELINE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "baseline.json"
+)
+# Number of items processed by each benchmark at --size-factor 1
+SIZES = {
+    "daily_close": 10_000,  # tickers
+    "sma_crossover": 1_000,  # tickers, with 20 years of bars each
+    "sma_crossover_cached": 1_000,  # tickers, with 40 years of cached bars each
+    "yfinance_ingestion": 1_000,  # tickers, with 20 years of bars each
+    "get_new_runs": 20_000,  # activities
+}
+# Rows of the reference workload, the same whatever the --size-factor
+REFERENCE_SIZE = 1_000_000
+SMA_CROSSOVER_YEARS = 20
+CACHED_YEARS = 40
+
+
+def synthetic_ohlcv(n_bars: int, seed: int) -> pl.DataFrame:
+    """Daily bars (business days) of a random walk, ending yesterday."""
+    rng = np.random.default_rng(seed)
+    end = np.datetime64(date.today() - timedelta(days=1), "D")
+    dates = np.busday_offset(end, np.arange(-n_bars + 1, 1), roll="backward")
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n_bars)))
+    return pl.DataFrame(
+        {
+            "Date": dates,
+            "Open": close,
+            "High": close * 1.01,
+            "Low": close * 0.99,
+            "Close": close,
+            "Volume": rng.integers(1_000, 1_000_000, n_bars).astype(np.float64),
+        }
+    ).with_columns(pl.col("Date").cast(pl.Date))
+
+
+def synthetic_download(tickers: list[str], n_bars: int) -> pd.DataFrame:
+    """
+    Bars of <tickers> shaped like a grouped yfinance download: indexed by date, with (Price, Ticker)
+    columns, and NaNs where a ticker has no bar (e.g., a holiday of its exchange).
+    """
+    rng = np.random.default_rng(0)
+    index = pd.bdate_range(end=date.today() - timedelta(days=1), periods=n_bars)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, (n_bars, len(tickers))), axis=0))
+    close[rng.random(close.shape) < 0.02] = np.nan
+    return pd.DataFrame(
+        np.concatenate(
+            [close, close * 1.01, close * 0.99, close, close * 1000], axis=1
+        ),
+        index=pd.Index(index, name="Date"),
+        columns=pd.MultiIndex.from_product(
+            [["Close", "High", "Low", "Open", "Volume"], tickers],
+            names=["Price", "Ticker"],
+        ),
+    )
+
+
+class SyntheticProvider(MarketDataProvider):
+    """Bars generated upfront, served like a replay provider would."""
+
+    def __init__(self, ohlcv_by_ticker: dict[str, pl.DataFrame]):
+        self.ohlcv_by_ticker = ohlcv_by_ticker
+
+    def get_ohlcv(self, tickers: list[str], start: date) -> dict[str, pl.DataFrame]:
+        return {
+            ticker: self.ohlcv_by_ticker[ticker].filter(pl.col("Date") >= start)
+            for ticker in tickers
+        }
+
+
+class GeneratedProvider(MarketDataProvider):
+    """Bars generated on request from the ticker's index, so that they're never all held at once."""
+
+    def __init__(self, n_bars: int):
+        self.n_bars = n_bars
+
+    def get_ohlcv(self, tickers: list[str], start: date) -> dict[str, pl.DataFrame]:
+        return {
+            ticker: synthetic_ohlcv(self.n_bars, int(ticker[1:6])).filter(
+                pl.col("Date") >= start
+            )
+            for ticker in tickers
+        }
+
+
+class FakeResponse:
+    def __init__(self, payload: list[dict]):
+        self.payload = payload
+        self.content = json.dumps(payload).encode()
+
+    def raise_for_status(self) -> None:
+        pass
+
+    def json(self) -> list[dict]:
+        return json.loads(self.content)
+
+
+def synthetic_activities(n: int) -> list[dict]:
+    return [
+        {
+            "id": 10_000_000_000 + i,
+            "sport_type": "Run" if i % 3 else "Ride",
+            "start_date_local": "2024-01-10T07:30:00Z",
+            "timezone": "(GMT+01:00) Europe/Paris",
+            "elapsed_time": 3600,
+            "moving_time": 3500,
+            "distance": 10_000.0,
+        }
+        for i in range(n)
+    ]
+
+
+def bench_reference(size: int) -> float:
+    """
+    A fixed mix of polars and pure Python work, the unit the other benchmarks are measured in:
+    a slower machine runs it and the probes alike slower.
+    """
+    rng = np.random.default_rng(0)
+    frame = pl.DataFrame(
+        {"key": rng.integers(0, 1_000, size), "value": rng.normal(0, 1, size)}
+    )
+    values = frame["value"].to_list()
+    start = time.perf_counter()
+    frame.sort("value").group_by("key").agg(pl.col("value").sum())
+    total = 0.0
+    for value in values:
+        total += value * value
+    return time.perf_counter() - start
+
+
+def bench_daily_close(size: int) -> float:
+    from probes.daily_close.run import daily_close
+
+    tickers = [f"T{i:05d}.PA" for i in range(size)]
+    provider = SyntheticProvider(
+        {ticker: synthetic_ohlcv(30, seed) for seed, ticker in enumerate(tickers)}
+    )
+    with (
+        patch("probes.daily_close.run.get_market_data_provider", return_value=provider),
+        patch("probes.daily_close.run.send_message"),
+    ):
+        start = time.perf_counter()
+        daily_close(tickers=tickers)
+        return time.perf_counter() - start
+
+
+def bench_sma_crossover(size: int) -> float:
+    from probes.sma_crossover.run import sma_crossover
+
+    tickers = [f"T{i:05d}.PA" for i in range(size)]
+    provider = SyntheticProvider(
+        {
+            ticker: synthetic_ohlcv(SMA_CROSSOVER_YEARS * 261, seed)
+            for seed, ticker in enumerate(tickers)
+        }
+    )
+    with (
+        patch(
+            "probes.sma_crossover.run.get_market_data_provider", return_value=provider
+        ),
+        patch("probes.sma_crossover.run.send_message"),
+        contextlib.redirect_stdout(io.StringIO()),
+    ):
+        start = time.perf_counter()
+        sma_crossover(
+            tickers=tickers,
+            lookbacks="50,200",
+            trading_hours_open="09:00",
+            trading_hours_close="17:30",
+            timezone="Europe/Paris",
+        )
+        return time.perf_counter() - start
+
+
+def bench_sma_crossover_cached(size: int) -> float:
+    from probes.sma_crossover.run import sma_crossover
+
+    tickers = [f"T{i:05d}.PA" for i in range(size)]
+    provider = GeneratedProvider(CACHED_YEARS * 261)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # The cache holds the whole history, only its last bars are downloaded again
+        start = date.today() - timedelta(days=CACHED_YEARS * 366)
+        for ticker in tickers:
+            write_cached_ohlcv(
+                get_cache_path(cache_dir, ticker),
+                provider.get_ohlcv([ticker], start)[ticker],
+                start,
+            )
+        with (
+            patch(
+                "probes.sma_crossover.run.get_market_data_provider",
+                return_value=provider,
+            ),
+            patch("probes.sma_crossover.run.send_message"),
+            contextlib.redirect_stdout(io.StringIO()),
+        ):
+            start_time = time.perf_counter()
+            sma_crossover(
+                tickers=tickers,
+                lookbacks="50,200",
+                trading_hours_open="09:00",
+                trading_hours_close="17:30",
+                timezone="Europe/Paris",
+                cache_dir=cache_dir,
+            )
+            return time.perf_counter() - start_time
+
+
+def bench_yfinance_ingestion(size: int) -> float:
+    tickers = [f"T{i:05d}.PA" for i in range(size)]
+    raw = synthetic_download(tickers, SMA_CROSSOVER_YEARS * 261)
+    with patch("utils.market_data_utils.yf.download", return_value=raw):
+        start_time = time.perf_counter()
+        ohlcv_by_ticker = YFinanceProvider().get_ohlcv(tickers, date(1970, 1, 1))
+        elapsed = time.perf_counter() - start_time
+    assert all(not ohlcv.is_empty() for ohlcv in ohlcv_by_ticker.values())
+    return elapsed
+
+
+def bench_get_new_runs(size: int) -> float:
+    from probes.strava_to_gcal.run import iter_new_runs
+
+    activities = synthetic_activities(size)
+
+    def fake_get(url, headers, params, timeout):
+        # Listed with <after>: oldest first, page by page
+        first = (params["page"] - 1) * params["per_page"]
+        return FakeResponse(activities[first : first + params["per_page"]])
+
+    with patch("probes.strava_to_gcal.run.requests.get", side_effect=fake_get):
+        start = time.perf_counter()
+        n_runs = sum(len(runs) for runs in iter_new_runs("access_token", 0, after=0))
+        elapsed = time.perf_counter() - start
+    assert n_runs == sum(a["sport_type"] == "Run" for a in activities)
+    return elapsed
+
+
+BENCHMARKS = {
+    "reference": bench_reference,
+    "daily_close": bench_daily_close,
+    "sma_crossover": bench_sma_crossover,
+    "sma_crossover_cached": bench_sma_crossover_cached,
+    "yfinance_ingestion": bench_yfinance_ingestion,
+    "get_new_runs": bench_get_new_runs,
+}
+
+
+def run_in_subprocess(name: str, size: int, runs: int) -> dict:
+    """Run the benchmark <name> in a fresh process and return its measures."""
+    output = subprocess.run(
+        [sys.executable, __file__, "measure", name, str(size), str(runs)],
+        check=True,
+        capture_output=True,
+        text=True,
+        env={
+            **os.environ,
+            "TELEGRAM_CHAT_ID": "benchmark",
+            "TELEGRAM_BOT_TOKEN": "benchmark",
+        },
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+app = typer.Typer(add_completion=False)
+
+
+@app.command()
+def measure(name: str, size: int, runs: int) -> None:
+    """Run the benchmark <name> <runs> times in this process and print its measures as JSON."""
+    seconds = min(BENCHMARKS[name](size) for _ in range(runs))
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(
+        json.dumps(
+            {
+                "size": size,
+                "seconds": seconds,
+                "throughput": size / seconds,
+                "peak_rss_mb": peak_rss_mb,
+            }
+        )
+    )
+
+
+# Measures compared with the baseline, and whether higher is better
+MEASURES = {
+    "relative_throughput": True,
+    "relative_peak_rss": False,
+    "relative_startup": False,
+}
+
+
+def add_relative_measures(results: dict[str, dict]) -> None:
+    """
+    Add to <results> their measures relative to the reference workload's: the items processed
+    in the time of one reference run, the peak memory per reference process' peak memory
+    (mostly the imported libraries), and the startup time in reference runs.
+    """
+    reference = results["reference"]
+    for result in results.values():
+        if "throughput" in result:
+            result["relative_throughput"] = result["throughput"] * reference["seconds"]
+            result["relative_peak_rss"] = (
+                result["peak_rss_mb"] / reference["peak_rss_mb"]
+            )
+        if "startup_s" in result:
+            result["relative_startup"] = result["startup_s"] / reference["seconds"]
+
+
+def compare(
+    results: dict[str, dict], baseline: dict[str, dict], tolerance: float
+) -> list[str]:
+    """Return the regressions of <results> past <tolerance> (e.g., 0.25 for 25%) against <baseline>."""
+    regressions = []
+    for name, result in results.items():
+        for measure_name, higher_is_better in MEASURES.items():
+            if measure_name not in result or measure_name not in baseline.get(name, {}):
+                continue
+            value, expected = result[measure_name], baseline[name][measure_name]
+            limit = expected * (1 - tolerance if higher_is_better else 1 + tolerance)
+            if value < limit if higher_is_better else value > limit:
+                regressions.append(
+                    f"{name}: {measure_name} {value:.3f} vs {expected:.3f} in the baseline"
+                )
+    return regressions
+
+
+@app.command()
+def run(
+    size_factor: Annotated[
+        float,
+        typer.Option(help="Scale of the synthetic inputs, 1 being the sizes of SIZES"),
+    ] = 1.0,
+    runs: Annotated[
+        int, typer.Option(help="Runs per benchmark, the fastest one is kept")
+    ] = 5,
+    tolerance: Annotated[
+        float,
+        typer.Option(help="Regression past which the command fails (0.25 for 25%)"),
+    ] = 0.25,
+    update_baseline: Annotated[
+        bool, typer.Option(help="Write the results to baseline.json instead")
+    ] = False,
+) -> None:
+    """Run all the benchmarks and compare them with the baseline."""
+    results = {}
+    for name in BENCHMARKS:
+        size = (
+            REFERENCE_SIZE
+            if name == "reference"
+            else max(1, int(SIZES[name] * size_factor))
+        )
+        results[name] = run_in_subprocess(name, size, runs)
+        print(
+            f"{name:<22} {size:>6} items  {results[name]['throughput']:>10.0f}/s"
+            f"  peak {results[name]['peak_rss_mb']:>6.0f} MB"
+        )
+    startup_s = statistics.median(time_command(["sma_crossover", "--help"], runs))
+    results["cli_startup"] = {"startup_s": startup_s}
+    print(f"{'cli_startup':<22} {startup_s:.3f}s")
+    # The reference is measured again after the others and its fastest run kept,
+    # so that a slow spell of the machine while first measuring it doesn't skew all the ratios
+    reference = run_in_subprocess("reference", REFERENCE_SIZE, runs)
+    if reference["seconds"] < results["reference"]["seconds"]:
+        results["reference"] = reference
+    add_relative_measures(results)
+
+    if update_baseline:
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {BASELINE_PATH}")
+        return
+
+    with open(BASELINE_PATH) as f:
+        baseline = json.load(f)
+    sizes = {name: baseline[name].get("size") for name in SIZES if name in baseline}
+    if any(size != results[name]["size"] for name, size in sizes.items()):
+        print("The baseline was measured with other sizes, the throughputs may differ")
+    regressions = compare(results, baseline, tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        raise typer.Exit(code=1)
+
+
+if __name__ == "__main__":
+    app()
@@ -2,7 +2,7 @@ import os
 
 import dotenv
 import typer
-from utils.cli_utils import load_and_register_commands
+from utils.cli_utils import load_and_register_commands, register_lazy_command
 
 app = typer.Typer()
 load_and_register_commands(
@@ -12,12 +12,20 @@ load_and_register_commands(
         "probes",
     ),
 )
+# Like the probes, the commands running several jobs are only imported when invoked
+register_lazy_command(app, "run_jobs", "utils.job_utils:run_jobs")
+register_lazy_command(app, "serve", "utils.serve_utils:serve")
+register_lazy_command(app, "replay", "utils.replay_utils:replay")
 
 
-# Note: previously a dummy @app.callback() was needed to force Typer to treat
-# the app as multi-command when only one subcommand existed.
-# It was removed once a second subcommand was added.
+# Note: the callback forces Typer to treat the app as multi-command: all the
+# commands are registered lazily so, as far as Typer knows, there are none.
 # https://github.com/fastapi/typer/issues/315#issuecomment-1142593959
+@app.callback()
+def callback():
+    """
+    Probe sources of information and signal accordingly
+    """
 
 
 if __name__ == "__main__":
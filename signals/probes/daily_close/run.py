@@ -1,11 +1,15 @@
 import logging
 import os
-from datetime import datetime, timedelta
+from datetime import date, timedelta
+from zoneinfo import ZoneInfo
 
 import polars as pl
 import typer
-import yfinance as yf
 from typing_extensions import Annotated
+from utils.calendar_utils import get_calendar
+from utils.clock_utils import get_now
+from utils.market_data_utils import get_market_data_provider
+from utils.metrics_utils import FETCH, SIGNAL, phase
 from utils.signal_utils import send_message
 
 logging.basicConfig(
@@ -16,27 +20,63 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def get_close_data_batch(
+    tickers: list[str],
+    last_session: date | None = None,
+) -> dict[str, tuple[float, float, str] | Exception]:
+    """
+    Fetch the previous and latest closes of all <tickers> with a single grouped download.
+
+    Returns a mapping from each ticker to either (prev_close, latest_close, date)
+    or the exception explaining why its closes couldn't be extracted (e.g., the
+    failure of the download itself), so that one bad ticker doesn't prevent
+    reporting the others.
+    The bars after <last_session>, if given, are left out (e.g., the one of a session still open).
+    """
+    try:
+        ohlcv_by_ticker = get_market_data_provider().get_ohlcv(
+            tickers, (get_now() - timedelta(days=10)).date()
+        )
+    except Exception as e:
+        # Every ticker is reported with the failure of the download
+        logger.error(f"Failed to download the closes: {e}")
+        return dict.fromkeys(tickers, e)
+
+    results: dict[str, tuple[float, float, str] | Exception] = {}
+    for ticker in tickers:
+        df = ohlcv_by_ticker.get(ticker)
+        if df is None:
+            results[ticker] = ValueError(f"No data returned for {ticker}")
+            continue
+        if last_session is not None:
+            df = df.filter(pl.col("Date") <= last_session)
+        if df.height < 2:
+            results[ticker] = ValueError(f"Insufficient data for {ticker}")
+            continue
+        prev_close = df["Close"][-2]
+        latest_close = df["Close"][-1]
+        latest_date = df["Date"][-1].isoformat()
+        results[ticker] = (prev_close, latest_close, latest_date)
+    return results
+
+
 def get_close_data(ticker: str) -> tuple[float, float, str]:
-    raw = yf.download(
-        ticker,
-        interval="1d",
-        start=(datetime.now() - timedelta(days=10)).strftime("%Y-%m-%d"),
-    )
-    if raw is None or len(raw) < 2:
-        raise ValueError(f"Insufficient data for {ticker}")
-    raw.reset_index(inplace=True)
-    raw.columns = [col[0] for col in raw.columns]
-    df = pl.from_pandas(raw).select(["Date", "Close"]).sort("Date")
-    prev_close = df["Close"][-2]
-    latest_close = df["Close"][-1]
-    latest_date = str(df["Date"][-1])[:10]
-    return prev_close, latest_close, latest_date
+    result = get_close_data_batch([ticker])[ticker]
+    if isinstance(result, Exception):
+        raise result
+    return result
 
 
 def daily_close(
     tickers: Annotated[
         list[str], typer.Argument(help="Yahoo Finance tickers to monitor")
     ],
+    exchange: Annotated[
+        str | None,
+        typer.Option(
+            help="Trading calendar of the tickers' exchange (XPAR, XNYS or CRYPTO), to skip the non-trading days and report the last completed session"
+        ),
+    ] = None,
 ) -> None:
     """
     Monitor a list of tickers for previous close, close, and daily return
@@ -44,9 +84,24 @@ def daily_close(
     date_str = None
     lines = []
 
+    last_session = None
+    if exchange:
+        calendar = get_calendar(exchange)
+        now = get_now(tz=ZoneInfo(calendar.timezone))
+        if not calendar.is_trading_day(now):
+            logger.info(f"{now.date()} isn't a {exchange} trading day, skipping")
+            return
+        last_session = calendar.last_completed_session(now)
+
+    with phase(FETCH):
+        close_data = get_close_data_batch(tickers, last_session)
+
     for ticker in tickers:
         try:
-            prev_close, latest_close, date = get_close_data(ticker)
+            result = close_data[ticker]
+            if isinstance(result, Exception):
+                raise result
+            prev_close, latest_close, date = result
             if date_str is None:
                 date_str = date
             daily_return = (latest_close - prev_close) / prev_close * 100
@@ -70,4 +125,5 @@ def daily_close(
     telegram_bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
     if not telegram_bot_token:
         raise ValueError("Missing TELEGRAM_BOT_TOKEN env var")
-    send_message(chat_id=chat_id, message=message, token=telegram_bot_token)
+    with phase(SIGNAL):
+        send_message(chat_id=chat_id, message=message, token=telegram_bot_token)
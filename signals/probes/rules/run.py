@@ -0,0 +1,441 @@
+import logging
+import os
+import re
+import tomllib
+from dataclasses import dataclass
+from datetime import date, timedelta
+from zoneinfo import ZoneInfo
+
+import polars as pl
+import typer
+from probes.sma_crossover.run import download_ohlcv
+from typing_extensions import Annotated
+from utils.cache_utils import get_cached_ohlcv
+from utils.calendar_utils import get_calendar
+from utils.clock_utils import get_now
+from utils.indicator_utils import Indicator, compute_latest_indicators, to_lazy_ohlcv
+from utils.market_data_utils import get_market_data_provider
+from utils.metrics_utils import COMPUTE, FETCH, PERSIST, SIGNAL, phase
+from utils.signal_utils import send_message
+from utils.state_utils import get_state_backend
+
+logging.basicConfig(
+    format="%(asctime)s %(levelname)-8s %(message)s",
+    level=logging.INFO,
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+# A rule signals when its state changes to the side of its operator, or to either side for "crosses"
+OPERATORS = {">": {"above"}, "<": {"below"}, "crosses": {"above", "below"}}
+CONDITION_PATTERN = re.compile(r"(\S+)\s+(>|<|crosses)\s+(\S+)")
+OPERAND_PATTERN = re.compile(
+    r"(?:(?P<scale>[-+]?\d*\.?\d+)\*)?(?P<name>[a-z]+\d*)|(?P<constant>[-+]?\d*\.?\d+)(?P<percent>%?)"
+)
+
+
+@dataclass(frozen=True)
+class Operand:
+    """<scale> times the close or an indicator of the ticker, or a constant when <indicator> and <column> are None."""
+
+    spec: str
+    scale: float
+    column: str | None = None
+    indicator: Indicator | None = None
+
+    @classmethod
+    def parse(cls, spec: str) -> "Operand":
+        """Parse an operand like close, 1.03*ema50, 30 or -5%."""
+        match = OPERAND_PATTERN.fullmatch(spec.lower())
+        if match is None:
+            raise ValueError(f"Invalid operand: {spec}")
+        if match["constant"] is not None:
+            return cls(
+                spec, float(match["constant"]) / (100 if match["percent"] else 1)
+            )
+        scale = float(match["scale"]) if match["scale"] else 1.0
+        if match["name"] == "close":
+            return cls(spec, scale, "Close")
+        indicator = Indicator.parse(match["name"])
+        return cls(spec, scale, indicator.name, indicator)
+
+
+@dataclass(frozen=True)
+class Rule:
+    """
+    A condition on the bars of <tickers>, e.g. "close crosses 1.03*ema50", "return1 < -5%" or "close > 30",
+    with the hysteresis of sma_crossover: starting from a 'neutral' or 'below' state, the left operand
+    must exceed the right one by <upward_tolerance>% to turn 'above', and from a 'neutral' or 'above'
+    state, fall below it by <downward_tolerance>% to turn 'below'.
+    """
+
+    name: str
+    tickers: tuple[str, ...]
+    condition: str
+    left: Operand
+    operator: str
+    right: Operand
+    upward_tolerance: float = 0.0
+    downward_tolerance: float = 0.0
+
+    @classmethod
+    def parse(cls, rule: dict) -> "Rule":
+        condition = rule["condition"]
+        match = CONDITION_PATTERN.fullmatch(condition.strip())
+        if match is None:
+            raise ValueError(f"Invalid condition: {condition}")
+        tickers = rule.get("tickers") or [rule["ticker"]]
+        return cls(
+            name=rule.get("name", condition),
+            tickers=tuple(tickers),
+            condition=condition,
+            left=Operand.parse(match[1]),
+            operator=match[2],
+            right=Operand.parse(match[3]),
+            upward_tolerance=rule.get("upward_tolerance", 0.0),
+            downward_tolerance=rule.get("downward_tolerance", 0.0),
+        )
+
+    @property
+    def indicators(self) -> list[Indicator]:
+        return [o.indicator for o in (self.left, self.right) if o.indicator is not None]
+
+
+def load_rules(rules_path: str) -> list[Rule]:
+    """
+    Load the rules of a TOML file with one [[rules]] table per rule, e.g.:
+
+        [[rules]]
+        name = "Trend"
+        tickers = ["CW8.PA", "ESE.PA"]
+        condition = "close crosses 1.03*ema50"
+        upward_tolerance = 1
+        downward_tolerance = 1
+
+        [[rules]]
+        ticker = "^VIX"
+        condition = "close > 30"
+    """
+    with open(rules_path, "rb") as f:
+        rules = tomllib.load(f).get("rules", [])
+    try:
+        return [Rule.parse(rule) for rule in rules]
+    except (KeyError, ValueError) as e:
+        raise ValueError(f"Invalid rule in {rules_path}: {e}") from None
+
+
+def get_state_key(ticker: str, rule: Rule) -> str:
+    return f"rules:{ticker}:{rule.name}:{rule.condition}:{rule.upward_tolerance:g}:{rule.downward_tolerance:g}"
+
+
+def compile_rules(rules: list[Rule]) -> pl.DataFrame:
+    """
+    Compile <rules> into one row per (rule, ticker), so that all of them are evaluated
+    together by evaluate_rules. A rule declared twice with the same name, condition and
+    tolerances for a ticker is only evaluated once.
+    """
+    rows = [
+        {
+            "Key": get_state_key(ticker, rule),
+            "Rule": rule.name,
+            "Ticker": ticker,
+            "Operator": rule.operator,
+            "LeftSpec": rule.left.spec,
+            "RightSpec": rule.right.spec,
+            "LeftColumn": rule.left.column,
+            "LeftScale": rule.left.scale,
+            "RightColumn": rule.right.column,
+            "RightScale": rule.right.scale,
+            "UpwardTolerance": float(rule.upward_tolerance),
+            "DownwardTolerance": float(rule.downward_tolerance),
+        }
+        for rule in rules
+        for ticker in rule.tickers
+    ]
+    return pl.DataFrame(
+        rows,
+        schema={
+            "Key": pl.String,
+            "Rule": pl.String,
+            "Ticker": pl.String,
+            "Operator": pl.String,
+            "LeftSpec": pl.String,
+            "RightSpec": pl.String,
+            "LeftColumn": pl.String,
+            "LeftScale": pl.Float64,
+            "RightColumn": pl.String,
+            "RightScale": pl.Float64,
+            "UpwardTolerance": pl.Float64,
+            "DownwardTolerance": pl.Float64,
+        },
+    ).unique("Key", keep="first", maintain_order=True)
+
+
+def operand_value(side: str) -> pl.Expr:
+    # A constant operand has no column: its value is its scale
+    return (
+        pl.when(pl.col(f"{side}Column").is_null())
+        .then(pl.col(f"{side}Scale"))
+        .otherwise(pl.col(f"{side}Scale") * pl.col(f"{side}Value"))
+    )
+
+
+def next_state() -> pl.Expr:
+    """update_state of sma_crossover, vectorized, with bands relative to the magnitude of the right operand."""
+    left = pl.col("Left")
+    band = pl.col("Right").abs()
+    upper = pl.col("Right") + band * pl.col("UpwardTolerance") / 100
+    lower = pl.col("Right") - band * pl.col("DownwardTolerance") / 100
+    previous = pl.col("PreviousState")
+    return (
+        pl.when(previous == "above")
+        .then(pl.when(left > lower).then(pl.lit("above")).otherwise(pl.lit("below")))
+        .when(previous == "below")
+        .then(pl.when(left > upper).then(pl.lit("above")).otherwise(pl.lit("below")))
+        .when(left > upper)
+        .then(pl.lit("above"))
+        .when(left < lower)
+        .then(pl.lit("below"))
+        .otherwise(pl.lit("neutral"))
+    )
+
+
+def evaluate_rules(
+    compiled: pl.DataFrame, latest: pl.DataFrame, previous_states: dict[str, str]
+) -> pl.DataFrame:
+    """
+    Evaluate the <compiled> rules against the <latest> indicators of their tickers (see compute_latest_indicators)
+    in a single pass, adding the Date, the Left and Right operands, the PreviousState, the new State and
+    whether it's Signaled. Rules whose operands can't be computed get a null State.
+    """
+    values = latest.select(
+        "Ticker", "Date", pl.exclude("Ticker", "Date", "Bars").cast(pl.Float64)
+    ).unpivot(index=["Ticker", "Date"], variable_name="Column", value_name="Value")
+    dates = latest.select("Ticker", "Date")
+    evaluated = (
+        compiled.lazy()
+        .join(dates.lazy(), on="Ticker", how="left")
+        .join(
+            values.lazy().select(
+                "Ticker",
+                pl.col("Column").alias("LeftColumn"),
+                pl.col("Value").alias("LeftValue"),
+            ),
+            on=["Ticker", "LeftColumn"],
+            how="left",
+        )
+        .join(
+            values.lazy().select(
+                "Ticker",
+                pl.col("Column").alias("RightColumn"),
+                pl.col("Value").alias("RightValue"),
+            ),
+            on=["Ticker", "RightColumn"],
+            how="left",
+        )
+        .with_columns(
+            Left=operand_value("Left"),
+            Right=operand_value("Right"),
+            PreviousState=pl.col("Key").replace_strict(
+                previous_states, default="neutral", return_dtype=pl.String
+            ),
+        )
+        .with_columns(
+            State=pl.when(
+                pl.col("Date").is_null()
+                | pl.col("Left").is_null()
+                | pl.col("Right").is_null()
+            )
+            .then(pl.lit(None, dtype=pl.String))
+            .otherwise(next_state())
+        )
+        .with_columns(
+            Signaled=(
+                (pl.col("State") != pl.col("PreviousState"))
+                & pl.any_horizontal(
+                    (pl.col("Operator") == operator)
+                    & pl.col("State").is_in(list(states))
+                    for operator, states in OPERATORS.items()
+                )
+            ).fill_null(False)
+        )
+        .drop("LeftValue", "RightValue")
+    )
+    return evaluated.collect()
+
+
+def format_rule_message(row: dict) -> str:
+    """Message of a rule's state change, in the format of sma_crossover's."""
+    difference = (
+        (row["Left"] - row["Right"]) / abs(row["Right"]) * 100 if row["Right"] else 0.0
+    )
+    return (
+        "🚨"
+        + f"[{row['Ticker']}, {row['Rule']}, {row['UpwardTolerance']:g}/{row['DownwardTolerance']:g}%]\n"
+        + f"State changed from {row['PreviousState']} to {row['State']}."
+        + "\n"
+        + f"{row['Date']}: {row['LeftSpec']} = {round(row['Left'], 4)}, {row['RightSpec']} = {round(row['Right'], 4)}, {round(difference, 2)}% difference."
+    )
+
+
+def get_ohlcv_by_ticker(
+    tickers: list[str], start: date, cache_dir: str | None
+) -> tuple[dict[str, pl.DataFrame], dict[str, Exception]]:
+    if not cache_dir:
+        # All the tickers in a single request
+        return get_market_data_provider().get_ohlcv(tickers, start), {}
+    ohlcv_by_ticker, errors = {}, {}
+    for ticker in tickers:
+        try:
+            ohlcv_by_ticker[ticker] = get_cached_ohlcv(
+                ticker, start, download_ohlcv, cache_dir
+            )
+        except Exception as e:
+            errors[ticker] = e
+    return ohlcv_by_ticker, errors
+
+
+def rules(
+    rules_path: Annotated[
+        str,
+        typer.Argument(
+            help="Path to the TOML file declaring the rules, one [[rules]] table per rule"
+        ),
+    ],
+    previous_state: Annotated[
+        list[str] | None,
+        typer.Option(
+            help="Last state: 'neutral', 'below', or 'above' (defaults to the stored state, or 'neutral'). Repeat it once per (rule, ticker) pair, in the order of the rules then their tickers, or give it once for all"
+        ),
+    ] = None,
+    cache_dir: Annotated[
+        str | None,
+        typer.Option(
+            envvar="SIGNALS_CACHE_DIR",
+            help="Directory of the on-disk OHLCV cache, only new bars are downloaded when set",
+        ),
+    ] = None,
+    state_url: Annotated[
+        str | None,
+        typer.Option(
+            envvar="SIGNALS_STATE_URL",
+            help="State store (sqlite://<path> or file://<path>) to read the previous states of the rules from and write the new ones to",
+        ),
+    ] = None,
+    exchange: Annotated[
+        str | None,
+        typer.Option(
+            help="Trading calendar of the tickers' exchange (XPAR, XNYS or CRYPTO), to leave out the bar of a session still open. Without it, the current day's bar is always left out"
+        ),
+    ] = None,
+) -> dict[str, str]:
+    """
+    Monitor tickers for threshold crossings of rules on their close and indicators
+    """
+    rule_list = load_rules(rules_path)
+    compiled = compile_rules(rule_list)
+    tickers = compiled["Ticker"].unique(maintain_order=True).to_list()
+    indicators = list(
+        dict.fromkeys(indicator for rule in rule_list for indicator in rule.indicators)
+    )
+    history_bars = max((indicator.history_bars for indicator in indicators), default=2)
+
+    keys = compiled["Key"].to_list()
+    given_states = previous_state or []
+    if len(given_states) == 1:
+        given_states = given_states * len(keys)
+    elif given_states and len(given_states) != len(keys):
+        raise ValueError(
+            f"Expected 1 or {len(keys)} previous states, got {len(given_states)}"
+        )
+    invalid_states = set(given_states) - {"neutral", "below", "above"}
+    if invalid_states:
+        raise ValueError(f"Invalid previous_state: {', '.join(sorted(invalid_states))}")
+
+    state_backend = get_state_backend(state_url) if state_url else None
+    with phase(PERSIST):
+        stored = state_backend.get_many(keys) if state_backend else {}
+    previous_states = dict(zip(keys, given_states)) if given_states else stored
+
+    # Multiplying by 2 to ensure that the period contains enough trading days, even around holidays
+    start = (get_now() - timedelta(days=max(history_bars * 2, 10))).date()
+    with phase(FETCH):
+        try:
+            ohlcv_by_ticker, fetch_errors = get_ohlcv_by_ticker(
+                tickers, start, cache_dir
+            )
+        except Exception as e:
+            logger.error(e)
+            ohlcv_by_ticker, fetch_errors = {}, {ticker: e for ticker in tickers}
+
+    with phase(COMPUTE):
+        ohlcv_by_ticker = {
+            ticker: ohlcv
+            for ticker, ohlcv in ohlcv_by_ticker.items()
+            if not ohlcv.is_empty()
+        }
+        if ohlcv_by_ticker:
+            ohlcv = to_lazy_ohlcv(ohlcv_by_ticker)
+            if exchange:
+                calendar = get_calendar(exchange)
+                last_session = calendar.last_completed_session(
+                    get_now(tz=ZoneInfo(calendar.timezone))
+                )
+                ohlcv = ohlcv.filter(pl.col("Date") <= last_session)
+            else:
+                # Without the calendar, the current day's bar may be of a session still open
+                ohlcv = ohlcv.filter(pl.col("Date") < get_now().date())
+            latest = compute_latest_indicators(ohlcv, indicators)
+        else:
+            latest = pl.DataFrame(schema={"Ticker": pl.String, "Date": pl.Date})
+        evaluated = evaluate_rules(compiled, latest, previous_states)
+
+    messages = []
+    for row in evaluated.filter(pl.col("Signaled")).iter_rows(named=True):
+        messages.append(format_rule_message(row))
+    for row in evaluated.filter(pl.col("State").is_null()).iter_rows(named=True):
+        error = fetch_errors.get(row["Ticker"]) or "not enough data"
+        logger.error(f"{row['Ticker']} {row['Rule']}: {error}")
+        messages.append(f"⚠️[{row['Ticker']}, {row['Rule']}]: error — {error}")
+    logger.info(
+        f"{evaluated.height} rules evaluated, {len(messages)} signals and errors"
+    )
+
+    if messages:
+        chat_id = os.getenv("TELEGRAM_CHAT_ID")
+        if not chat_id:
+            raise ValueError("Missing TELEGRAM_CHAT_ID env var")
+        telegram_bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
+        if not telegram_bot_token:
+            raise ValueError("Missing TELEGRAM_BOT_TOKEN env var")
+        with phase(SIGNAL):
+            send_message(
+                chat_id=chat_id,
+                message="\n\n".join(messages),
+                token=telegram_bot_token,
+                urgent=evaluated["Signaled"].any(),
+            )
+
+    # The rules that couldn't be evaluated keep their previous state so that the next run retries them
+    states = {
+        row["Key"]: row["State"] or row["PreviousState"]
+        for row in evaluated.select("Key", "State", "PreviousState").iter_rows(
+            named=True
+        )
+    }
+    if state_backend:
+        with phase(PERSIST):
+            for key, state in states.items():
+                if state == (stored.get(key) or "neutral"):
+                    continue
+                if not state_backend.compare_and_set(key, stored.get(key), state):
+                    logger.warning(
+                        f"{key} was updated by another run, not overwriting it with {state}"
+                    )
+        state_backend.close()
+
+    # Print the states to stdout, one per (rule, ticker) pair in the order of the rules then their tickers,
+    # so they can be captured in bash which is needed for the GitHub workflows
+    for key in keys:
+        print(states[key])
+    return states
@@ -1,13 +1,20 @@
 import logging
 import os
-from datetime import datetime, timedelta
+from datetime import date, timedelta
 from zoneinfo import ZoneInfo
 
 import polars as pl
 import typer
-import yfinance as yf
 from typing_extensions import Annotated
+from utils.cache_utils import get_cached_ohlcv, refresh_cached_ohlcv, scan_cached_bars
+from utils.calendar_utils import get_calendar
+from utils.clock_utils import get_now
+from utils.indicator_utils import Indicator, compute_latest_indicators
+from utils.market_data_utils import get_market_data_provider
+from utils.metrics_utils import COMPUTE, FETCH, PERSIST, SIGNAL, phase
 from utils.signal_utils import send_message
+from utils.sma_utils import SmaAccumulator
+from utils.state_utils import get_state_backend
 
 logging.basicConfig(
     format="%(asctime)s %(levelname)-8s %(message)s",
@@ -17,24 +24,68 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def get_raw_ohlcv(ticker, lookback, timezone):
-    ohlcv_raw = yf.download(
-        ticker,
-        interval="1d",
-        start=(
-            # Multiplying lookback by 2 to ensure that the period contains enough trading days
-            datetime.now(tz=ZoneInfo(timezone)) - timedelta(days=lookback * 2)
-        ).strftime("%Y-%m-%d"),
-    )
-    if ohlcv_raw is None:
-        raise ValueError("Ticker download from Yahoo Finance failed")
-    ohlcv_raw.reset_index(inplace=True)
-    ohlcv_raw.columns = [col[0] for col in ohlcv_raw.columns]
-    return ohlcv_raw
+def download_ohlcv(ticker: str, start: date) -> pl.DataFrame:
+    return get_market_data_provider().get_ohlcv([ticker], start)[ticker]
+
+
+def get_history_start(lookback, timezone) -> date:
+    # Multiplying lookback by 2 to ensure that the period contains enough trading days
+    return (get_now(tz=ZoneInfo(timezone)) - timedelta(days=lookback * 2)).date()
+
+
+def get_raw_ohlcv(ticker, lookback, timezone, cache_dir=None):
+    start = get_history_start(lookback, timezone)
+    if cache_dir:
+        return get_cached_ohlcv(ticker, start, download_ohlcv, cache_dir)
+    return download_ohlcv(ticker, start)
+
+
+def get_raw_ohlcv_by_ticker(
+    tickers, lookback, timezone, cache_dir=None
+) -> tuple[dict[str, pl.DataFrame | pl.LazyFrame], dict[str, Exception]]:
+    """
+    Return the bars of <tickers> covering <lookback> sessions, and the exception of each ticker
+    whose bars couldn't be fetched.
+    Without <cache_dir>, all the tickers are downloaded with a single grouped request.
+    With it, the cache of each ticker is refreshed on its own, and only its bars from the start of
+    the history are scanned back lazily from the cache file rather than kept in memory until all
+    the tickers are fetched.
+    """
+    if not cache_dir:
+        try:
+            ohlcv_by_ticker = get_market_data_provider().get_ohlcv(
+                tickers, get_history_start(lookback, timezone)
+            )
+        except Exception as e:
+            # Every ticker is reported with the failure of the download
+            logger.error(f"Failed to download the bars: {e}")
+            return {}, dict.fromkeys(tickers, e)
+        return ohlcv_by_ticker, {}
+
+    start = get_history_start(lookback, timezone)
+    ohlcv_by_ticker = {}
+    errors = {}
+    for ticker in tickers:
+        try:
+            path = refresh_cached_ohlcv(ticker, start, download_ohlcv, cache_dir)
+        except Exception as e:
+            errors[ticker] = e
+            continue
+        ohlcv_by_ticker[ticker] = scan_cached_bars(path, start)
+    return ohlcv_by_ticker, errors
+
+
+def to_lazy_bars(ohlcv) -> pl.LazyFrame:
+    """The Date and Close of <ohlcv>, a pandas, polars or lazy polars frame."""
+    if isinstance(ohlcv, pl.DataFrame):
+        ohlcv = ohlcv.lazy()
+    elif not isinstance(ohlcv, pl.LazyFrame):
+        ohlcv = pl.LazyFrame(ohlcv)
+    return ohlcv.select(pl.col("Date").cast(pl.Date), pl.col("Close").cast(pl.Float64))
 
 
 def get_is_market_open(market_open, market_close, tz) -> bool:
-    current_time = datetime.now(tz=ZoneInfo(tz)).strftime("%H:%M")
+    current_time = get_now(tz=ZoneInfo(tz)).strftime("%H:%M")
 
     if market_open > market_close:
         # Quotation hours crossing midnight (e.g., 20:00 to 16:30 next day)
@@ -50,45 +101,140 @@ def get_is_market_open(market_open, market_close, tz) -> bool:
     return is_market_open
 
 
-def get_latest_price_and_sma(
-    ohlcv_raw,
-    lookback,
+def get_latest_prices_and_smas(
+    ohlcv_by_ticker,
+    lookbacks,
     trading_hours_open,
     trading_hours_close,
     timezone,
-):
-    ohlcv = pl.DataFrame(ohlcv_raw)
-    ohlcv = ohlcv.sort("Date", descending=False)
+    sma_accumulators: dict[tuple[str, int], SmaAccumulator] | None = None,
+    last_session: date | None = None,
+) -> dict[tuple[str, int], tuple[float, float, date] | Exception]:
+    """
+    Return the latest close, SMA and date of each (ticker, lookback) pair, or the exception that prevented computing them.
+    The bars of each ticker can be a pandas, polars or lazy polars frame (e.g., a scan of its cache file).
+    The SMAs of all the pairs are computed in a single pass over the bars grouped by ticker,
+    unless <sma_accumulators> are given, in which case they are updated with the new bars instead:
+    only the bars from the last one a ticker's accumulators were updated with are read then.
+
+    The bars after <last_session>, the last completed session of the exchange, are left out.
+    Without it, the current day's bar is left out while the market is open according to the trading hours.
+    """
+    if not ohlcv_by_ticker:
+        return {}
 
-    is_market_open = get_is_market_open(
+    if last_session is not None:
+        is_completed = pl.col("Date") <= last_session
+    elif get_is_market_open(
         trading_hours_open,
         trading_hours_close,
         timezone,
-    )
-
-    if is_market_open:
+    ):
         logger.info("Excluding the current trading day as the market is currently open")
-        ohlcv = ohlcv.filter(
-            pl.col("Date") < datetime.now(tz=ZoneInfo(timezone)).date()
-        )
+        is_completed = pl.col("Date") < get_now(tz=ZoneInfo(timezone)).date()
+    else:
+        is_completed = None
 
-    if ohlcv.height < lookback:
-        raise ValueError(
-            f"Not enough data to compute the {lookback}-day SMA",
-        )
+    # The last bar all the accumulators of a ticker were updated with
+    accumulated_since = {}
+    if sma_accumulators is not None:
+        for ticker in ohlcv_by_ticker:
+            accumulators = [
+                sma_accumulators[(ticker, lookback)] for lookback in lookbacks
+            ]
+            if all(accumulator.sma is not None for accumulator in accumulators):
+                accumulated_since[ticker] = min(
+                    accumulator.last_date for accumulator in accumulators
+                )
 
-    ohlcv = ohlcv.with_columns(
-        [pl.col("Close").rolling_mean(window_size=lookback).alias("SMA")]
+    # A lazy plan per ticker, so that only the Date and Close of its trailing window,
+    # or of its bars since the last accumulated one, are read (e.g., from its cache file)
+    # rather than its whole history
+    window = max(lookbacks)
+    completed_bars = {}
+    trailing = []
+    for ticker, ohlcv_raw in ohlcv_by_ticker.items():
+        bars = to_lazy_bars(ohlcv_raw)
+        if is_completed is not None:
+            bars = bars.filter(is_completed)
+        completed_bars[ticker] = bars
+        if ticker in accumulated_since:
+            bars = bars.filter(pl.col("Date") >= accumulated_since[ticker]).sort("Date")
+        else:
+            # Sorted so that the tail is the latest bars, whatever the order of the source
+            bars = bars.sort("Date").tail(window)
+        trailing.append(bars.with_columns(pl.lit(ticker).alias("Ticker")))
+    ohlcv = pl.concat(trailing, how="vertical_relaxed").collect()
+
+    latest = compute_latest_indicators(
+        ohlcv.lazy(),
+        []
+        if sma_accumulators is not None
+        else [Indicator("sma", lookback) for lookback in lookbacks],
+    )
+    latest_by_ticker = {row["Ticker"]: row for row in latest.iter_rows(named=True)}
+    ohlcv_groups = (
+        ohlcv.partition_by("Ticker", as_dict=True)
+        if sma_accumulators is not None
+        else {}
     )
-    latest_sma = ohlcv["SMA"][-1]
-    if latest_sma is None:
-        raise ValueError("Failed to compute the latest SMA")
 
-    latest_close = ohlcv["Close"][-1]
+    results = {}
+    for ticker in ohlcv_by_ticker:
+        row = latest_by_ticker.get(ticker)
+        for lookback in lookbacks:
+            # Only the new bars of a ticker with accumulators were read, their number doesn't matter
+            if row is None or (
+                ticker not in accumulated_since and row["Bars"] < lookback
+            ):
+                results[(ticker, lookback)] = ValueError(
+                    f"Not enough data to compute the {lookback}-day SMA"
+                )
+                continue
+            if sma_accumulators is None:
+                latest_sma = row[f"SMA{lookback}"]
+            else:
+                # Only the bars since the previous run are pushed into the accumulator
+                ticker_ohlcv = ohlcv_groups[(ticker,)]
+                sma_accumulator = sma_accumulators[(ticker, lookback)]
+                if not sma_accumulator.update(
+                    ticker_ohlcv["Date"], ticker_ohlcv["Close"]
+                ):
+                    if ticker in accumulated_since:
+                        # Gap or restatement: the trailing window is read after all
+                        ticker_ohlcv = (
+                            completed_bars[ticker].sort("Date").tail(window).collect()
+                        )
+                    sma_accumulator.reset(ticker_ohlcv["Date"], ticker_ohlcv["Close"])
+                latest_sma = sma_accumulator.sma
+            if latest_sma is None:
+                results[(ticker, lookback)] = ValueError(
+                    "Failed to compute the latest SMA"
+                )
+                continue
+            results[(ticker, lookback)] = (row["Close"], latest_sma, row["Date"])
+    return results
 
-    latest_date = ohlcv["Date"][-1].date()
 
-    return latest_close, latest_sma, latest_date
+def get_latest_price_and_sma(
+    ohlcv_raw,
+    lookback,
+    trading_hours_open,
+    trading_hours_close,
+    timezone,
+    sma_accumulator: SmaAccumulator | None = None,
+):
+    result = get_latest_prices_and_smas(
+        {"": ohlcv_raw},
+        [lookback],
+        trading_hours_open,
+        trading_hours_close,
+        timezone,
+        {("", lookback): sma_accumulator} if sma_accumulator is not None else None,
+    )[("", lookback)]
+    if isinstance(result, Exception):
+        raise result
+    return result
 
 
 def update_state(
@@ -119,28 +265,78 @@ def update_state(
         raise ValueError(f"Invalid previous_state: {previous_state}")
 
 
+def get_state_key(ticker, lookback, upward_tolerance, downward_tolerance) -> str:
+    return (
+        f"sma_crossover:{ticker}:{lookback}:{upward_tolerance:g}:{downward_tolerance:g}"
+    )
+
+
+def get_sma_key(ticker, lookback) -> str:
+    return f"sma:{ticker}:{lookback}"
+
+
+def parse_lookbacks(lookbacks: str) -> list[int]:
+    return [int(lookback) for lookback in lookbacks.split(",")]
+
+
+def format_message(
+    ticker,
+    lookback,
+    upward_tolerance,
+    downward_tolerance,
+    previous_state,
+    state,
+    latest_price,
+    latest_price_sma,
+    latest_date,
+) -> str:
+    did_signal_change = state != previous_state
+    price_sma_diff = (latest_price / latest_price_sma - 1) * 100
+    logger.info(
+        f"{ticker} SMA{lookback}: previous_state = {previous_state}, state = {state}, did_signal_change = {did_signal_change}, price_sma_diff = {price_sma_diff}"
+    )
+
+    if did_signal_change:
+        message_emoji = "🚨"
+        message_state_change = f"State changed from {previous_state} to {state}."
+    else:
+        message_emoji = "🟰"
+        message_state_change = f"State remains {state}."
+    return (
+        message_emoji
+        + f"[{ticker}, SMA{lookback} crossover, {upward_tolerance}/{downward_tolerance}%]\n"
+        + message_state_change
+        + "\n"
+        + f"{latest_date}: Price = {round(latest_price, 2)}, SMA{lookback} = {round(latest_price_sma, 2)}, {round(price_sma_diff, 2)}% difference."
+    )
+
+
 def sma_crossover(
-    ticker: Annotated[str, typer.Argument(help="Yahoo Finance ticker to probe")],
-    lookback: Annotated[
-        int,
-        typer.Argument(help="Lookback window (in days) over which the SMA is computed"),
+    tickers: Annotated[
+        list[str], typer.Argument(help="Yahoo Finance tickers to probe")
+    ],
+    lookbacks: Annotated[
+        str,
+        typer.Argument(
+            help="Comma-separated lookback windows (in days) over which the SMAs are computed (e.g., 50,200)"
+        ),
     ],
     trading_hours_open: Annotated[
         str,
         typer.Argument(
-            help="Opening hour of the ticker's exchange (HH:MM, ISO 8601, local time)"
+            help="Opening hour of the tickers' exchange (HH:MM, ISO 8601, local time)"
         ),
     ],
     trading_hours_close: Annotated[
         str,
         typer.Argument(
-            help="Closing hour of the ticker's exchange (HH:MM, ISO 8601, local time)"
+            help="Closing hour of the tickers' exchange (HH:MM, ISO 8601, local time)"
         ),
     ],
     timezone: Annotated[
         str,
         typer.Argument(
-            help="Timezone of the ticker's exchange (e.g., America/New_York)"
+            help="Timezone of the tickers' exchange (e.g., America/New_York)"
         ),
     ],
     upward_tolerance: Annotated[
@@ -156,62 +352,185 @@ def sma_crossover(
         ),
     ] = 0,
     previous_state: Annotated[
+        list[str] | None,
+        typer.Option(
+            help="Last state: 'neutral', 'below', or 'above' (defaults to the stored state, or 'neutral'). Repeat it once per (ticker, lookback) pair, in the order of the tickers then lookbacks, or give it once for all"
+        ),
+    ] = None,
+    cache_dir: Annotated[
+        str | None,
+        typer.Option(
+            envvar="SIGNALS_CACHE_DIR",
+            help="Directory of the on-disk OHLCV cache, only new bars are downloaded when set",
+        ),
+    ] = None,
+    state_url: Annotated[
+        str | None,
+        typer.Option(
+            envvar="SIGNALS_STATE_URL",
+            help="State store (sqlite://<path> or file://<path>) to read the previous states from and write the new ones to",
+        ),
+    ] = None,
+    exchange: Annotated[
         str | None,
-        typer.Option(help="Last state: 'neutral', 'below', or 'above'"),
-    ] = "neutral",
-) -> None:
+        typer.Option(
+            help="Trading calendar of the tickers' exchange (XPAR, XNYS or CRYPTO), to skip the non-trading days and use the last completed session instead of the trading hours"
+        ),
+    ] = None,
+) -> list[str]:
     """
-    Monitor a ticker for crossovers of its close price and close price SMA
+    Monitor tickers for crossovers of their close price and close price SMAs
     """
+    lookback_list = parse_lookbacks(lookbacks)
+    pairs = [(ticker, lookback) for ticker in tickers for lookback in lookback_list]
+    previous_states = previous_state or []
+    if len(previous_states) == 1:
+        previous_states = previous_states * len(pairs)
+    elif previous_states and len(previous_states) != len(pairs):
+        raise ValueError(
+            f"Expected 1 or {len(pairs)} previous states, got {len(previous_states)}"
+        )
 
-    ohlcv_raw = get_raw_ohlcv(ticker, lookback, timezone)
+    state_backend = get_state_backend(state_url) if state_url else None
+    state_keys = {
+        pair: get_state_key(*pair, upward_tolerance, downward_tolerance)
+        for pair in pairs
+    }
+    sma_keys = {pair: get_sma_key(*pair) for pair in pairs}
+    # All the states and SMA accumulators are read in one query
+    with phase(PERSIST):
+        stored = (
+            state_backend.get_many([*state_keys.values(), *sma_keys.values()])
+            if state_backend
+            else {}
+        )
+    pair_previous_states = [
+        (previous_states[i] if previous_states else stored.get(state_keys[pair]))
+        or "neutral"
+        for i, pair in enumerate(pairs)
+    ]
 
-    latest_price, latest_price_sma, latest_date = get_latest_price_and_sma(
-        ohlcv_raw,
-        lookback,
-        trading_hours_open,
-        trading_hours_close,
-        timezone,
-    )
-    logger.info(
-        f"latest_price = {latest_price}, latest_price_sma = {latest_price_sma}, latest_close = {latest_date}"
-    )
+    last_session = None
+    if exchange:
+        calendar = get_calendar(exchange)
+        now = get_now(tz=ZoneInfo(timezone))
+        if not calendar.is_trading_day(now):
+            # No session today, hence no new bar: no download, no message, states unchanged
+            logger.info(f"{now.date()} isn't a {exchange} trading day, skipping")
+            if state_backend:
+                state_backend.close()
+            for state in pair_previous_states:
+                print(state)
+            return pair_previous_states
+        last_session = calendar.last_completed_session(now)
 
-    state = update_state(
-        latest_price,
-        latest_price_sma,
-        upward_tolerance,
-        downward_tolerance,
-        previous_state,
-    )
+    sma_accumulators = None
+    if state_backend:
+        sma_accumulators = {
+            pair: SmaAccumulator.from_json(stored[sma_keys[pair]])
+            if sma_keys[pair] in stored
+            else SmaAccumulator(pair[1])
+            for pair in pairs
+        }
 
-    did_signal_change = state != previous_state
-    price_sma_diff = (latest_price / latest_price_sma - 1) * 100
-    logger.info(
-        f"previous_state = {previous_state}, state = {state}, did_signal_change = {did_signal_change}, price_sma_diff = {price_sma_diff}"
-    )
+    # Each ticker's history is fetched once, for its longest lookback
+    with phase(FETCH):
+        ohlcv_by_ticker, fetch_errors = get_raw_ohlcv_by_ticker(
+            tickers, max(lookback_list), timezone, cache_dir
+        )
 
-    # Sending the message
-    if did_signal_change:
-        message_emoji = "🚨"
-        message_state_change = f"State changed from {previous_state} to {state}."
-    else:
-        message_emoji = "🟰"
-        message_state_change = f"State remains {state}."
-    message = (
-        message_emoji
-        + f"[{ticker}, SMA{lookback} crossover, {upward_tolerance}/{downward_tolerance}%]\n"
-        + message_state_change
-        + "\n"
-        + f"{latest_date}: Price = {round(latest_price, 2)}, SMA{lookback} = {round(latest_price_sma, 2)}, {round(price_sma_diff, 2)}% difference."
-    )
+    with phase(COMPUTE):
+        latest = get_latest_prices_and_smas(
+            ohlcv_by_ticker,
+            lookback_list,
+            trading_hours_open,
+            trading_hours_close,
+            timezone,
+            sma_accumulators,
+            last_session,
+        )
+
+    states = []
+    messages = []
+    succeeded_pairs = []
+    for i, (ticker, lookback) in enumerate(pairs):
+        pair_previous_state = pair_previous_states[i]
+        try:
+            result = fetch_errors.get(ticker) or latest[(ticker, lookback)]
+            if isinstance(result, Exception):
+                raise result
+            latest_price, latest_price_sma, latest_date = result
+            logger.info(
+                f"{ticker} SMA{lookback}: latest_price = {latest_price}, latest_price_sma = {latest_price_sma}, latest_close = {latest_date}"
+            )
+
+            state = update_state(
+                latest_price,
+                latest_price_sma,
+                upward_tolerance,
+                downward_tolerance,
+                pair_previous_state,
+            )
+            messages.append(
+                format_message(
+                    ticker,
+                    lookback,
+                    upward_tolerance,
+                    downward_tolerance,
+                    pair_previous_state,
+                    state,
+                    latest_price,
+                    latest_price_sma,
+                    latest_date,
+                )
+            )
+            succeeded_pairs.append((ticker, lookback, state))
+        except Exception as e:
+            # The pair keeps its previous state so that the next run retries it
+            logger.error(f"{ticker} SMA{lookback}: {e}")
+            messages.append(f"⚠️[{ticker}, SMA{lookback} crossover]: error — {e}")
+            state = pair_previous_state
+        states.append(state)
+
+    # All the state transitions are sent together
+    message = "\n\n".join(messages)
     chat_id = os.getenv("TELEGRAM_CHAT_ID")
     if not chat_id:
         raise ValueError("Missing TELEGRAM_CHAT_ID env var")
     telegram_bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
     if not telegram_bot_token:
         raise ValueError("Missing TELEGRAM_BOT_TOKEN env var")
-    send_message(chat_id=chat_id, message=message, token=telegram_bot_token)
+    # A state change is urgent: it isn't held back when the signals are sent as a digest
+    did_any_signal_change = any(
+        state != previous for state, previous in zip(states, pair_previous_states)
+    )
+    with phase(SIGNAL):
+        send_message(
+            chat_id=chat_id,
+            message=message,
+            token=telegram_bot_token,
+            urgent=did_any_signal_change,
+        )
+
+    if state_backend:
+        with phase(PERSIST):
+            for ticker, lookback, state in succeeded_pairs:
+                # The accumulator is derived data, the last writer wins
+                state_backend.set(
+                    sma_keys[(ticker, lookback)],
+                    sma_accumulators[(ticker, lookback)].to_json(),
+                )
+                state_key = state_keys[(ticker, lookback)]
+                if not state_backend.compare_and_set(
+                    state_key, stored.get(state_key), state
+                ):
+                    logger.warning(
+                        f"{state_key} was updated by another run, not overwriting it with {state}"
+                    )
+        state_backend.close()
 
-    # Print state to stdout so it can be captured in bash which is needed for the GitHub workflows
-    print(state)
+    # Print the states to stdout, one per (ticker, lookback) pair in the order of the arguments,
+    # so they can be captured in bash which is needed for the GitHub workflows
+    for state in states:
+        print(state)
+    return states
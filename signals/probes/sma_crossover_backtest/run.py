@@ -0,0 +1,241 @@
+import logging
+from datetime import date, timedelta
+
+import numpy as np
+import polars as pl
+import typer
+from probes.sma_crossover.run import download_ohlcv
+from typing_extensions import Annotated
+from utils.cache_utils import get_cached_ohlcv
+from utils.clock_utils import get_now
+from utils.metrics_utils import COMPUTE, FETCH, phase
+
+logging.basicConfig(
+    format="%(asctime)s %(levelname)-8s %(message)s",
+    level=logging.INFO,
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+STATE_CODES = {"neutral": 0, "above": 1, "below": -1}
+STATE_NAMES = {code: state for state, code in STATE_CODES.items()}
+
+# Number of tolerance pairs evaluated at once, bounding memory to a few
+# (CHUNK_SIZE x number of bars) arrays
+CHUNK_SIZE = 256
+
+
+def parse_grid(spec: str) -> list[float]:
+    """
+    Parse comma-separated values and inclusive start:stop:step ranges, e.g. "0,0.5,1:5:1".
+    """
+    values = []
+    for part in spec.split(","):
+        if ":" in part:
+            start, stop, step = (float(x) for x in part.split(":"))
+            n_steps = int(round((stop - start) / step))
+            values.extend(start + i * step for i in range(n_steps + 1))
+        else:
+            values.append(float(part))
+    return sorted(set(round(v, 10) for v in values))
+
+
+def backtest_states(
+    close: np.ndarray,
+    sma: np.ndarray,
+    upward_tolerances: np.ndarray,
+    downward_tolerances: np.ndarray,
+    previous_state: str = "neutral",
+) -> np.ndarray:
+    """
+    Replay update_state over all bars for each (upward, downward) tolerance pair at once.
+    Returns the state codes (see STATE_CODES) as a (number of pairs, number of bars) array.
+
+    Outside of the neutral state, the state is simply the last band crossed: above once the
+    price exceeds the upper band, below once it reaches the lower band. So it's a forward fill
+    of the band crossings, starting from the first crossing when the initial state is neutral.
+    """
+    if (upward_tolerances < 0).any() or (downward_tolerances < 0).any():
+        # Negative tolerances make the bands overlap, the state then isn't a forward fill
+        raise ValueError("Tolerances must be non-negative to be backtested")
+
+    upper = sma * (1 + upward_tolerances[:, None] / 100)
+    lower = sma * (1 - downward_tolerances[:, None] / 100)
+    crosses_upper = close > upper
+    # From "above", the price must strictly stay over the lower band not to turn "below"
+    crossings = np.where(crosses_upper, 1, np.where(close > lower, 0, -1)).astype(
+        np.int8
+    )
+
+    n_bars = close.shape[0]
+    bar_index = np.arange(n_bars)
+    crossing_index = np.where(crossings != 0, bar_index, -1)
+    if previous_state in (None, "neutral"):
+        # Leaving the neutral state requires strictly crossing either band
+        leaves_neutral = crosses_upper | (close < lower)
+        first_exit = np.where(
+            leaves_neutral.any(axis=1), leaves_neutral.argmax(axis=1), n_bars
+        )
+        crossing_index[bar_index < first_exit[:, None]] = -1
+    elif previous_state not in STATE_CODES:
+        raise ValueError(f"Invalid previous_state: {previous_state}")
+
+    last_crossing = np.maximum.accumulate(crossing_index, axis=1)
+    states = np.take_along_axis(crossings, np.maximum(last_crossing, 0), axis=1)
+    return np.where(
+        last_crossing >= 0, states, STATE_CODES[previous_state or "neutral"]
+    ).astype(np.int8)
+
+
+def backtest_sma_crossover(
+    ohlcv: pl.DataFrame,
+    lookbacks: list[int],
+    upward_tolerances: list[float],
+    downward_tolerances: list[float],
+    previous_state: str = "neutral",
+) -> pl.DataFrame:
+    """
+    Backtest every (lookback, upward_tolerance, downward_tolerance) combination over <ohlcv>.
+    Returns one row per combination with its signals (state changes) and final state.
+    """
+    ohlcv = (
+        ohlcv.select([pl.col("Date").cast(pl.Date), "Close"])
+        .drop_nulls()
+        .sort("Date")
+        .with_columns(
+            [
+                pl.col("Close").rolling_mean(window_size=lookback).alias(str(lookback))
+                for lookback in lookbacks
+            ]
+        )
+    )
+    tolerance_pairs = np.array(
+        [(up, down) for up in upward_tolerances for down in downward_tolerances],
+        dtype=np.float64,
+    ).reshape(-1, 2)
+
+    rows = []
+    for lookback in lookbacks:
+        # Bars before the SMA's first complete window aren't tradable
+        window = ohlcv.filter(pl.col(str(lookback)).is_not_null())
+        dates = window["Date"].to_numpy()
+        close = window["Close"].to_numpy()
+        sma = window[str(lookback)].to_numpy()
+        for chunk_start in range(0, len(tolerance_pairs), CHUNK_SIZE):
+            chunk = tolerance_pairs[chunk_start : chunk_start + CHUNK_SIZE]
+            states = backtest_states(
+                close, sma, chunk[:, 0], chunk[:, 1], previous_state
+            )
+            previous = np.concatenate(
+                [
+                    np.full((len(chunk), 1), STATE_CODES[previous_state or "neutral"]),
+                    states[:, :-1],
+                ],
+                axis=1,
+            )
+            changes = states != previous
+            for (up, down), row_changes, row_states in zip(chunk, changes, states):
+                rows.append(
+                    {
+                        "lookback": lookback,
+                        "upward_tolerance": up,
+                        "downward_tolerance": down,
+                        "signal_count": int(row_changes.sum()),
+                        "signal_dates": dates[row_changes].tolist(),
+                        "final_state": STATE_NAMES[int(row_states[-1])]
+                        if len(row_states)
+                        else previous_state,
+                    }
+                )
+    return pl.DataFrame(
+        rows,
+        schema={
+            "lookback": pl.Int64,
+            "upward_tolerance": pl.Float64,
+            "downward_tolerance": pl.Float64,
+            "signal_count": pl.Int64,
+            "signal_dates": pl.List(pl.Date),
+            "final_state": pl.String,
+        },
+    )
+
+
+def sma_crossover_backtest(
+    ticker: Annotated[str, typer.Argument(help="Yahoo Finance ticker to backtest")],
+    lookbacks: Annotated[
+        str,
+        typer.Argument(
+            help="SMA lookback windows (in days), comma-separated values or start:stop:step ranges"
+        ),
+    ],
+    upward_tolerances: Annotated[
+        str,
+        typer.Option(
+            help="Upward tolerances (in %), comma-separated values or start:stop:step ranges"
+        ),
+    ] = "0",
+    downward_tolerances: Annotated[
+        str,
+        typer.Option(
+            help="Downward tolerances (in %), comma-separated values or start:stop:step ranges"
+        ),
+    ] = "0",
+    start: Annotated[
+        str | None,
+        typer.Option(
+            help="First date of the history (YYYY-MM-DD), 20 years ago by default"
+        ),
+    ] = None,
+    previous_state: Annotated[
+        str,
+        typer.Option(help="State before the first bar: 'neutral', 'below', or 'above'"),
+    ] = "neutral",
+    output: Annotated[
+        str | None,
+        typer.Option(help="Parquet file to write the signals of every combination to"),
+    ] = None,
+    cache_dir: Annotated[
+        str | None,
+        typer.Option(
+            envvar="SIGNALS_CACHE_DIR",
+            help="Directory of the on-disk OHLCV cache, only new bars are downloaded when set",
+        ),
+    ] = None,
+) -> pl.DataFrame:
+    """
+    Backtest sma_crossover over a ticker's history for a grid of lookbacks and tolerances
+    """
+    start_date = (
+        date.fromisoformat(start)
+        if start
+        else (get_now() - timedelta(days=365 * 20)).date()
+    )
+    with phase(FETCH):
+        if cache_dir:
+            ohlcv = get_cached_ohlcv(ticker, start_date, download_ohlcv, cache_dir)
+        else:
+            ohlcv = download_ohlcv(ticker, start_date)
+
+    lookback_values = [int(v) for v in parse_grid(lookbacks)]
+    upward_values = parse_grid(upward_tolerances)
+    downward_values = parse_grid(downward_tolerances)
+    logger.info(
+        f"Backtesting {len(lookback_values) * len(upward_values) * len(downward_values)} "
+        f"combination(s) over {ohlcv.height} bars of {ticker}"
+    )
+
+    with phase(COMPUTE):
+        results = backtest_sma_crossover(
+            ohlcv, lookback_values, upward_values, downward_values, previous_state
+        )
+    if output:
+        results.write_parquet(output)
+        logger.info(f"Signals written to {output}")
+
+    with pl.Config(tbl_rows=20):
+        print(
+            results.select(pl.exclude("signal_dates")).sort(
+                "signal_count", descending=True
+            )
+        )
+    return results
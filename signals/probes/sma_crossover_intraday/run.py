@@ -0,0 +1,319 @@
+import logging
+import os
+import time
+from datetime import date
+from zoneinfo import ZoneInfo
+
+import typer
+from probes.sma_crossover.run import (
+    format_message,
+    get_is_market_open,
+    get_latest_prices_and_smas,
+    get_raw_ohlcv_by_ticker,
+    get_sma_key,
+    get_state_key,
+    parse_lookbacks,
+    update_state,
+)
+from typing_extensions import Annotated
+from utils.calendar_utils import get_calendar
+from utils.clock_utils import get_now
+from utils.market_data_utils import get_market_data_provider
+from utils.metrics_utils import COMPUTE, FETCH, PERSIST, SIGNAL, count, phase
+from utils.signal_utils import send_message
+from utils.sma_utils import SmaAccumulator
+from utils.state_utils import get_state_backend
+
+logging.basicConfig(
+    format="%(asctime)s %(levelname)-8s %(message)s",
+    level=logging.INFO,
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+def get_daily_smas(
+    tickers,
+    lookbacks,
+    trading_hours_open,
+    trading_hours_close,
+    timezone,
+    cache_dir=None,
+    stored_accumulators: dict[tuple[str, int], SmaAccumulator] | None = None,
+    last_session: date | None = None,
+) -> dict[tuple[str, int], float | Exception]:
+    """
+    Return the SMA of each (ticker, lookback) pair over the completed sessions, or the exception that prevented computing it.
+    The SMAs kept by sma_crossover in the state store are reused when they're up to date with <last_session>,
+    the history is only fetched for the tickers missing one.
+    """
+    stored_accumulators = stored_accumulators or {}
+    smas = {}
+    for (ticker, lookback), accumulator in stored_accumulators.items():
+        if (
+            last_session is not None
+            and accumulator.last_date == last_session
+            and accumulator.sma is not None
+        ):
+            smas[(ticker, lookback)] = accumulator.sma
+    missing_tickers = [
+        ticker
+        for ticker in tickers
+        if any((ticker, lookback) not in smas for lookback in lookbacks)
+    ]
+    if not missing_tickers:
+        return smas
+    logger.info(f"Computing the daily SMAs of {', '.join(missing_tickers)}")
+
+    with phase(FETCH):
+        ohlcv_by_ticker, fetch_errors = get_raw_ohlcv_by_ticker(
+            missing_tickers, max(lookbacks), timezone, cache_dir
+        )
+    for ticker, e in fetch_errors.items():
+        for lookback in lookbacks:
+            smas[(ticker, lookback)] = e
+    with phase(COMPUTE):
+        latest = get_latest_prices_and_smas(
+            ohlcv_by_ticker,
+            lookbacks,
+            trading_hours_open,
+            trading_hours_close,
+            timezone,
+            last_session=last_session,
+        )
+    for pair, result in latest.items():
+        smas.setdefault(pair, result if isinstance(result, Exception) else result[1])
+    return smas
+
+
+def evaluate_tick(
+    prices: dict[str, float],
+    smas: dict[tuple[str, int], float],
+    states: dict[tuple[str, int], str],
+    upward_tolerance: float,
+    downward_tolerance: float,
+) -> dict[tuple[str, int], str]:
+    """
+    Return the new state of each (ticker, lookback) pair whose live price in <prices> crosses
+    a tolerance band of its daily SMA, given the current <states>.
+    """
+    changes = {}
+    for (ticker, lookback), sma in smas.items():
+        if ticker not in prices:
+            continue
+        state = update_state(
+            prices[ticker],
+            sma,
+            upward_tolerance,
+            downward_tolerance,
+            states[(ticker, lookback)],
+        )
+        if state != states[(ticker, lookback)]:
+            changes[(ticker, lookback)] = state
+    return changes
+
+
+def sma_crossover_intraday(
+    tickers: Annotated[
+        list[str], typer.Argument(help="Yahoo Finance tickers to probe")
+    ],
+    lookbacks: Annotated[
+        str,
+        typer.Argument(
+            help="Comma-separated lookback windows (in days) over which the daily SMAs are computed (e.g., 50,200)"
+        ),
+    ],
+    trading_hours_open: Annotated[
+        str,
+        typer.Argument(
+            help="Opening hour of the tickers' exchange (HH:MM, ISO 8601, local time)"
+        ),
+    ],
+    trading_hours_close: Annotated[
+        str,
+        typer.Argument(
+            help="Closing hour of the tickers' exchange (HH:MM, ISO 8601, local time)"
+        ),
+    ],
+    timezone: Annotated[
+        str,
+        typer.Argument(
+            help="Timezone of the tickers' exchange (e.g., America/New_York)"
+        ),
+    ],
+    upward_tolerance: Annotated[
+        float,
+        typer.Option(
+            help="Starting from a 'neutral', or 'below' state, the price must exceed 100 + <upward_tolerance>% of the SMA to trigger a signal"
+        ),
+    ] = 0,
+    downward_tolerance: Annotated[
+        float,
+        typer.Option(
+            help="Starting from a 'neutral', or 'above' state, the price must fall below 100 - <downward_tolerance>% of the SMA to trigger a signal"
+        ),
+    ] = 0,
+    poll_interval: Annotated[
+        float,
+        typer.Option(help="Seconds between two polls of the live prices"),
+    ] = 60,
+    max_polls: Annotated[
+        int | None,
+        typer.Option(
+            help="Number of polls after which to stop (e.g., 1 when run every minute by a scheduler), polls until the market closes otherwise"
+        ),
+    ] = None,
+    cache_dir: Annotated[
+        str | None,
+        typer.Option(
+            envvar="SIGNALS_CACHE_DIR",
+            help="Directory of the on-disk OHLCV cache, only new bars are downloaded when set",
+        ),
+    ] = None,
+    state_url: Annotated[
+        str | None,
+        typer.Option(
+            envvar="SIGNALS_STATE_URL",
+            help="State store (sqlite://<path> or file://<path>) shared with sma_crossover, to read the previous states and daily SMAs from and write the new states to",
+        ),
+    ] = None,
+    exchange: Annotated[
+        str | None,
+        typer.Option(
+            help="Trading calendar of the tickers' exchange (XPAR, XNYS or CRYPTO), to tell whether it's open instead of the trading hours and reuse the stored daily SMAs"
+        ),
+    ] = None,
+) -> list[str]:
+    """
+    Monitor tickers for crossovers of their live price and daily close price SMAs while the market is open
+    """
+    chat_id = os.getenv("TELEGRAM_CHAT_ID")
+    if not chat_id:
+        raise ValueError("Missing TELEGRAM_CHAT_ID env var")
+    telegram_bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
+    if not telegram_bot_token:
+        raise ValueError("Missing TELEGRAM_BOT_TOKEN env var")
+
+    lookback_list = parse_lookbacks(lookbacks)
+    pairs = [(ticker, lookback) for ticker in tickers for lookback in lookback_list]
+    calendar = get_calendar(exchange) if exchange else None
+
+    def is_market_open() -> bool:
+        if calendar:
+            return calendar.is_open(get_now(tz=ZoneInfo(timezone)))
+        return get_is_market_open(trading_hours_open, trading_hours_close, timezone)
+
+    state_backend = get_state_backend(state_url) if state_url else None
+    # The states are shared with sma_crossover: a crossover signaled intraday isn't signaled again at the close
+    state_keys = {
+        pair: get_state_key(*pair, upward_tolerance, downward_tolerance)
+        for pair in pairs
+    }
+    sma_keys = {pair: get_sma_key(*pair) for pair in pairs}
+    with phase(PERSIST):
+        stored = (
+            state_backend.get_many([*state_keys.values(), *sma_keys.values()])
+            if state_backend
+            else {}
+        )
+    states = {pair: stored.get(state_keys[pair]) or "neutral" for pair in pairs}
+
+    if not is_market_open():
+        logger.info("Market is closed, nothing to poll")
+    else:
+        # The daily SMAs are computed once, each tick is then only compared with them
+        smas = get_daily_smas(
+            tickers,
+            lookback_list,
+            trading_hours_open,
+            trading_hours_close,
+            timezone,
+            cache_dir,
+            {
+                pair: SmaAccumulator.from_json(stored[sma_keys[pair]])
+                for pair in pairs
+                if sma_keys[pair] in stored
+            },
+            calendar.last_completed_session(get_now(tz=ZoneInfo(timezone)))
+            if calendar
+            else None,
+        )
+        for (ticker, lookback), sma in smas.items():
+            if isinstance(sma, Exception):
+                logger.error(f"{ticker} SMA{lookback}: {sma}")
+        smas = {
+            pair: sma for pair, sma in smas.items() if not isinstance(sma, Exception)
+        }
+        provider = get_market_data_provider()
+
+        polls = 0
+        while smas and (max_polls is None or polls < max_polls):
+            start = time.monotonic()
+            try:
+                with phase(FETCH):
+                    prices = provider.get_latest_prices(tickers)
+            except Exception as e:
+                # A failed poll is retried at the next one, by a trial call if the host's circuit opened
+                logger.error(f"Failed to poll the live prices: {e}")
+                prices = {}
+            count("ticks", len(prices))
+
+            with phase(COMPUTE):
+                changes = evaluate_tick(
+                    prices, smas, states, upward_tolerance, downward_tolerance
+                )
+            if changes:
+                tick_time = get_now(tz=ZoneInfo(timezone)).strftime("%Y-%m-%d %H:%M")
+                message = "\n\n".join(
+                    format_message(
+                        ticker,
+                        lookback,
+                        upward_tolerance,
+                        downward_tolerance,
+                        states[(ticker, lookback)],
+                        state,
+                        prices[ticker],
+                        smas[(ticker, lookback)],
+                        tick_time,
+                    )
+                    for (ticker, lookback), state in changes.items()
+                )
+                with phase(SIGNAL):
+                    send_message(
+                        chat_id=chat_id,
+                        message=message,
+                        token=telegram_bot_token,
+                        urgent=True,
+                    )
+                if state_backend:
+                    with phase(PERSIST):
+                        for pair, state in changes.items():
+                            key = state_keys[pair]
+                            if state_backend.compare_and_set(
+                                key, stored.get(key), state
+                            ):
+                                stored[key] = state
+                                continue
+                            # The state another run wrote is the one to carry on from
+                            stored[key] = state_backend.get(key)
+                            changes[pair] = stored[key] or "neutral"
+                            logger.warning(
+                                f"{key} was updated by another run to {changes[pair]}, not overwriting it with {state}"
+                            )
+                states.update(changes)
+
+            polls += 1
+            if max_polls is not None and polls >= max_polls:
+                break
+            time.sleep(max(poll_interval - (time.monotonic() - start), 0))
+            if not is_market_open():
+                logger.info("Market closed, stopping")
+                break
+
+    if state_backend:
+        state_backend.close()
+
+    # Print the states to stdout, one per (ticker, lookback) pair in the order of the arguments
+    for pair in pairs:
+        print(states[pair])
+    return [states[pair] for pair in pairs]
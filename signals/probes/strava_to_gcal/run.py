@@ -1,13 +1,20 @@
 import json
 import logging
 import os
+from collections.abc import Iterator
 from datetime import datetime, timedelta
 
+import httplib2
 import requests
 import typer
 from google.oauth2.service_account import Credentials
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from typing_extensions import Annotated
+from utils.metrics_utils import FETCH, PERSIST, SIGNAL, count, phase
+from utils.resilience_utils import get_host_policy, resilient_call
+from utils.state_utils import get_state_backend
 
 logging.basicConfig(
     format="%(asctime)s %(levelname)-8s %(message)s",
@@ -16,9 +23,24 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+STRAVA_HOST = "www.strava.com"
 STRAVA_TOKEN_URL = "https://www.strava.com/oauth/token"
 STRAVA_ACTIVITIES_URL = "https://www.strava.com/api/v3/athlete/activities"
+# Activities per page when listing them (Strava allows up to 200)
+STRAVA_PAGE_SIZE = 30
+GCAL_HOST = "www.googleapis.com"
 GCAL_SCOPES = ["https://www.googleapis.com/auth/calendar.events"]
+# Requests per Calendar API batch, as recommended by Google (the hard limit is 1000)
+GCAL_BATCH_SIZE = 50
+LAST_ACTIVITY_ID_KEY = "strava_to_gcal:last_activity_id"
+REFRESH_TOKEN_KEY = "strava_to_gcal:refresh_token"
+
+
+def checked(response: requests.Response) -> requests.Response:
+    """Count the response's bytes and raise on an error status."""
+    count("bytes_downloaded", len(response.content))
+    response.raise_for_status()
+    return response
 
 
 def refresh_strava_token(
@@ -29,35 +51,84 @@ def refresh_strava_token(
     Returns (access_token, refresh_token). The refresh token may be unchanged
     or rotated; callers should always persist the returned value.
     """
-    response = requests.post(
-        STRAVA_TOKEN_URL,
-        data={
-            "client_id": client_id,
-            "client_secret": client_secret,
-            "grant_type": "refresh_token",
-            "refresh_token": refresh_token,
-        },
+    response = resilient_call(
+        STRAVA_HOST,
+        lambda: checked(
+            requests.post(
+                STRAVA_TOKEN_URL,
+                data={
+                    "client_id": client_id,
+                    "client_secret": client_secret,
+                    "grant_type": "refresh_token",
+                    "refresh_token": refresh_token,
+                },
+                timeout=get_host_policy(STRAVA_HOST).timeout_s,
+            )
+        ),
     )
-    response.raise_for_status()
     data = response.json()
     return data["access_token"], data["refresh_token"]
 
 
-def get_new_runs(access_token: str, last_activity_id: int) -> list[dict]:
-    """Return Strava runs recorded after last_activity_id, oldest first."""
-    response = requests.get(
-        STRAVA_ACTIVITIES_URL,
-        headers={"Authorization": f"Bearer {access_token}"},
-        params={"per_page": 30},
-    )
-    response.raise_for_status()
-    activities = response.json()
-    runs = [
-        a
-        for a in activities
-        if a["sport_type"] == "Run" and a["id"] > last_activity_id
-    ]
-    return sorted(runs, key=lambda a: a["id"])
+def iter_activity_pages(
+    access_token: str, after: int | None = None, per_page: int = STRAVA_PAGE_SIZE
+) -> Iterator[list[dict]]:
+    """Yield the athlete's activities one page at a time, fetching a page only when needed.
+
+    Pages come newest first, unless <after> (Unix timestamp) is given: Strava then only
+    lists the activities started after it, oldest first.
+    """
+    page = 1
+    while True:
+        params = {"per_page": per_page, "page": page}
+        if after is not None:
+            params["after"] = after
+        response = resilient_call(
+            STRAVA_HOST,
+            lambda: checked(
+                requests.get(
+                    STRAVA_ACTIVITIES_URL,
+                    headers={"Authorization": f"Bearer {access_token}"},
+                    params=params,
+                    timeout=get_host_policy(STRAVA_HOST).timeout_s,
+                )
+            ),
+        )
+        activities = response.json()
+        if activities:
+            yield activities
+        if len(activities) < per_page:
+            return
+        page += 1
+
+
+def _new_runs(activities: list[dict], last_activity_id: int) -> list[dict]:
+    return [a for a in activities if a["sport_type"] == "Run" and a["id"] > last_activity_id]
+
+
+def iter_new_runs(
+    access_token: str, last_activity_id: int, after: int | None = None
+) -> Iterator[list[dict]]:
+    """Yield the Strava runs recorded after last_activity_id, oldest first.
+
+    By default, the recent activities are listed newest first down to the page holding an
+    already processed one, or only the most recent page when none was processed, and the
+    runs are yielded once listed. Given <after> (Unix timestamp), all the activities started
+    after it are walked instead, oldest first, and the runs yielded one page at a time.
+    """
+    if after is not None:
+        for activities in iter_activity_pages(access_token, after, STRAVA_PAGE_SIZE):
+            if runs := _new_runs(activities, last_activity_id):
+                yield sorted(runs, key=lambda a: a["id"])
+        return
+
+    new_runs = []
+    for activities in iter_activity_pages(access_token, per_page=STRAVA_PAGE_SIZE):
+        new_runs.extend(_new_runs(activities, last_activity_id))
+        if not last_activity_id or any(a["id"] <= last_activity_id for a in activities):
+            break
+    if new_runs:
+        yield sorted(new_runs, key=lambda a: a["id"])
 
 
 def format_description(distance_m: float, moving_time_s: int) -> str:
@@ -80,39 +151,91 @@ def build_gcal_service(service_account_json: str):
     credentials = Credentials.from_service_account_info(
         json.loads(service_account_json), scopes=GCAL_SCOPES
     )
-    return build("calendar", "v3", credentials=credentials)
+    http = AuthorizedHttp(
+        credentials, http=httplib2.Http(timeout=get_host_policy(GCAL_HOST).timeout_s)
+    )
+    return build("calendar", "v3", http=http)
 
 
-def create_gcal_event(service, calendar_id: str, activity: dict) -> None:
-    """Create a Google Calendar event for a Strava run activity."""
+def build_gcal_event(activity: dict) -> dict:
+    """Build the Google Calendar event of a Strava run activity."""
     # start_date_local carries the Z suffix but represents local time — treat as naive
     start_dt = datetime.fromisoformat(activity["start_date_local"].replace("Z", ""))
     end_dt = start_dt + timedelta(seconds=activity["elapsed_time"])
     timezone_str = activity.get("timezone", "UTC").split(" ")[-1]
 
-    event = {
+    return {
+        # Deterministic (base32hex) ID so that re-inserting an activity's event is a no-op
+        "id": f"strava{activity['id']}",
         "summary": "Endu",
         "description": format_description(activity["distance"], activity["moving_time"]),
         "start": {"dateTime": start_dt.isoformat(), "timeZone": timezone_str},
         "end": {"dateTime": end_dt.isoformat(), "timeZone": timezone_str},
     }
-    service.events().insert(calendarId=calendar_id, body=event).execute()
-    logger.info(
-        f"Created GCal event for activity {activity['id']} "
-        f"({activity['distance'] / 1000:.2f} km on {start_dt.date()})"
-    )
+
+
+def create_gcal_events(service, calendar_id: str, activities: list[dict]) -> set[int]:
+    """Create the Google Calendar events of Strava run activities with batch requests.
+
+    Returns the IDs of the activities whose event exists, i.e. was created by this call or
+    a previous one. Failures are logged and left out so that they can be retried.
+    """
+    created_ids = set()
+
+    def on_response(request_id: str, response: dict, exception: Exception | None):
+        activity_id = int(request_id)
+        if exception is None or _is_duplicate_event(exception):
+            created_ids.add(activity_id)
+            logger.info(f"Created GCal event for activity {activity_id}")
+        else:
+            logger.error(
+                f"Failed to create GCal event for activity {activity_id}: {exception}"
+            )
+
+    for i in range(0, len(activities), GCAL_BATCH_SIZE):
+        batch = service.new_batch_http_request(callback=on_response)
+        for activity in activities[i : i + GCAL_BATCH_SIZE]:
+            batch.add(
+                service.events().insert(
+                    calendarId=calendar_id, body=build_gcal_event(activity)
+                ),
+                request_id=str(activity["id"]),
+            )
+        # Event IDs are deterministic: retrying a batch only re-inserts duplicates
+        resilient_call(GCAL_HOST, batch.execute)
+    return created_ids
+
+
+def _is_duplicate_event(exception: Exception) -> bool:
+    # The event ID is already taken: the event was created by a previous run
+    return isinstance(exception, HttpError) and exception.resp.status == 409
 
 
 def strava_to_gcal(
     last_activity_id: Annotated[
         int,
-        typer.Argument(help="Last processed Strava activity ID (0 to process all recent)"),
+        typer.Argument(
+            help="Last processed Strava activity ID (0 to process the most recent page of activities)"
+        ),
     ],
     calendar_id: Annotated[
         str,
         typer.Argument(help="Google Calendar ID to create events in"),
     ],
-) -> None:
+    after: Annotated[
+        int | None,
+        typer.Option(
+            help="Walk all the activities started after this Unix timestamp (by default, the recent ones are listed down to the last processed activity)"
+        ),
+    ] = None,
+    state_url: Annotated[
+        str | None,
+        typer.Option(
+            envvar="SIGNALS_STATE_URL",
+            help="State store (sqlite://<path> or file://<path>) keeping the last processed activity ID and the refresh token",
+        ),
+    ] = None,
+) -> int:
     """
     Probe Strava for new runs and create a Google Calendar event for each one
     """
@@ -121,26 +244,73 @@ def strava_to_gcal(
     refresh_token = os.getenv("STRAVA_REFRESH_TOKEN")
     service_account_json = os.getenv("GOOGLE_SERVICE_ACCOUNT_JSON")
 
+    state_backend = get_state_backend(state_url) if state_url else None
+    with phase(PERSIST):
+        stored = (
+            state_backend.get_many([LAST_ACTIVITY_ID_KEY, REFRESH_TOKEN_KEY])
+            if state_backend
+            else {}
+        )
+    # The stored values are the latest ones: the token may have been rotated since the
+    # env var was set, and activity IDs only grow
+    refresh_token = stored.get(REFRESH_TOKEN_KEY, refresh_token)
+    if LAST_ACTIVITY_ID_KEY in stored:
+        last_activity_id = max(last_activity_id, int(stored[LAST_ACTIVITY_ID_KEY]))
+
     if not all([client_id, client_secret, refresh_token, service_account_json]):
         raise ValueError("Missing one or more required environment variables")
 
-    access_token, new_refresh_token = refresh_strava_token(
-        client_id, client_secret, refresh_token
-    )
+    with phase(FETCH):
+        access_token, new_refresh_token = refresh_strava_token(
+            client_id, client_secret, refresh_token
+        )
     logger.info("Strava token refreshed")
+    if state_backend:
+        # Persisted right away since Strava may have invalidated the previous token
+        with phase(PERSIST):
+            state_backend.set(REFRESH_TOKEN_KEY, new_refresh_token)
 
-    new_runs = get_new_runs(access_token, last_activity_id)
-    logger.info(f"Found {len(new_runs)} new run(s) since activity ID {last_activity_id}")
-
-    if new_runs:
-        gcal_service = build_gcal_service(service_account_json)
+    new_last_activity_id = last_activity_id
+    gcal_service = None
+    failed = False
+    runs_count = 0
+    pages = iter_new_runs(access_token, last_activity_id, after)
+    while not failed:
+        with phase(FETCH):
+            new_runs = next(pages, None)
+        if new_runs is None:
+            break
+        runs_count += len(new_runs)
+        # The calendar events are this probe's signals
+        with phase(SIGNAL):
+            if gcal_service is None:
+                gcal_service = build_gcal_service(service_account_json)
+            created_ids = create_gcal_events(gcal_service, calendar_id, new_runs)
+        # Only advance up to the first failure so that it's retried by the next run
         for run in new_runs:
-            create_gcal_event(gcal_service, calendar_id, run)
+            if run["id"] not in created_ids:
+                failed = True
+                break
+            new_last_activity_id = run["id"]
+    logger.info(
+        f"Processed {runs_count} new run(s) since activity ID {last_activity_id}"
+    )
 
-    new_last_activity_id = new_runs[-1]["id"] if new_runs else last_activity_id
+    if state_backend:
+        with phase(PERSIST):
+            if not state_backend.compare_and_set(
+                LAST_ACTIVITY_ID_KEY,
+                stored.get(LAST_ACTIVITY_ID_KEY),
+                str(new_last_activity_id),
+            ):
+                logger.warning(
+                    f"{LAST_ACTIVITY_ID_KEY} was updated by another run, keeping its value"
+                )
+        state_backend.close()
 
     # Print to stdout so the workflow can capture and persist both values
     # Line 1: (possibly rotated) Strava refresh token
     # Line 2: new last activity ID
     print(new_refresh_token)
     print(new_last_activity_id)
+    return new_last_activity_id
@@ -0,0 +1,15 @@
+import pytest
+from utils import resilience_utils
+from utils.market_data_utils import YAHOO_FINANCE_HOST
+
+# Failed downloads are retried without waiting
+FAST_POLICY = resilience_utils.HostPolicy(timeout_s=1.0, backoff_base_s=0.001)
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    """Retry the failed Yahoo Finance downloads right away, with closed circuit breakers in every test."""
+    monkeypatch.setitem(resilience_utils.HOST_POLICIES, YAHOO_FINANCE_HOST, FAST_POLICY)
+    resilience_utils.reset_circuit_breakers()
+    yield
+    resilience_utils.reset_circuit_breakers()
@@ -0,0 +1,64 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from utils.async_utils import (
+    call_probe,
+    get_host_concurrency,
+    host_slot,
+)
+
+
+class TestHostSlot:
+    """Test cases for the per-host concurrency limits."""
+
+    def test_limit_is_shared_by_threads(self, monkeypatch):
+        """Test that no more than the host's limit of calls are in flight at once."""
+        monkeypatch.setenv("SIGNALS_HOST_CONCURRENCY", "limited.test=2")
+        in_flight, max_in_flight = 0, 0
+        lock = threading.Lock()
+
+        def call():
+            nonlocal in_flight, max_in_flight
+            with host_slot("limited.test"):
+                with lock:
+                    in_flight += 1
+                    max_in_flight = max(max_in_flight, in_flight)
+                time.sleep(0.05)
+                with lock:
+                    in_flight -= 1
+
+        threads = [threading.Thread(target=call) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert max_in_flight == 2
+
+    def test_invalid_override_raises(self, monkeypatch):
+        monkeypatch.setenv("SIGNALS_HOST_CONCURRENCY", "www.strava.com=none")
+
+        with pytest.raises(ValueError, match="Invalid host concurrency"):
+            get_host_concurrency()
+
+
+class TestCallProbe:
+    """Test cases for the call_probe coroutine."""
+
+    def test_call_probe_runs_sync_and_async_probes(self):
+        def sync_probe(ticker: str) -> str:
+            return f"sync {ticker}"
+
+        async def async_probe(ticker: str) -> str:
+            await asyncio.sleep(0)
+            return f"async {ticker}"
+
+        async def main():
+            return await asyncio.gather(
+                call_probe(sync_probe, {"ticker": "CW8.PA"}),
+                call_probe(async_probe, {"ticker": "ESE.PA"}),
+            )
+
+        assert asyncio.run(main()) == ["sync CW8.PA", "async ESE.PA"]
@@ -0,0 +1,125 @@
+from datetime import date, datetime
+from unittest.mock import MagicMock, patch
+
+import polars as pl
+from utils.cache_utils import (
+    get_cache_path,
+    get_cached_ohlcv,
+    refresh_cached_ohlcv,
+    scan_cached_bars,
+)
+
+
+def make_ohlcv(start_day: int, closes: list[float]) -> pl.DataFrame:
+    return pl.DataFrame(
+        {
+            "Date": [datetime(2024, 1, start_day + i) for i in range(len(closes))],
+            "Close": closes,
+            "Volume": [1000] * len(closes),
+        }
+    )
+
+
+class TestGetCachedOhlcv:
+    """Test cases for the get_cached_ohlcv function."""
+
+    def test_cold_cache_downloads_everything(self, tmp_path):
+        """Test that an empty cache triggers a full download which is then persisted."""
+        fetch = MagicMock(return_value=make_ohlcv(1, [100.0, 101.0, 102.0]))
+
+        result = get_cached_ohlcv("CW8.PA", date(2024, 1, 1), fetch, str(tmp_path))
+
+        fetch.assert_called_once_with("CW8.PA", date(2024, 1, 1))
+        assert result["Close"].to_list() == [100.0, 101.0, 102.0]
+        assert (tmp_path / "CW8.PA.parquet").exists()
+
+    def test_warm_cache_only_downloads_from_anchor(self, tmp_path):
+        """Test that only the bars from the penultimate cached one are requested."""
+        fetch = MagicMock(return_value=make_ohlcv(1, [100.0, 101.0, 102.0]))
+        get_cached_ohlcv("CW8.PA", date(2024, 1, 1), fetch, str(tmp_path))
+
+        # The last cached bar (Jan 3rd) was intraday and got revised, Jan 4th is new
+        fetch.return_value = make_ohlcv(2, [101.0, 102.5, 103.0])
+        result = get_cached_ohlcv("CW8.PA", date(2024, 1, 1), fetch, str(tmp_path))
+
+        assert fetch.call_args.args == ("CW8.PA", date(2024, 1, 2))
+        assert result["Close"].to_list() == [100.0, 101.0, 102.5, 103.0]
+
+    def test_restatement_discards_the_cache(self, tmp_path):
+        """Test that a changed anchor close triggers a full re-download."""
+        fetch = MagicMock(return_value=make_ohlcv(1, [100.0, 101.0, 102.0]))
+        get_cached_ohlcv("CW8.PA", date(2024, 1, 1), fetch, str(tmp_path))
+
+        # A 2:1 split halves all past prices
+        restated = make_ohlcv(1, [50.0, 50.5, 51.0, 51.5])
+        fetch.side_effect = [
+            restated.filter(pl.col("Date") >= datetime(2024, 1, 2)),
+            restated,
+        ]
+        result = get_cached_ohlcv("CW8.PA", date(2024, 1, 1), fetch, str(tmp_path))
+
+        assert fetch.call_args.args == ("CW8.PA", date(2024, 1, 1))
+        assert result["Close"].to_list() == [50.0, 50.5, 51.0, 51.5]
+
+    def test_earlier_start_discards_the_cache(self, tmp_path):
+        """Test that requesting history before the cached start triggers a full download."""
+        fetch = MagicMock(return_value=make_ohlcv(5, [100.0, 101.0]))
+        get_cached_ohlcv("CW8.PA", date(2024, 1, 5), fetch, str(tmp_path))
+
+        fetch.return_value = make_ohlcv(1, [98.0, 99.0, 99.5, 99.8, 100.0, 101.0])
+        result = get_cached_ohlcv("CW8.PA", date(2024, 1, 1), fetch, str(tmp_path))
+
+        assert fetch.call_args.args == ("CW8.PA", date(2024, 1, 1))
+        assert result.height == 6
+
+
+class TestRefreshCachedOhlcv:
+    """Test cases for the refresh_cached_ohlcv function."""
+
+    def test_unchanged_bars_are_not_rewritten(self, tmp_path):
+        """Test that the cache file is left alone when no new bar arrived."""
+        fetch = MagicMock(return_value=make_ohlcv(1, [100.0, 101.0, 102.0]))
+        refresh_cached_ohlcv("CW8.PA", date(2024, 1, 1), fetch, str(tmp_path))
+
+        fetch.return_value = make_ohlcv(2, [101.0, 102.0])
+        with patch("utils.cache_utils.write_cached_ohlcv") as write_cached_ohlcv:
+            path = refresh_cached_ohlcv(
+                "CW8.PA", date(2024, 1, 1), fetch, str(tmp_path)
+            )
+
+        write_cached_ohlcv.assert_not_called()
+        assert pl.read_parquet(path)["Close"].to_list() == [100.0, 101.0, 102.0]
+
+    def test_revised_last_bar_is_rewritten(self, tmp_path):
+        """Test that a last bar cached while the market was open is replaced."""
+        fetch = MagicMock(return_value=make_ohlcv(1, [100.0, 101.0, 102.0]))
+        refresh_cached_ohlcv("CW8.PA", date(2024, 1, 1), fetch, str(tmp_path))
+
+        fetch.return_value = make_ohlcv(2, [101.0, 102.5])
+        path = refresh_cached_ohlcv("CW8.PA", date(2024, 1, 1), fetch, str(tmp_path))
+
+        assert pl.read_parquet(path)["Close"].to_list() == [100.0, 101.0, 102.5]
+
+
+class TestScanCachedBars:
+    """Test cases for the scan_cached_bars function."""
+
+    def test_only_bars_from_start_are_scanned(self, tmp_path):
+        fetch = MagicMock(return_value=make_ohlcv(1, [100.0, 101.0, 102.0]))
+        path = refresh_cached_ohlcv("CW8.PA", date(2024, 1, 1), fetch, str(tmp_path))
+
+        result = scan_cached_bars(path, date(2024, 1, 2)).collect()
+
+        assert result["Close"].to_list() == [101.0, 102.0]
+
+
+class TestGetCachePath:
+    """Test cases for the get_cache_path function."""
+
+    def test_keeps_usual_ticker_characters(self):
+        assert get_cache_path("/cache", "^990100-USD-STRD").endswith(
+            "^990100-USD-STRD.parquet"
+        )
+
+    def test_replaces_path_separators(self):
+        assert get_cache_path("/cache", "A/B") == "/cache/A_B.parquet"
@@ -0,0 +1,99 @@
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+
+import pytest
+from utils import calendar_utils
+from utils.calendar_utils import (
+    build_calendar,
+    easter_sunday,
+    get_calendar,
+    xnys_early_closes,
+    xnys_holidays,
+)
+
+NEW_YORK = ZoneInfo("America/New_York")
+PARIS = ZoneInfo("Europe/Paris")
+
+
+class TestExchangeRules:
+    """Test cases for the holiday rules."""
+
+    def test_easter_sunday(self):
+        assert easter_sunday(2024) == date(2024, 3, 31)
+        assert easter_sunday(2025) == date(2025, 4, 20)
+
+    def test_xnys_2022_observed_holidays(self):
+        holidays = xnys_holidays(2022)
+
+        # New Year's Day 2022 was a Saturday and wasn't observed
+        assert date(2021, 12, 31) not in xnys_holidays(2021)
+        assert date(2022, 6, 20) in holidays  # Juneteenth, observed
+        assert date(2022, 12, 26) in holidays  # Christmas, observed
+        assert date(2022, 11, 24) in holidays  # Thanksgiving
+
+    def test_xnys_early_closes(self):
+        assert xnys_early_closes(2024) == {
+            date(2024, 7, 3),
+            date(2024, 11, 29),
+            date(2024, 12, 24),
+        }
+
+
+class TestTradingCalendar:
+    """Test cases for the TradingCalendar class."""
+
+    @pytest.fixture(scope="class")
+    def xnys(self):
+        return build_calendar("XNYS")
+
+    def test_sessions_skip_weekends_and_holidays(self, xnys):
+        assert xnys.is_session(date(2024, 7, 5))
+        assert not xnys.is_session(date(2024, 7, 4))
+        assert not xnys.is_session(date(2024, 7, 6))
+        assert not xnys.is_trading_day(datetime(2024, 12, 25, 12, tzinfo=NEW_YORK))
+
+    def test_half_day_closes_early(self, xnys):
+        assert xnys.is_open(datetime(2024, 7, 3, 12, 59, tzinfo=NEW_YORK))
+        assert not xnys.is_open(datetime(2024, 7, 3, 13, 1, tzinfo=NEW_YORK))
+        assert xnys.is_open(datetime(2024, 7, 5, 15, 59, tzinfo=NEW_YORK))
+
+    def test_last_completed_session(self, xnys):
+        # Before the close, the last completed session is the one before the holiday
+        assert xnys.last_completed_session(
+            datetime(2024, 7, 5, 10, tzinfo=NEW_YORK)
+        ) == date(2024, 7, 3)
+        assert xnys.last_completed_session(
+            datetime(2024, 7, 5, 16, tzinfo=NEW_YORK)
+        ) == date(2024, 7, 5)
+        # Timezone-aware times of other zones are converted
+        assert xnys.last_completed_session(
+            datetime(2024, 7, 5, 21, 31, tzinfo=ZoneInfo("UTC"))
+        ) == date(2024, 7, 5)
+
+    def test_crypto_trades_every_day(self):
+        crypto = build_calendar("CRYPTO")
+
+        assert crypto.is_trading_day(datetime(2024, 12, 25, 12, tzinfo=PARIS))
+        assert crypto.last_completed_session(
+            datetime(2024, 6, 9, 1, tzinfo=ZoneInfo("UTC"))
+        ) == date(2024, 6, 8)
+
+
+class TestGetCalendar:
+    """Test cases for the get_calendar function."""
+
+    def test_cached_on_disk(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(calendar_utils, "_calendars", {})
+        built = get_calendar("XPAR", cache_dir=str(tmp_path))
+        monkeypatch.setattr(calendar_utils, "_calendars", {})
+        monkeypatch.setattr(calendar_utils, "build_calendar", None)
+
+        loaded = get_calendar("XPAR", cache_dir=str(tmp_path))
+
+        assert (loaded.sessions == built.sessions).all()
+        assert (loaded.closes == built.closes).all()
+        assert not loaded.is_session(date(2024, 4, 1))  # Easter Monday
+
+    def test_unknown_exchange_raises(self):
+        with pytest.raises(ValueError, match="Unknown exchange"):
+            get_calendar("XXXX")
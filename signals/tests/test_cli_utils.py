@@ -0,0 +1,101 @@
+import asyncio
+import os
+import subprocess
+import sys
+from unittest.mock import patch
+
+import typer
+from typer.testing import CliRunner
+from utils.cli_utils import discover_commands, load_and_register_commands
+
+SIGNALS_DIR = os.path.dirname(os.path.dirname(__file__))
+PROBES_DIR = os.path.join(SIGNALS_DIR, "probes")
+
+
+class TestDiscoverCommands:
+    """Test cases for the discover_commands function."""
+
+    def test_requires_function_named_after_directory(self, tmp_path):
+        """Test that only run.py files defining the matching function are commands."""
+        (tmp_path / "good").mkdir()
+        (tmp_path / "good" / "run.py").write_text(
+            "import missing_dep\n\ndef good(): ...\n"
+        )
+        (tmp_path / "bad").mkdir()
+        (tmp_path / "bad" / "run.py").write_text("def other(): ...\n")
+        (tmp_path / "empty").mkdir()
+
+        assert discover_commands(str(tmp_path)) == ["good"]
+
+
+class TestLoadAndRegisterCommands:
+    """Test cases for the load_and_register_commands function."""
+
+    def test_only_invoked_probe_is_imported(self, monkeypatch):
+        """Test that invoking a probe doesn't import the modules of the others."""
+        for name in list(sys.modules):
+            if name.startswith("probes."):
+                monkeypatch.delitem(sys.modules, name)
+        app = typer.Typer()
+        load_and_register_commands(app, PROBES_DIR)
+
+        @app.callback()
+        def callback():
+            pass
+
+        result = CliRunner().invoke(app, ["daily_close", "--help"])
+
+        assert result.exit_code == 0
+        assert "Monitor a list of tickers" in result.output
+        assert "probes.daily_close.run" in sys.modules
+        assert "probes.strava_to_gcal.run" not in sys.modules
+
+    def test_async_probe_is_run_to_completion(self):
+        async def daily_close(ticker: str = "CW8.PA") -> None:
+            await asyncio.sleep(0)
+            print(f"closed {ticker}")
+
+        app = typer.Typer()
+        load_and_register_commands(app, PROBES_DIR)
+
+        @app.callback()
+        def callback():
+            pass
+
+        with patch("utils.cli_utils.import_command", return_value=daily_close):
+            result = CliRunner().invoke(app, ["daily_close", "--ticker", "ESE.PA"])
+
+        assert result.exit_code == 0
+        assert "closed ESE.PA" in result.output
+
+
+class TestRegisterLazyCommand:
+    """Test cases for the lazy registration of the commands of main.py."""
+
+    def test_importing_the_cli_imports_no_client(self):
+        """Test that the HTTP and Telegram clients are only imported by the commands using them."""
+        code = (
+            "import sys, main; "
+            "print(sorted(m for m in ('requests', 'httpx', 'telegram', 'utils.job_utils') "
+            "if m in sys.modules))"
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=SIGNALS_DIR,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+
+        assert output.strip() == "[]"
+
+    def test_tool_command_is_imported_when_invoked(self):
+        result = subprocess.run(
+            [sys.executable, "main.py", "serve", "--help"],
+            cwd=SIGNALS_DIR,
+            capture_output=True,
+            text=True,
+        )
+
+        assert result.returncode == 0
+        assert "cron schedule" in result.stdout
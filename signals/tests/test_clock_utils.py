@@ -0,0 +1,47 @@
+import threading
+from contextvars import copy_context
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+from utils.clock_utils import frozen_clock, get_now
+
+
+class TestGetNow:
+    """Test cases for the get_now function."""
+
+    def test_live_clock(self):
+        assert abs(get_now(timezone.utc) - datetime.now(timezone.utc)) < timedelta(
+            seconds=5
+        )
+
+    def test_frozen_clock_in_any_timezone(self):
+        at = datetime(2024, 1, 10, 17, 35, tzinfo=ZoneInfo("Europe/Paris"))
+
+        with frozen_clock(at):
+            assert get_now(ZoneInfo("America/New_York")) == at
+            assert get_now(ZoneInfo("America/New_York")).hour == 11
+            # Without a timezone, the local time as datetime.now() returns it
+            assert get_now() == at.astimezone().replace(tzinfo=None)
+        assert get_now(timezone.utc).year > 2024
+
+    def test_frozen_time_without_timezone_raises(self):
+        with pytest.raises(ValueError, match="must have a timezone"):
+            with frozen_clock(datetime(2024, 1, 10)):
+                pass
+
+    def test_frozen_clock_is_local_to_the_context(self):
+        """Test that a run freezing the clock doesn't freeze it for a concurrent one."""
+        at = datetime(2024, 1, 10, 17, 35, tzinfo=timezone.utc)
+        seen = {}
+
+        with frozen_clock(at):
+            context = copy_context()
+            thread = threading.Thread(
+                target=lambda: seen.update(other=get_now(timezone.utc))
+            )
+            thread.start()
+            thread.join()
+
+        assert context.run(get_now, timezone.utc) == at
+        assert seen["other"].year > 2024
@@ -1,18 +1,21 @@
-from unittest.mock import patch
+from datetime import date
+from unittest.mock import MagicMock, patch
 
 import pandas as pd
+import polars as pl
 import pytest
-
-from signals.probes.daily_close.run import (
+from probes.daily_close.run import (
     daily_close,
     get_close_data,
+    get_close_data_batch,
 )
+from utils.resilience_utils import TransientError
 
 
 class TestGetCloseData:
     """Test cases for the get_close_data function."""
 
-    @patch("signals.probes.daily_close.run.yf.download")
+    @patch("utils.market_data_utils.yf.download")
     def test_success(self, mock_download):
         """Test successful retrieval returns (prev_close, latest_close, date)."""
         mock_data = pd.DataFrame(
@@ -31,15 +34,17 @@ class TestGetCloseData:
         assert latest_close == pytest.approx(45.80)
         assert latest_date == "2024-01-10"
 
-    @patch("signals.probes.daily_close.run.yf.download")
+    @patch("utils.market_data_utils.yf.download")
     def test_download_returns_none_raises(self, mock_download):
-        """Test that a None return from yfinance raises ValueError."""
+        """Test that a None return from yfinance raises once the retries are exhausted."""
         mock_download.return_value = None
 
-        with pytest.raises(ValueError, match="Insufficient data for DCAM.PA"):
+        with pytest.raises(
+            TransientError, match="Ticker download from Yahoo Finance failed"
+        ):
             get_close_data("DCAM.PA")
 
-    @patch("signals.probes.daily_close.run.yf.download")
+    @patch("utils.market_data_utils.yf.download")
     def test_fewer_than_two_rows_raises(self, mock_download):
         """Test that fewer than 2 rows raises ValueError."""
         mock_data = pd.DataFrame(
@@ -56,12 +61,101 @@ class TestGetCloseData:
             get_close_data("DCAM.PA")
 
 
+class TestGetCloseDataBatch:
+    """Test cases for the get_close_data_batch function."""
+
+    @patch("utils.market_data_utils.yf.download")
+    def test_single_download_for_all_tickers(self, mock_download):
+        """Test that all tickers are fetched in one call and split per ticker."""
+        mock_data = pd.DataFrame(
+            {
+                ("Close", "DCAM.PA"): [45.20, 45.80],
+                ("Close", "ESE.PA"): [25.00, 24.50],
+                ("Volume", "DCAM.PA"): [100000, 110000],
+                ("Volume", "ESE.PA"): [200000, 210000],
+            }
+        )
+        mock_data.index = pd.to_datetime(["2024-01-09", "2024-01-10"])
+        mock_data.index.name = "Date"
+        mock_download.return_value = mock_data
+
+        result = get_close_data_batch(["DCAM.PA", "ESE.PA"])
+
+        mock_download.assert_called_once()
+        assert mock_download.call_args.args[0] == ["DCAM.PA", "ESE.PA"]
+        assert result["DCAM.PA"] == (
+            pytest.approx(45.20),
+            pytest.approx(45.80),
+            "2024-01-10",
+        )
+        assert result["ESE.PA"] == (
+            pytest.approx(25.00),
+            pytest.approx(24.50),
+            "2024-01-10",
+        )
+
+    @patch("utils.market_data_utils.yf.download")
+    def test_failed_ticker_is_reported_individually(self, mock_download):
+        """Test that a ticker without closes gets an error while others succeed."""
+        mock_data = pd.DataFrame(
+            {
+                ("Close", "DCAM.PA"): [45.20, 45.80],
+                ("Close", "BAD"): [float("nan"), float("nan")],
+            }
+        )
+        mock_data.index = pd.to_datetime(["2024-01-09", "2024-01-10"])
+        mock_data.index.name = "Date"
+        mock_download.return_value = mock_data
+
+        result = get_close_data_batch(["DCAM.PA", "BAD", "MISSING"])
+
+        assert result["DCAM.PA"][2] == "2024-01-10"
+        assert isinstance(result["BAD"], ValueError)
+        assert str(result["BAD"]) == "Insufficient data for BAD"
+        assert isinstance(result["MISSING"], ValueError)
+
+    def test_download_failure_is_reported_per_ticker(self):
+        """Test that each ticker gets the exception of the failed download."""
+        error = ConnectionError("Yahoo Finance is down")
+        provider = MagicMock()
+        provider.get_ohlcv.side_effect = error
+
+        with patch(
+            "probes.daily_close.run.get_market_data_provider",
+            return_value=provider,
+        ):
+            result = get_close_data_batch(["DCAM.PA", "ESE.PA"])
+
+        assert result == {"DCAM.PA": error, "ESE.PA": error}
+
+    def test_ticker_omitted_by_provider_is_reported(self):
+        """Test that a ticker missing from the provider's result doesn't abort the others."""
+        provider = MagicMock()
+        provider.get_ohlcv.return_value = {
+            "DCAM.PA": pl.DataFrame(
+                {
+                    "Date": [date(2024, 1, 9), date(2024, 1, 10)],
+                    "Close": [45.20, 45.80],
+                }
+            )
+        }
+
+        with patch(
+            "probes.daily_close.run.get_market_data_provider",
+            return_value=provider,
+        ):
+            result = get_close_data_batch(["DCAM.PA", "ESE.PA"])
+
+        assert result["DCAM.PA"][2] == "2024-01-10"
+        assert str(result["ESE.PA"]) == "No data returned for ESE.PA"
+
+
 class TestDailyCloseIntegration:
     """Integration tests for the main daily_close function."""
 
-    @patch("signals.probes.daily_close.run.send_message")
-    @patch("signals.probes.daily_close.run.os.getenv")
-    @patch("signals.probes.daily_close.run.get_close_data")
+    @patch("probes.daily_close.run.send_message")
+    @patch("probes.daily_close.run.os.getenv")
+    @patch("probes.daily_close.run.get_close_data_batch")
     def test_sends_correctly_formatted_message(
         self, mock_get_close, mock_getenv, mock_send
     ):
@@ -70,7 +164,7 @@ class TestDailyCloseIntegration:
             "TELEGRAM_CHAT_ID": "test_chat_id",
             "TELEGRAM_BOT_TOKEN": "test_token",
         }.get(key)
-        mock_get_close.return_value = (45.20, 45.80, "2024-01-10")
+        mock_get_close.return_value = {"DCAM.PA": (45.20, 45.80, "2024-01-10")}
 
         daily_close(tickers=["DCAM.PA"])
 
@@ -82,9 +176,9 @@ class TestDailyCloseIntegration:
         assert "45.80" in message
         assert "+1.33%" in message
 
-    @patch("signals.probes.daily_close.run.send_message")
-    @patch("signals.probes.daily_close.run.os.getenv")
-    @patch("signals.probes.daily_close.run.get_close_data")
+    @patch("probes.daily_close.run.send_message")
+    @patch("probes.daily_close.run.os.getenv")
+    @patch("probes.daily_close.run.get_close_data_batch")
     def test_failed_ticker_appears_as_error_line(
         self, mock_get_close, mock_getenv, mock_send
     ):
@@ -93,10 +187,10 @@ class TestDailyCloseIntegration:
             "TELEGRAM_CHAT_ID": "test_chat_id",
             "TELEGRAM_BOT_TOKEN": "test_token",
         }.get(key)
-        mock_get_close.side_effect = [
-            (45.20, 45.80, "2024-01-10"),
-            ValueError("Insufficient data for BAD"),
-        ]
+        mock_get_close.return_value = {
+            "DCAM.PA": (45.20, 45.80, "2024-01-10"),
+            "BAD": ValueError("Insufficient data for BAD"),
+        }
 
         daily_close(tickers=["DCAM.PA", "BAD"])
 
@@ -106,13 +200,29 @@ class TestDailyCloseIntegration:
         assert "BAD" in message
         assert "error" in message
 
-    @patch("signals.probes.daily_close.run.send_message")
-    @patch("signals.probes.daily_close.run.os.getenv")
-    @patch("signals.probes.daily_close.run.get_close_data")
+    @patch("probes.daily_close.run.send_message")
+    @patch("probes.daily_close.run.os.getenv")
+    @patch("probes.daily_close.run.get_close_data_batch")
     def test_missing_chat_id_raises(self, mock_get_close, mock_getenv, mock_send):
         """Test that a missing TELEGRAM_CHAT_ID env var raises ValueError."""
         mock_getenv.return_value = None
-        mock_get_close.return_value = (45.20, 45.80, "2024-01-10")
+        mock_get_close.return_value = {"DCAM.PA": (45.20, 45.80, "2024-01-10")}
 
         with pytest.raises(ValueError, match="Missing TELEGRAM_CHAT_ID env var"):
             daily_close(tickers=["DCAM.PA"])
+
+    @patch("probes.daily_close.run.send_message")
+    @patch("probes.daily_close.run.get_close_data_batch")
+    @patch("probes.daily_close.run.get_calendar")
+    def test_non_trading_day_is_skipped(
+        self, mock_get_calendar, mock_get_close, mock_send
+    ):
+        """Test that nothing is downloaded nor sent on a holiday of the exchange."""
+        mock_get_calendar.return_value.timezone = "Europe/Paris"
+        mock_get_calendar.return_value.is_trading_day.return_value = False
+
+        daily_close(tickers=["DCAM.PA"], exchange="XPAR")
+
+        mock_get_calendar.assert_called_once_with("XPAR")
+        mock_get_close.assert_not_called()
+        mock_send.assert_not_called()
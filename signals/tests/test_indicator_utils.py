@@ -0,0 +1,159 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import polars as pl
+import pytest
+from utils.cache_utils import get_cache_path, write_cached_ohlcv
+from utils.indicator_utils import (
+    Indicator,
+    compute_indicators,
+    compute_latest_indicators,
+    parse_indicators,
+    scan_cached_ohlcv,
+    to_lazy_ohlcv,
+)
+
+INDICATORS = parse_indicators("sma5,ema5,rsi3,bbu5,bbl5,drawdown5,return2")
+
+
+def make_ohlcv(closes: list[float]) -> pl.DataFrame:
+    start = date(2024, 1, 1)
+    return pl.DataFrame(
+        {
+            "Date": [start + timedelta(days=i) for i in range(len(closes))],
+            "Close": closes,
+        }
+    )
+
+
+@pytest.fixture
+def ohlcv_by_ticker():
+    rng = np.random.default_rng(0)
+    return {
+        "A": make_ohlcv(list(100 + np.cumsum(rng.normal(0, 1, 30)))),
+        "B": make_ohlcv(list(20 + np.cumsum(rng.normal(0, 0.5, 12)))),
+        "SHORT": make_ohlcv([10.0, 11.0, 12.0]),
+    }
+
+
+class TestIndicator:
+    """Test cases for the Indicator class."""
+
+    def test_parse(self):
+        assert Indicator.parse("EMA20") == Indicator("ema", 20)
+        assert Indicator.parse("drawdown252").name == "DRAWDOWN252"
+
+    @pytest.mark.parametrize("spec", ["sma", "macd12", "sma0"])
+    def test_invalid_spec_raises(self, spec):
+        with pytest.raises(ValueError):
+            Indicator.parse(spec)
+
+
+class TestComputeIndicators:
+    """Test cases for the compute_indicators function."""
+
+    def test_matches_pandas(self, ohlcv_by_ticker):
+        result = (
+            compute_indicators(to_lazy_ohlcv(ohlcv_by_ticker), INDICATORS)
+            .filter(pl.col("Ticker") == "A")
+            .collect()
+        )
+        close = pd.Series(ohlcv_by_ticker["A"]["Close"].to_list())
+
+        expected = {
+            "SMA5": close.rolling(5).mean(),
+            "EMA5": close.ewm(span=5, adjust=False, min_periods=5).mean(),
+            "BBU5": close.rolling(5).mean() + 2 * close.rolling(5).std(),
+            "BBL5": close.rolling(5).mean() - 2 * close.rolling(5).std(),
+            "DRAWDOWN5": close / close.rolling(5).max() - 1,
+            "RETURN2": close.pct_change(2),
+        }
+        for name, values in expected.items():
+            np.testing.assert_allclose(
+                result[name].to_numpy(), values.to_numpy(), equal_nan=True
+            )
+
+    def test_rsi_bounds(self):
+        rising = to_lazy_ohlcv({"UP": make_ohlcv([float(i) for i in range(1, 11)])})
+        falling = to_lazy_ohlcv(
+            {"DOWN": make_ohlcv([float(i) for i in range(10, 0, -1)])}
+        )
+
+        assert compute_indicators(rising, [Indicator("rsi", 3)]).collect()["RSI3"][
+            -1
+        ] == pytest.approx(100.0)
+        assert compute_indicators(falling, [Indicator("rsi", 3)]).collect()["RSI3"][
+            -1
+        ] == pytest.approx(0.0)
+
+    def test_tickers_are_computed_separately(self, ohlcv_by_ticker):
+        result = compute_indicators(
+            to_lazy_ohlcv(ohlcv_by_ticker), [Indicator("sma", 2)]
+        ).collect()
+
+        # The first bar of each ticker lacks a previous one
+        assert result.group_by("Ticker").agg(pl.col("SMA2").null_count()).sort(
+            "Ticker"
+        )["SMA2"].to_list() == [1, 1, 1]
+
+
+class TestComputeLatestIndicators:
+    """Test cases for the compute_latest_indicators function."""
+
+    def test_matches_last_bar_of_the_series(self, ohlcv_by_ticker):
+        lazy_ohlcv = to_lazy_ohlcv(ohlcv_by_ticker)
+
+        latest = compute_latest_indicators(lazy_ohlcv, INDICATORS)
+        series = (
+            compute_indicators(lazy_ohlcv, INDICATORS)
+            .group_by("Ticker", maintain_order=True)
+            .last()
+            .collect()
+        )
+
+        assert latest["Ticker"].to_list() == ["A", "B", "SHORT"]
+        assert latest["Bars"].to_list() == [30, 12, 3]
+        for indicator in INDICATORS:
+            np.testing.assert_allclose(
+                latest[indicator.name].to_numpy().astype(float),
+                series[indicator.name].to_numpy().astype(float),
+                equal_nan=True,
+            )
+
+    def test_missing_bars_give_nulls(self, ohlcv_by_ticker):
+        latest = compute_latest_indicators(
+            to_lazy_ohlcv(ohlcv_by_ticker), INDICATORS
+        ).filter(pl.col("Ticker") == "SHORT")
+
+        assert latest.select(indicator.name for indicator in INDICATORS).row(0) == (
+            None,
+            None,
+            None,
+            None,
+            None,
+            None,
+            pytest.approx(0.2),
+        )
+
+
+class TestScanCachedOhlcv:
+    """Test cases for the scan_cached_ohlcv function."""
+
+    def test_scans_cached_tickers(self, tmp_path, ohlcv_by_ticker):
+        for ticker in ("A", "B"):
+            write_cached_ohlcv(
+                get_cache_path(str(tmp_path), ticker),
+                ohlcv_by_ticker[ticker],
+                date(2024, 1, 1),
+            )
+
+        latest = compute_latest_indicators(
+            scan_cached_ohlcv(str(tmp_path), ["A", "B", "UNCACHED"]),
+            [Indicator("sma", 5)],
+        )
+
+        assert latest["Ticker"].to_list() == ["A", "B"]
+        assert latest["SMA5"][0] == pytest.approx(
+            pd.Series(ohlcv_by_ticker["A"]["Close"].to_list()).tail(5).mean()
+        )
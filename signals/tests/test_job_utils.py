@@ -0,0 +1,156 @@
+import asyncio
+import time
+from unittest.mock import patch
+
+import pytest
+from utils.job_utils import (
+    Job,
+    format_report,
+    load_jobs,
+    run_jobs_concurrently,
+)
+from utils.metrics_utils import FETCH, IMPORT, count, phase
+
+MANIFEST = """
+[[jobs]]
+name = "Daily close — Euronext"
+probe = "daily_close"
+params = { tickers = ["DCAM.PA", "ESE.PA"] }
+
+[[jobs]]
+probe = "sma_crossover"
+
+[jobs.params]
+ticker = "CW8.PA"
+lookback = 200
+"""
+
+
+def probe_ok(ticker: str, lookback: int = 200) -> str:
+    return f"{ticker} above"
+
+
+def probe_failing(ticker: str) -> None:
+    raise ValueError(f"Insufficient data for {ticker}")
+
+
+def probe_slow(ticker: str) -> str:
+    time.sleep(0.3)
+    return f"{ticker} above"
+
+
+async def probe_slow_async(ticker: str) -> str:
+    await asyncio.sleep(0.3)
+    return f"{ticker} below"
+
+
+class TestLoadJobs:
+    """Test cases for the load_jobs function."""
+
+    def test_parses_jobs(self, tmp_path):
+        manifest = tmp_path / "jobs.toml"
+        manifest.write_text(MANIFEST)
+
+        jobs = load_jobs(str(manifest))
+
+        assert jobs == [
+            Job(
+                name="Daily close — Euronext",
+                probe="daily_close",
+                params={"tickers": ["DCAM.PA", "ESE.PA"]},
+            ),
+            Job(
+                name="sma_crossover #1",
+                probe="sma_crossover",
+                params={"ticker": "CW8.PA", "lookback": 200},
+            ),
+        ]
+
+    def test_duplicate_names_raise(self, tmp_path):
+        manifest = tmp_path / "jobs.toml"
+        manifest.write_text(
+            '[[jobs]]\nname = "a"\nprobe = "daily_close"\n'
+            '[[jobs]]\nname = "a"\nprobe = "daily_close"\n'
+        )
+
+        with pytest.raises(ValueError, match="must be unique"):
+            load_jobs(str(manifest))
+
+
+class TestRunJobsConcurrently:
+    """Test cases for the run_jobs_concurrently function."""
+
+    @patch("utils.job_utils.import_command")
+    def test_failure_is_isolated(self, mock_import):
+        """Test that a failing job is reported without affecting the others."""
+        mock_import.side_effect = lambda probe: {
+            "ok": probe_ok,
+            "failing": probe_failing,
+        }[probe]
+        jobs = [
+            Job(name="a", probe="ok", params={"ticker": "CW8.PA"}),
+            Job(name="b", probe="failing", params={"ticker": "BAD"}),
+            Job(name="c", probe="ok", params={"ticker": "ESE.PA", "lookback": 50}),
+        ]
+
+        results = run_jobs_concurrently(jobs, max_workers=2)
+
+        assert [r.name for r in results] == ["a", "b", "c"]
+        assert [r.succeeded for r in results] == [True, False, True]
+        assert results[0].result == "CW8.PA above"
+        assert results[1].error == "ValueError: Insufficient data for BAD"
+        report = format_report(results)
+        assert "2 succeeded, 1 failed" in report
+
+    @patch("utils.job_utils.import_command")
+    def test_invalid_params_raise_before_running(self, mock_import):
+        """Test that params not matching the probe's signature fail the whole run upfront."""
+        mock_import.return_value = probe_ok
+        jobs = [Job(name="a", probe="ok", params={"tickr": "CW8.PA"})]
+
+        with pytest.raises(ValueError, match="Invalid params for job a"):
+            run_jobs_concurrently(jobs, max_workers=1)
+
+    @patch("utils.job_utils.import_command")
+    def test_sync_and_async_probes_overlap(self, mock_import):
+        """Test that a run lasts about as long as its slowest job."""
+        mock_import.side_effect = lambda probe: {
+            "slow": probe_slow,
+            "slow_async": probe_slow_async,
+        }[probe]
+        jobs = [
+            Job(name="a", probe="slow", params={"ticker": "CW8.PA"}),
+            Job(name="b", probe="slow_async", params={"ticker": "ESE.PA"}),
+            Job(name="c", probe="slow", params={"ticker": "DCAM.PA"}),
+        ]
+
+        start = time.perf_counter()
+        results = run_jobs_concurrently(jobs, max_workers=3)
+
+        assert time.perf_counter() - start < 0.6
+        assert [r.result for r in results] == [
+            "CW8.PA above",
+            "ESE.PA below",
+            "DCAM.PA above",
+        ]
+
+    @patch("utils.job_utils.import_command")
+    def test_phases_of_sync_probes_are_recorded(self, mock_import):
+        """Test that each job gets its own metrics, recorded from the thread running it."""
+
+        def probe_with_phases(ticker: str) -> str:
+            with phase(FETCH):
+                count("bars_downloaded", len(ticker))
+            return ticker
+
+        mock_import.return_value = probe_with_phases
+        jobs = [
+            Job(name="a", probe="phases", params={"ticker": "CW8.PA"}),
+            Job(name="b", probe="phases", params={"ticker": "DCAM.PA"}),
+        ]
+
+        results = run_jobs_concurrently(jobs, max_workers=2)
+
+        assert [r.metrics.job for r in results] == ["a", "b"]
+        assert [r.metrics.counters["bars_downloaded"] for r in results] == [6, 7]
+        assert all({IMPORT, FETCH} <= set(r.metrics.phases_s) for r in results)
@@ -0,0 +1,225 @@
+from datetime import date, datetime, timezone
+from unittest.mock import patch
+
+import pandas as pd
+import polars as pl
+import pytest
+from utils.clock_utils import frozen_clock
+from utils.market_data_utils import (
+    OHLCV_SCHEMA,
+    YAHOO_FINANCE_HOST,
+    ReplayProvider,
+    YFinanceProvider,
+    get_market_data_provider,
+    ohlcv_from_pandas,
+)
+from utils.resilience_utils import (
+    TransientError,
+    get_circuit_breaker,
+    get_host_policy,
+)
+
+
+class TestYFinanceProvider:
+    """Test cases for the YFinanceProvider class with mocked yf.download."""
+
+    @patch("utils.market_data_utils.yf.download")
+    def test_splits_grouped_download_into_normalized_frames(self, mock_download):
+        mock_data = pd.DataFrame(
+            {
+                ("Close", "CW8.PA"): [500.0, 505.0, 510.0],
+                ("Close", "ESE.PA"): [25.0, float("nan"), 24.5],
+                ("Open", "CW8.PA"): [499.0, 501.0, 506.0],
+                ("Open", "ESE.PA"): [25.1, float("nan"), 24.9],
+                ("Volume", "CW8.PA"): [1000, 1100, 1200],
+                ("Volume", "ESE.PA"): [2000, 0, 2100],
+            }
+        )
+        mock_data.index = pd.to_datetime(["2024-01-08", "2024-01-09", "2024-01-10"])
+        mock_data.index.name = "Date"
+        mock_download.return_value = mock_data
+
+        result = YFinanceProvider().get_ohlcv(
+            ["CW8.PA", "ESE.PA", "MISSING"], date(2024, 1, 8)
+        )
+
+        mock_download.assert_called_once()
+        assert result["CW8.PA"].schema == pl.Schema(OHLCV_SCHEMA)
+        assert result["CW8.PA"]["Close"].to_list() == [500.0, 505.0, 510.0]
+        # Bars without a close are dropped
+        assert result["ESE.PA"]["Date"].to_list() == [
+            date(2024, 1, 8),
+            date(2024, 1, 10),
+        ]
+        assert result["MISSING"].is_empty()
+
+    @patch("utils.market_data_utils.yf.download")
+    def test_failed_download_raises(self, mock_download):
+        mock_download.return_value = None
+
+        with pytest.raises(
+            TransientError, match="Ticker download from Yahoo Finance failed"
+        ):
+            YFinanceProvider().get_ohlcv(["CW8.PA"], date(2024, 1, 8))
+
+    @patch("utils.market_data_utils.yf.download")
+    def test_empty_download_is_retried_then_raises(self, mock_download):
+        """Test that yfinance swallowing the failure of all the tickers is retried."""
+        mock_download.return_value = pd.DataFrame()
+
+        with pytest.raises(
+            TransientError, match="Ticker download from Yahoo Finance failed"
+        ):
+            YFinanceProvider().get_ohlcv(["CW8.PA"], date(2024, 1, 8))
+
+        assert (
+            mock_download.call_count
+            == get_host_policy(YAHOO_FINANCE_HOST).max_retries + 1
+        )
+
+    @patch("utils.market_data_utils.yf.download")
+    def test_ticker_failed_by_yfinance_gets_empty_frame(self, mock_download):
+        """Test that a ticker yfinance failed on its own neither fails nor retries the others."""
+        mock_data = pd.DataFrame(
+            {
+                ("Close", "CW8.PA"): [500.0, 505.0],
+                ("Close", "DELISTED"): [float("nan"), float("nan")],
+            }
+        )
+        mock_data.index = pd.to_datetime(["2024-01-08", "2024-01-09"])
+        mock_download.return_value = mock_data
+
+        result = YFinanceProvider().get_ohlcv(["CW8.PA", "DELISTED"], date(2024, 1, 8))
+
+        mock_download.assert_called_once()
+        assert result["CW8.PA"]["Close"].to_list() == [500.0, 505.0]
+        assert result["DELISTED"].is_empty()
+        assert get_circuit_breaker(YAHOO_FINANCE_HOST).consecutive_failures == 0
+
+    @patch("utils.market_data_utils.yf.download")
+    def test_latest_prices_are_last_intraday_closes(self, mock_download):
+        mock_data = pd.DataFrame(
+            {
+                ("Close", "CW8.PA"): [500.0, 501.0, 502.5],
+                ("Close", "ESE.PA"): [25.0, 25.2, float("nan")],
+                ("Close", "HALTED"): [float("nan")] * 3,
+            }
+        )
+        mock_data.index = pd.to_datetime(
+            ["2024-01-10 09:00", "2024-01-10 09:01", "2024-01-10 09:02"]
+        )
+        mock_download.return_value = mock_data
+
+        prices = YFinanceProvider().get_latest_prices(
+            ["CW8.PA", "ESE.PA", "HALTED", "MISSING"]
+        )
+
+        assert mock_download.call_args.kwargs["interval"] == "1m"
+        assert prices == {"CW8.PA": 502.5, "ESE.PA": 25.2}
+
+
+class TestOhlcvFromPandas:
+    """Test cases for the ohlcv_from_pandas function."""
+
+    def test_converts_to_local_dates_and_float_prices(self):
+        raw = pd.DataFrame(
+            {
+                ("Close", "CW8.PA"): [510.0, 500.0, 505.0],
+                ("Volume", "CW8.PA"): [1200, 1000, 1100],
+            },
+            # Out of order, at midnight in the exchange's timezone
+            index=pd.DatetimeIndex(
+                ["2024-01-10", "2024-01-08", "2024-01-09"], tz="Europe/Paris"
+            ),
+        )
+
+        result = ohlcv_from_pandas(raw, ["CW8.PA"])["CW8.PA"]
+
+        assert result.schema == pl.Schema(OHLCV_SCHEMA)
+        assert result["Date"].to_list() == [
+            date(2024, 1, 8),
+            date(2024, 1, 9),
+            date(2024, 1, 10),
+        ]
+        assert result["Close"].to_list() == [500.0, 505.0, 510.0]
+        assert result["Volume"].to_list() == [1000.0, 1100.0, 1200.0]
+        assert result["Open"].null_count() == 3
+
+
+class TestReplayProvider:
+    """Test cases for the ReplayProvider class."""
+
+    def test_replays_parquet_and_csv_files_from_start(self, tmp_path):
+        pl.DataFrame(
+            {
+                "Date": [date(2024, 1, d) for d in (8, 9, 10)],
+                "Close": [500.0, 505.0, 510.0],
+            }
+        ).write_parquet(tmp_path / "CW8.PA.parquet")
+        (tmp_path / "^VIX.csv").write_text(
+            "Date,Open,High,Low,Close,Volume\n"
+            "2024-01-09,13.0,13.5,12.5,13.2,0\n"
+            "2024-01-10,13.2,14.0,13.0,13.8,0\n"
+        )
+
+        result = ReplayProvider(str(tmp_path)).get_ohlcv(
+            ["CW8.PA", "^VIX", "MISSING"], date(2024, 1, 9)
+        )
+
+        assert result["CW8.PA"]["Close"].to_list() == [505.0, 510.0]
+        assert result["CW8.PA"]["Open"].null_count() == 2
+        assert result["^VIX"].schema == pl.Schema(OHLCV_SCHEMA)
+        assert result["^VIX"]["Close"].to_list() == [13.2, 13.8]
+        assert result["MISSING"].is_empty()
+
+    @pytest.mark.parametrize(
+        "exchange, at, closes",
+        [
+            # 19:00 in Paris, after the close of XPAR
+            ("XPAR", datetime(2024, 1, 9, 18, 0, tzinfo=timezone.utc), [500.0, 505.0]),
+            # 16:00 in Paris, the session of the 9th is still open
+            ("XPAR", datetime(2024, 1, 9, 15, 0, tzinfo=timezone.utc), [500.0]),
+            # 13:00 in New York, the session of the 9th is still open
+            ("XNYS", datetime(2024, 1, 9, 18, 0, tzinfo=timezone.utc), [500.0]),
+            # Without an exchange, the current day's bar is always left out
+            (None, datetime(2024, 1, 9, 23, 0, tzinfo=timezone.utc), [500.0]),
+        ],
+    )
+    def test_bars_of_sessions_not_closed_are_left_out(
+        self, tmp_path, exchange, at, closes
+    ):
+        pl.DataFrame(
+            {
+                "Date": [date(2024, 1, d) for d in (8, 9, 10)],
+                "Close": [500.0, 505.0, 510.0],
+            }
+        ).write_parquet(tmp_path / "CW8.PA.parquet")
+        provider = ReplayProvider(str(tmp_path), exchange)
+
+        with frozen_clock(at):
+            result = provider.get_ohlcv(["CW8.PA"], date(2024, 1, 1))
+            prices = provider.get_latest_prices(["CW8.PA"])
+
+        assert result["CW8.PA"]["Close"].to_list() == closes
+        assert prices == {"CW8.PA": closes[-1]}
+
+
+class TestGetMarketDataProvider:
+    """Test cases for the get_market_data_provider function."""
+
+    def test_selected_by_env_var(self, monkeypatch, tmp_path):
+        monkeypatch.delenv("SIGNALS_MARKET_DATA", raising=False)
+        assert isinstance(get_market_data_provider(), YFinanceProvider)
+
+        monkeypatch.setenv("SIGNALS_MARKET_DATA", f"replay://{tmp_path}")
+        provider = get_market_data_provider()
+        assert isinstance(provider, ReplayProvider)
+        assert provider.directory == str(tmp_path)
+        assert provider.exchange is None
+
+        provider = get_market_data_provider(f"replay://{tmp_path}?exchange=XPAR")
+        assert provider.directory == str(tmp_path)
+        assert provider.exchange == "XPAR"
+
+        with pytest.raises(ValueError, match="Unsupported market data provider"):
+            get_market_data_provider("bloomberg")
@@ -0,0 +1,100 @@
+import json
+import time
+
+import pytest
+from utils.metrics_utils import (
+    FETCH,
+    SIGNAL,
+    ProbeMetrics,
+    count,
+    format_prometheus,
+    phase,
+    record_probe,
+    upstream,
+    write_report,
+)
+
+
+def record_sample_probe() -> ProbeMetrics:
+    metrics = ProbeMetrics(probe="sma_crossover", job="Euronext")
+    with record_probe(metrics):
+        with phase(FETCH), upstream("query2.finance.yahoo.com"):
+            time.sleep(0.01)
+            count("bars_downloaded", 400)
+        with phase(FETCH):
+            count("bars_downloaded", 2)
+        with phase(SIGNAL):
+            count("retries")
+    return metrics
+
+
+class TestRecordProbe:
+    """Test cases for the recording of the phases and counters of a probe invocation."""
+
+    def test_phases_and_counters_are_summed(self):
+        metrics = record_sample_probe()
+
+        assert metrics.succeeded is True
+        assert metrics.phases_s[FETCH] >= 0.01
+        assert set(metrics.phases_s) == {FETCH, SIGNAL}
+        assert metrics.upstreams_s["query2.finance.yahoo.com"] >= 0.01
+        assert metrics.counters == {"bars_downloaded": 402, "retries": 1}
+        assert metrics.duration_s >= metrics.phases_s[FETCH]
+
+    def test_failure_is_recorded(self):
+        metrics = ProbeMetrics(probe="daily_close")
+
+        with pytest.raises(ValueError):
+            with record_probe(metrics):
+                raise ValueError("Insufficient data for BAD")
+
+        assert metrics.succeeded is False
+
+    def test_nothing_is_recorded_outside_of_a_probe(self):
+        with phase(FETCH):
+            count("retries")
+        metrics = ProbeMetrics(probe="daily_close")
+
+        with record_probe(metrics):
+            pass
+
+        assert metrics.phases_s == {}
+        assert metrics.counters == {}
+
+
+class TestWriteReport:
+    """Test cases for the JSON and Prometheus run reports."""
+
+    def test_json_report(self, tmp_path):
+        path = tmp_path / "report.json"
+
+        write_report(str(path), [record_sample_probe()])
+
+        report = json.loads(path.read_text())
+        [probe] = report["probes"]
+        assert probe["probe"] == "sma_crossover"
+        assert probe["job"] == "Euronext"
+        assert probe["counters"]["bars_downloaded"] == 402
+
+    def test_prometheus_report(self, tmp_path):
+        path = tmp_path / "signals.prom"
+
+        write_report(str(path), [record_sample_probe()])
+
+        lines = path.read_text().splitlines()
+        assert "# TYPE signals_probe_phase_seconds gauge" in lines
+        assert any(
+            line.startswith(
+                'signals_probe_phase_seconds{probe="sma_crossover",job="Euronext",phase="fetch"} '
+            )
+            for line in lines
+        )
+        assert (
+            'signals_probe_bars_downloaded{probe="sma_crossover",job="Euronext"} 402'
+            in lines
+        )
+
+    def test_label_values_are_escaped(self):
+        report = format_prometheus([ProbeMetrics(probe="daily_close", job='Say "hi"')])
+
+        assert 'job="Say \\"hi\\""' in report
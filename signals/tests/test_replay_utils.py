@@ -0,0 +1,136 @@
+import json
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+
+import polars as pl
+import pytest
+from utils.job_utils import Job
+from utils.replay_utils import get_replay_runs, replay, replay_jobs, split_days
+
+PARIS = ZoneInfo("Europe/Paris")
+
+
+class TestSplitDays:
+    """Test cases for the split_days function."""
+
+    def test_contiguous_ranges_of_about_the_same_length(self):
+        assert split_days(date(2024, 1, 1), date(2024, 1, 10), 3) == [
+            (date(2024, 1, 1), date(2024, 1, 4)),
+            (date(2024, 1, 5), date(2024, 1, 7)),
+            (date(2024, 1, 8), date(2024, 1, 10)),
+        ]
+
+    def test_no_more_ranges_than_days(self):
+        assert split_days(date(2024, 1, 1), date(2024, 1, 2), 8) == [
+            (date(2024, 1, 1), date(2024, 1, 1)),
+            (date(2024, 1, 2), date(2024, 1, 2)),
+        ]
+
+
+class TestGetReplayRuns:
+    """Test cases for the get_replay_runs function."""
+
+    def test_runs_on_schedules_in_time_order(self):
+        jobs = [
+            Job(name="a", probe="p", schedule="35 17 * * 1-5", timezone="Europe/Paris"),
+            Job(name="b", probe="p", schedule="0 12 * * *"),
+        ]
+
+        runs = get_replay_runs(jobs, date(2024, 1, 5), date(2024, 1, 6))
+
+        assert [(run.job.name, run.at, run.day) for run in runs] == [
+            (
+                "b",
+                datetime(2024, 1, 5, 12, 0, tzinfo=ZoneInfo("UTC")),
+                date(2024, 1, 5),
+            ),
+            ("a", datetime(2024, 1, 5, 17, 35, tzinfo=PARIS), date(2024, 1, 5)),
+            (
+                "b",
+                datetime(2024, 1, 6, 12, 0, tzinfo=ZoneInfo("UTC")),
+                date(2024, 1, 6),
+            ),
+        ]
+
+    def test_job_without_schedule_raises(self):
+        with pytest.raises(ValueError, match="Jobs without a schedule: a"):
+            get_replay_runs(
+                [Job(name="a", probe="p")], date(2024, 1, 5), date(2024, 1, 6)
+            )
+
+
+class TestReplayJobs:
+    """Test cases for the replay of jobs in worker processes."""
+
+    @pytest.fixture
+    def data_dir(self, tmp_path):
+        days = pl.date_range(date(2024, 1, 1), date(2024, 1, 31), eager=True)
+        pl.DataFrame(
+            {"Date": days, "Close": [100.0 + i for i in range(len(days))]}
+        ).write_parquet(tmp_path / "CW8.PA.parquet")
+        return str(tmp_path)
+
+    def test_days_replayed_against_the_bars_up_to_each_day(self, data_dir):
+        jobs = [
+            Job(
+                name="close",
+                probe="daily_close",
+                params={"tickers": ["CW8.PA", "MISSING"]},
+                schedule="35 17 * * *",
+                timezone="Europe/Paris",
+            )
+        ]
+
+        records = replay_jobs(
+            jobs, date(2024, 1, 10), date(2024, 1, 13), data_dir, workers=2
+        )
+
+        assert [record["at"] for record in records] == [
+            f"2024-01-{day}T17:35:00+01:00" for day in (10, 11, 12, 13)
+        ]
+        # At 17:35 on the 10th, the XPAR session of the 10th has closed: its close is the last one
+        assert "2024-01-10\nCW8.PA  108.00 → 109.00" in records[0]["text"]
+        # Saturday the 13th has no session, its bar isn't complete
+        assert "2024-01-12\nCW8.PA  110.00 → 111.00" in records[-1]["text"]
+
+    def test_bar_of_a_session_still_open_is_left_out(self, data_dir):
+        jobs = [
+            Job(
+                name="close",
+                probe="daily_close",
+                params={"tickers": ["CW8.PA"]},
+                schedule="0 17 * * *",
+                timezone="Europe/Paris",
+            )
+        ]
+
+        records = replay_jobs(
+            jobs, date(2024, 1, 10), date(2024, 1, 10), data_dir, workers=1
+        )
+
+        assert "2024-01-09\nCW8.PA  107.00 → 108.00" in records[0]["text"]
+
+    def test_failures_are_recorded(self, data_dir, tmp_path):
+        (tmp_path / "jobs.toml").write_text(
+            "[[jobs]]\n"
+            'name = "sma"\n'
+            'probe = "sma_crossover"\n'
+            'params = { tickers = ["CW8.PA"], lookbacks = "five", trading_hours_open = "09:00", trading_hours_close = "17:30", timezone = "Europe/Paris" }\n'
+            'schedule = "31 17 * * *"\n'
+            'timezone = "Europe/Paris"\n'
+        )
+        output = tmp_path / "replay.jsonl"
+
+        replay(
+            str(tmp_path / "jobs.toml"),
+            "2024-01-20",
+            "2024-01-20",
+            data_dir=data_dir,
+            output=str(output),
+            workers=1,
+            warmup_days=0,
+        )
+
+        records = [json.loads(line) for line in output.read_text().splitlines()]
+        assert [record["job"] for record in records] == ["sma"]
+        assert records[0]["error"].startswith("ValueError")
@@ -0,0 +1,192 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import pytest
+import requests
+from probes.strava_to_gcal.run import refresh_strava_token
+from utils import resilience_utils
+from utils.resilience_utils import (
+    CircuitOpenError,
+    HostPolicy,
+    parse_retry_after,
+    reset_circuit_breakers,
+    resilient_call,
+)
+
+FAST_POLICY = HostPolicy(
+    timeout_s=0.3,
+    max_retries=3,
+    backoff_base_s=0.01,
+    failure_threshold=4,
+    cooldown_s=0.5,
+)
+
+
+class FaultyUpstream:
+    """Local HTTP stand-in serving scripted faults (status, headers, delay) before succeeding."""
+
+    def __init__(self):
+        self.requests = 0
+        # (status, headers, delay_s) to serve, in order, before succeeding again
+        self.faults: list[tuple[int, dict[str, str], float]] = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def handle_request(self):
+                fake.requests += 1
+                status, headers, delay_s = (
+                    fake.faults.pop(0) if fake.faults else (200, {}, 0)
+                )
+                time.sleep(delay_s)
+                body = b'{"access_token": "access", "refresh_token": "refresh"}'
+                try:
+                    self.send_response(status)
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client timed out
+                    pass
+
+            do_GET = do_POST = handle_request
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.host = f"127.0.0.1:{self.server.server_port}"
+        self.url = f"http://{self.host}/"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def get(self) -> requests.Response:
+        response = requests.get(self.url, timeout=FAST_POLICY.timeout_s)
+        response.raise_for_status()
+        return response
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    fake = FaultyUpstream()
+    monkeypatch.setitem(resilience_utils.HOST_POLICIES, fake.host, FAST_POLICY)
+    reset_circuit_breakers()
+    yield fake
+    fake.close()
+    reset_circuit_breakers()
+
+
+class TestResilientCall:
+    """Test cases for resilient_call against a fault-injecting HTTP stand-in."""
+
+    def test_server_errors_are_retried(self, upstream):
+        upstream.faults = [(503, {}, 0), (502, {}, 0)]
+
+        response = resilient_call(upstream.host, upstream.get)
+
+        assert response.status_code == 200
+        assert upstream.requests == 3
+
+    def test_retry_after_is_honored(self, upstream):
+        upstream.faults = [(429, {"Retry-After": "1"}, 0)]
+
+        start = time.monotonic()
+        resilient_call(upstream.host, upstream.get)
+
+        assert time.monotonic() - start >= 1
+        assert upstream.requests == 2
+
+    def test_timeout_is_retried(self, upstream):
+        upstream.faults = [(200, {}, 1.0)]
+
+        start = time.monotonic()
+        response = resilient_call(upstream.host, upstream.get)
+
+        assert response.status_code == 200
+        assert time.monotonic() - start < 1.0
+
+    def test_client_errors_are_not_retried(self, upstream):
+        upstream.faults = [(404, {}, 0)]
+
+        with pytest.raises(requests.HTTPError):
+            resilient_call(upstream.host, upstream.get)
+
+        assert upstream.requests == 1
+
+    def test_retries_are_bounded(self, upstream):
+        upstream.faults = [(500, {}, 0)] * 10
+
+        with pytest.raises(requests.HTTPError):
+            resilient_call(upstream.host, upstream.get)
+
+        assert upstream.requests == FAST_POLICY.max_retries + 1
+
+    def test_circuit_opens_until_reset(self, upstream):
+        upstream.faults = [(503, {}, 0)] * 10
+
+        with pytest.raises(requests.HTTPError):
+            resilient_call(upstream.host, upstream.get)
+        with pytest.raises(CircuitOpenError):
+            resilient_call(upstream.host, upstream.get)
+
+        assert upstream.requests == FAST_POLICY.failure_threshold
+
+        reset_circuit_breakers()
+        upstream.faults = []
+        assert resilient_call(upstream.host, upstream.get).status_code == 200
+
+    def test_circuit_lets_a_trial_call_through_after_its_cooldown(self, upstream):
+        upstream.faults = [(503, {}, 0)] * (FAST_POLICY.failure_threshold + 1)
+
+        with pytest.raises(requests.HTTPError):
+            resilient_call(upstream.host, upstream.get)
+        time.sleep(FAST_POLICY.cooldown_s)
+        # The failed trial opens the circuit for another cooldown, without retrying
+        with pytest.raises(requests.HTTPError):
+            resilient_call(upstream.host, upstream.get)
+        with pytest.raises(CircuitOpenError):
+            resilient_call(upstream.host, upstream.get)
+
+        assert upstream.requests == FAST_POLICY.failure_threshold + 1
+
+        time.sleep(FAST_POLICY.cooldown_s)
+        # The successful trial closes it
+        assert resilient_call(upstream.host, upstream.get).status_code == 200
+        assert resilient_call(upstream.host, upstream.get).status_code == 200
+        assert upstream.requests == FAST_POLICY.failure_threshold + 3
+
+    def test_strava_token_refresh_survives_a_transient_error(self, upstream):
+        upstream.faults = [(503, {}, 0)]
+
+        with (
+            patch("probes.strava_to_gcal.run.STRAVA_TOKEN_URL", upstream.url),
+            patch("probes.strava_to_gcal.run.STRAVA_HOST", upstream.host),
+        ):
+            tokens = refresh_strava_token("id", "secret", "old_refresh")
+
+        assert tokens == ("access", "refresh")
+        assert upstream.requests == 2
+
+
+class TestParseRetryAfter:
+    """Test cases for the parse_retry_after function."""
+
+    def test_seconds(self):
+        assert parse_retry_after("30") == 30
+
+    def test_http_date(self):
+        retry_at = datetime.now(timezone.utc) + timedelta(seconds=120)
+
+        assert 110 < parse_retry_after(format_datetime(retry_at, usegmt=True)) <= 120
+
+    def test_invalid(self):
+        assert parse_retry_after("soon") is None
@@ -0,0 +1,256 @@
+from datetime import date, datetime, timedelta, timezone
+from unittest.mock import patch
+
+import polars as pl
+import pytest
+from probes.rules.run import (
+    Operand,
+    Rule,
+    compile_rules,
+    evaluate_rules,
+    format_rule_message,
+    get_state_key,
+    load_rules,
+    rules,
+)
+from probes.sma_crossover.run import update_state
+from utils.clock_utils import frozen_clock
+from utils.indicator_utils import Indicator, compute_latest_indicators, to_lazy_ohlcv
+from utils.state_utils import get_state_backend
+
+RULES = """
+[[rules]]
+name = "Trend"
+tickers = ["A", "B"]
+condition = "close crosses 1.03*sma3"
+upward_tolerance = 1
+downward_tolerance = 1
+
+[[rules]]
+ticker = "A"
+condition = "return1 < -5%"
+
+[[rules]]
+ticker = "VIX"
+condition = "close > 30"
+"""
+
+
+def make_ohlcv(closes: list[float]) -> pl.DataFrame:
+    start = date(2024, 1, 1)
+    return pl.DataFrame(
+        {
+            "Date": [start + timedelta(days=i) for i in range(len(closes))],
+            "Close": closes,
+        }
+    )
+
+
+def get_latest(ohlcv_by_ticker, rule_list):
+    return compute_latest_indicators(
+        to_lazy_ohlcv(ohlcv_by_ticker),
+        [indicator for rule in rule_list for indicator in rule.indicators],
+    )
+
+
+class TestParseRules:
+    """Test cases for the parsing of the rules."""
+
+    @pytest.mark.parametrize(
+        "spec, expected",
+        [
+            ("close", Operand("close", 1.0, "Close")),
+            ("1.03*EMA50", Operand("1.03*EMA50", 1.03, "EMA50", Indicator("ema", 50))),
+            ("30", Operand("30", 30.0)),
+            ("-5%", Operand("-5%", -0.05)),
+        ],
+    )
+    def test_parse_operand(self, spec, expected):
+        assert Operand.parse(spec) == expected
+
+    def test_load_rules(self, tmp_path):
+        path = tmp_path / "rules.toml"
+        path.write_text(RULES)
+
+        rule_list = load_rules(str(path))
+
+        assert [rule.name for rule in rule_list] == [
+            "Trend",
+            "return1 < -5%",
+            "close > 30",
+        ]
+        assert rule_list[0].tickers == ("A", "B")
+        assert rule_list[0].indicators == [Indicator("sma", 3)]
+
+    @pytest.mark.parametrize(
+        "condition", ["close >= 30", "close > macd12", "close 30", "close > 30 > 20"]
+    )
+    def test_invalid_rule_raises(self, tmp_path, condition):
+        path = tmp_path / "rules.toml"
+        path.write_text(f'[[rules]]\nticker = "A"\ncondition = "{condition}"\n')
+
+        with pytest.raises(ValueError, match="Invalid rule"):
+            load_rules(str(path))
+
+    def test_compile_keeps_rules_of_other_names(self):
+        rule_list = [
+            Rule.parse({"name": name, "ticker": "A", "condition": "close > 30"})
+            for name in ["Alert", "Alert", "Other alert"]
+        ]
+
+        compiled = compile_rules(rule_list)
+
+        assert compiled["Rule"].to_list() == ["Alert", "Other alert"]
+
+
+class TestEvaluateRules:
+    """Test cases for the evaluate_rules function."""
+
+    @pytest.mark.parametrize("previous_state", ["neutral", "above", "below"])
+    @pytest.mark.parametrize("close", [95.0, 98.5, 100.0, 101.5, 105.0])
+    def test_matches_update_state(self, previous_state, close):
+        """Test that the vectorized state machine is sma_crossover's update_state."""
+        rule = Rule.parse(
+            {
+                "ticker": "A",
+                "condition": "close crosses sma2",
+                "upward_tolerance": 1,
+                "downward_tolerance": 2,
+            }
+        )
+        # SMA2 of the last bars is 100
+        latest = get_latest({"A": make_ohlcv([200 - close, close])}, [rule])
+
+        evaluated = evaluate_rules(
+            compile_rules([rule]), latest, {get_state_key("A", rule): previous_state}
+        )
+
+        assert evaluated["State"][0] == update_state(close, 100.0, 1, 2, previous_state)
+
+    def test_signals_follow_the_operator(self):
+        rule_list = [
+            Rule.parse({"ticker": "VIX", "condition": "close > 30"}),
+            Rule.parse({"ticker": "VIX", "condition": "close < 30"}),
+            Rule.parse({"ticker": "VIX", "condition": "close crosses 30"}),
+        ]
+        latest = get_latest({"VIX": make_ohlcv([20.0, 35.0])}, rule_list)
+
+        evaluated = evaluate_rules(compile_rules(rule_list), latest, {})
+
+        assert evaluated["State"].to_list() == ["above"] * 3
+        assert evaluated["Signaled"].to_list() == [True, False, True]
+
+    def test_missing_data_gives_null_state(self):
+        rule_list = [
+            Rule.parse({"tickers": ["A", "MISSING"], "condition": "close > sma5"})
+        ]
+        latest = get_latest({"A": make_ohlcv([1.0, 2.0])}, rule_list)
+
+        evaluated = evaluate_rules(compile_rules(rule_list), latest, {})
+
+        assert evaluated["State"].to_list() == [None, None]
+        assert evaluated["Signaled"].to_list() == [False, False]
+
+    def test_message_format(self):
+        rule = Rule.parse({"ticker": "A", "condition": "return1 < -5%"})
+        latest = get_latest({"A": make_ohlcv([100.0, 90.0])}, [rule])
+
+        row = evaluate_rules(compile_rules([rule]), latest, {}).row(0, named=True)
+
+        assert format_rule_message(row) == (
+            "🚨[A, return1 < -5%, 0/0%]\n"
+            "State changed from neutral to below.\n"
+            "2024-01-02: return1 = -0.1, -5% = -0.05, -100.0% difference."
+        )
+
+
+class TestRulesIntegration:
+    """Integration tests for the main rules function."""
+
+    @pytest.fixture(autouse=True)
+    def telegram_env(self, monkeypatch):
+        monkeypatch.setenv("TELEGRAM_CHAT_ID", "test_chat_id")
+        monkeypatch.setenv("TELEGRAM_BOT_TOKEN", "test_token")
+
+    @patch("probes.rules.run.send_message")
+    @patch("probes.rules.run.get_ohlcv_by_ticker")
+    def test_only_state_changes_are_signaled(
+        self, mock_get_ohlcv, mock_send_message, tmp_path
+    ):
+        path = tmp_path / "rules.toml"
+        path.write_text(RULES)
+        state_url = f"sqlite://{tmp_path / 'state.db'}"
+        mock_get_ohlcv.return_value = (
+            {
+                "A": make_ohlcv([100.0, 100.0, 100.0, 90.0]),
+                "B": make_ohlcv([10.0, 10.0, 10.0, 10.6]),
+                "VIX": make_ohlcv([20.0, 25.0]),
+            },
+            {},
+        )
+
+        states = rules(str(path), state_url=state_url)
+
+        message = mock_send_message.call_args.kwargs["message"]
+        assert "[A, Trend, 1/1%]" in message
+        assert "[A, return1 < -5%, 0/0%]" in message
+        # B stays within the hysteresis band and VIX below 30: neither is signaled
+        assert "[B," not in message and "[VIX," not in message
+        assert mock_send_message.call_args.kwargs["urgent"]
+        assert list(states.values()) == ["below", "neutral", "below", "below"]
+
+        # The stored states are the previous ones of the next run
+        mock_send_message.reset_mock()
+        rules(str(path), state_url=state_url)
+
+        mock_send_message.assert_not_called()
+        state_backend = get_state_backend(state_url)
+        assert state_backend.get_all("rules:") == {
+            key: state for key, state in states.items() if state != "neutral"
+        }
+        state_backend.close()
+
+    @patch("probes.rules.run.send_message")
+    @patch("probes.rules.run.get_ohlcv_by_ticker")
+    def test_current_day_is_left_out_without_exchange(
+        self, mock_get_ohlcv, mock_send_message, tmp_path
+    ):
+        path = tmp_path / "rules.toml"
+        path.write_text('[[rules]]\nticker = "VIX"\ncondition = "close > 30"\n')
+        mock_get_ohlcv.return_value = ({"VIX": make_ohlcv([20.0, 35.0])}, {})
+
+        # The bar of 2024-01-02 may be of a session still open
+        with frozen_clock(datetime(2024, 1, 2, 12, tzinfo=timezone.utc)):
+            states = rules(str(path))
+
+        mock_send_message.assert_not_called()
+        assert list(states.values()) == ["below"]
+
+    @patch("probes.rules.run.send_message")
+    @patch("probes.rules.run.get_ohlcv_by_ticker")
+    def test_previous_states_are_given_and_printed_without_state_store(
+        self, mock_get_ohlcv, mock_send_message, tmp_path, capsys
+    ):
+        """Test that, without a state store, the previous states come from the arguments and the new ones go to stdout."""
+        path = tmp_path / "rules.toml"
+        path.write_text(
+            '[[rules]]\ntickers = ["VIX", "OVX"]\ncondition = "close > 30"\n'
+        )
+        mock_get_ohlcv.return_value = (
+            {"VIX": make_ohlcv([20.0, 35.0]), "OVX": make_ohlcv([20.0, 25.0])},
+            {},
+        )
+
+        states = rules(str(path), previous_state=["above", "below"])
+
+        # VIX stays above 30, and OVX below it: no signal
+        mock_send_message.assert_not_called()
+        assert list(states.values()) == ["above", "below"]
+        assert capsys.readouterr().out == "above\nbelow\n"
+
+    def test_previous_states_must_match_the_pairs(self, tmp_path):
+        path = tmp_path / "rules.toml"
+        path.write_text('[[rules]]\nticker = "VIX"\ncondition = "close > 30"\n')
+
+        with pytest.raises(ValueError, match="Expected 1 or 1 previous states"):
+            rules(str(path), previous_state=["above", "below"])
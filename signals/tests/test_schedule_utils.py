@@ -0,0 +1,87 @@
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+from utils.schedule_utils import CronSchedule, parse_cron_field
+
+PARIS = ZoneInfo("Europe/Paris")
+
+
+class TestParseCronField:
+    """Test cases for the parse_cron_field function."""
+
+    @pytest.mark.parametrize(
+        "field, expected",
+        [
+            ("*", set(range(0, 24))),
+            ("5", {5}),
+            ("1-5", {1, 2, 3, 4, 5}),
+            ("*/6", {0, 6, 12, 18}),
+            ("8-18/5", {8, 13, 18}),
+            ("3/10", {3, 13, 23}),
+            ("1,2,20-21", {1, 2, 20, 21}),
+        ],
+    )
+    def test_parses_field(self, field, expected):
+        assert parse_cron_field(field, "hour", 0, 23) == expected
+
+    @pytest.mark.parametrize("field", ["24", "5-1", "*/0", "a", ""])
+    def test_invalid_field_raises(self, field):
+        with pytest.raises(ValueError):
+            parse_cron_field(field, "hour", 0, 23)
+
+
+class TestCronSchedule:
+    """Test cases for the CronSchedule class."""
+
+    def test_invalid_expression_raises(self):
+        with pytest.raises(ValueError, match="expected 5 fields"):
+            CronSchedule.parse("0 17 * *")
+        with pytest.raises(ValueError, match="Invalid cron minute"):
+            CronSchedule.parse("60 17 * * *")
+
+    def test_next_after_weekdays(self):
+        """Test that a weekday schedule skips the weekend, in its timezone."""
+        schedule = CronSchedule.parse("31 17 * * 1-5", "Europe/Paris")
+
+        # Friday 2024-01-12 18:00 in Paris
+        at = datetime(2024, 1, 12, 17, 0, tzinfo=timezone.utc)
+
+        assert schedule.next_after(at) == datetime(2024, 1, 15, 17, 31, tzinfo=PARIS)
+
+    def test_next_after_is_strictly_after(self):
+        schedule = CronSchedule.parse("@hourly")
+        at = datetime(2024, 1, 12, 17, 0, tzinfo=timezone.utc)
+
+        assert schedule.next_after(at) == datetime(
+            2024, 1, 12, 18, 0, tzinfo=timezone.utc
+        )
+
+    def test_next_after_skips_nonexistent_times(self):
+        """Test that a time skipped by the switch to summer time isn't matched."""
+        schedule = CronSchedule.parse("30 2 * * *", "Europe/Paris")
+        # 02:00-03:00 doesn't exist on 2024-03-31 in Paris
+        at = datetime(2024, 3, 30, 12, 0, tzinfo=PARIS)
+
+        assert schedule.next_after(at) == datetime(2024, 4, 1, 2, 30, tzinfo=PARIS)
+
+    def test_days_or_weekdays(self):
+        """Test that, as in cron, a restricted day of month and day of week are ORed."""
+        schedule = CronSchedule.parse("0 0 1 * 1")
+
+        assert schedule.matches_day(date(2024, 2, 1))  # A Thursday
+        assert schedule.matches_day(date(2024, 2, 5))  # A Monday
+        assert not schedule.matches_day(date(2024, 2, 6))
+
+    def test_sunday_is_0_or_7(self):
+        assert CronSchedule.parse("0 0 * * 7").matches_day(date(2024, 2, 4))
+        assert CronSchedule.parse("0 0 * * 0").matches_day(date(2024, 2, 4))
+
+    def test_previous_before(self):
+        schedule = CronSchedule.parse("0 */6 * * *")
+        at = datetime(2024, 1, 12, 17, 0, tzinfo=timezone.utc)
+
+        assert schedule.previous_before(at, timedelta(hours=6)) == datetime(
+            2024, 1, 12, 12, 0, tzinfo=timezone.utc
+        )
+        assert schedule.previous_before(at, timedelta(hours=4)) is None
@@ -0,0 +1,77 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import pytest
+from utils.job_utils import Job
+from utils.schedule_utils import CronSchedule
+from utils.serve_utils import Scheduler, get_first_run_at, get_last_run_key
+from utils.state_utils import FileStateBackend
+
+
+class TestGetFirstRunAt:
+    """Test cases for the get_first_run_at function."""
+
+    schedule = CronSchedule.parse("0 * * * *")
+    now = datetime(2024, 1, 12, 17, 20, tzinfo=timezone.utc)
+
+    def test_without_last_run(self):
+        """Test that nothing is caught up on the first start."""
+        assert get_first_run_at(
+            self.schedule, self.now, None, timedelta(hours=6)
+        ) == datetime(2024, 1, 12, 18, 0, tzinfo=timezone.utc)
+
+    def test_missed_run_is_caught_up(self):
+        """Test that several missed runs are caught up with the last one."""
+        last_run_at = datetime(2024, 1, 12, 14, 0, tzinfo=timezone.utc)
+
+        assert get_first_run_at(
+            self.schedule, self.now, last_run_at, timedelta(hours=6)
+        ) == datetime(2024, 1, 12, 17, 0, tzinfo=timezone.utc)
+
+    def test_old_missed_run_is_not_caught_up(self):
+        last_run_at = datetime(2024, 1, 11, 14, 0, tzinfo=timezone.utc)
+
+        assert get_first_run_at(
+            self.schedule, self.now, last_run_at, timedelta(minutes=10)
+        ) == datetime(2024, 1, 12, 18, 0, tzinfo=timezone.utc)
+
+
+class TestScheduler:
+    """Test cases for the Scheduler class."""
+
+    def test_job_without_schedule_raises(self):
+        with pytest.raises(ValueError, match="Jobs without a schedule: a"):
+            Scheduler([Job(name="a", probe="daily_close")])
+
+    def test_no_jobs_raises(self):
+        with pytest.raises(ValueError, match="No jobs to serve"):
+            Scheduler([])
+
+    def test_catches_up_missed_run(self, tmp_path):
+        """Test that a run missed while the process was down fires on start and is stored."""
+        state_backend = FileStateBackend(str(tmp_path / "state.json"))
+        job = Job(name="a", probe="ok", params={"ticker": "CW8.PA"}, schedule="@hourly")
+        state_backend.set(
+            get_last_run_key(job),
+            (datetime.now(timezone.utc) - timedelta(hours=3)).isoformat(),
+        )
+        calls = []
+
+        async def probe_ok(ticker: str) -> str:
+            calls.append(ticker)
+            scheduler.stop()
+            return ticker
+
+        with patch("utils.serve_utils.resolve_job_function", return_value=probe_ok):
+            scheduler = Scheduler(
+                [job],
+                state_backend=state_backend,
+                metrics_path=str(tmp_path / "metrics.json"),
+            )
+        asyncio.run(scheduler.run())
+
+        assert calls == ["CW8.PA"]
+        last_run_at = datetime.fromisoformat(state_backend.get(get_last_run_key(job)))
+        assert datetime.now(timezone.utc) - last_run_at < timedelta(hours=1)
+        assert (tmp_path / "metrics.json").exists()
@@ -0,0 +1,299 @@
+import contextvars
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from urllib.parse import parse_qs
+
+import httpx
+import pytest
+from telegram.error import BadRequest, NetworkError, TimedOut
+from utils import resilience_utils
+from utils.signal_utils import (
+    TelegramClient,
+    digest_signals,
+    pack_messages,
+    send_message,
+    sink_signals,
+    split_message,
+    telegram_length,
+)
+
+
+class FakeBotApi:
+    """Local stand-in for the Telegram Bot API serving sendMessage."""
+
+    def __init__(self):
+        self.received: list[tuple[str, str, float]] = []
+        # Error responses to serve, in order, before succeeding again
+        self.failures: list[tuple[int, dict]] = []
+        # Delays before answering the next requests, in order, once they're received
+        self.delays: list[float] = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                if self.headers.get("Content-Type", "").startswith("application/json"):
+                    params = json.loads(body)
+                else:
+                    params = {k: v[0] for k, v in parse_qs(body.decode()).items()}
+                if fake.failures:
+                    status, payload = fake.failures.pop(0)
+                else:
+                    fake.received.append(
+                        (str(params["chat_id"]), params["text"], time.monotonic())
+                    )
+                    status = 200
+                    payload = {
+                        "ok": True,
+                        "result": {
+                            "message_id": len(fake.received),
+                            "date": 0,
+                            "chat": {"id": int(params["chat_id"]), "type": "private"},
+                            "text": params["text"],
+                        },
+                    }
+                if fake.delays:
+                    time.sleep(fake.delays.pop(0))
+                response = json.dumps(payload).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(response)))
+                    self.end_headers()
+                    self.wfile.write(response)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client timed out
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}/bot"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def bot_api():
+    fake = FakeBotApi()
+    yield fake
+    fake.close()
+
+
+class TestTelegramClient:
+    """Test cases for the TelegramClient class against a local fake Bot API."""
+
+    def test_send_messages_keeps_order_per_chat(self, bot_api):
+        with TelegramClient(
+            "token", base_url=bot_api.base_url, per_chat_interval_s=0
+        ) as client:
+            results = client.send_messages(
+                [("1", "a1"), ("2", "b1"), ("1", "a2"), ("1", "a3")]
+            )
+
+        assert [r.text for r in results] == ["a1", "b1", "a2", "a3"]
+        chat_1 = [text for chat_id, text, _ in bot_api.received if chat_id == "1"]
+        assert chat_1 == ["a1", "a2", "a3"]
+
+    def test_messages_to_a_chat_are_spaced(self, bot_api):
+        with TelegramClient(
+            "token", base_url=bot_api.base_url, per_chat_interval_s=0.2
+        ) as client:
+            client.send_messages([("1", "a1"), ("1", "a2"), ("2", "b1")])
+
+        sent_at = {text: at for _, text, at in bot_api.received}
+        assert sent_at["a2"] - sent_at["a1"] >= 0.2
+        # Other chats aren't held back
+        assert sent_at["b1"] < sent_at["a2"]
+
+    def test_flood_control_is_retried_after_requested_delay(self, bot_api):
+        bot_api.failures = [
+            (
+                429,
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": "Too Many Requests: retry after 1",
+                    "parameters": {"retry_after": 1},
+                },
+            )
+        ]
+        with TelegramClient(
+            "token", base_url=bot_api.base_url, per_chat_interval_s=0
+        ) as client:
+            start = time.monotonic()
+            message = client.send_message("1", "hello")
+
+        assert message.text == "hello"
+        assert time.monotonic() - start >= 1
+
+    def test_bad_request_is_not_retried(self, bot_api):
+        bot_api.failures = [
+            (400, {"ok": False, "error_code": 400, "description": "Bad Request"})
+        ]
+        with TelegramClient(
+            "token", base_url=bot_api.base_url, per_chat_interval_s=0
+        ) as client:
+            results = client.send_messages([("1", "bad"), ("1", "good")])
+
+        assert isinstance(results[0], BadRequest)
+        assert results[1].text == "good"
+        assert [text for _, text, _ in bot_api.received] == ["good"]
+
+    def test_read_timeout_is_not_retried(self, bot_api, monkeypatch):
+        """Test that a message possibly delivered already isn't sent again."""
+        host = bot_api.base_url.split("/")[2]
+        monkeypatch.setitem(
+            resilience_utils.HOST_POLICIES,
+            host,
+            resilience_utils.HostPolicy(timeout_s=0.2),
+        )
+        bot_api.delays = [1.0]
+        with TelegramClient(
+            "token", base_url=bot_api.base_url, per_chat_interval_s=0
+        ) as client:
+            results = client.send_messages([("1", "hello")])
+
+        assert isinstance(results[0], TimedOut)
+        assert [text for _, text, _ in bot_api.received] == ["hello"]
+
+    @patch("utils.signal_utils.backoff_s", return_value=0)
+    def test_refused_connection_is_retried(self, mock_backoff_s, bot_api):
+        with TelegramClient(
+            "token", base_url=bot_api.base_url, per_chat_interval_s=0
+        ) as client:
+            bot = client._bot
+            attempts = []
+
+            class FlakyBot:
+                async def send_message(self, **kwargs):
+                    attempts.append(kwargs)
+                    if len(attempts) == 1:
+                        raise NetworkError(
+                            "httpx.ConnectError"
+                        ) from httpx.ConnectError("Connection refused")
+                    return await bot.send_message(**kwargs)
+
+            with patch.object(client, "_bot", FlakyBot()):
+                message = client.send_message("1", "hello")
+
+        assert message.text == "hello"
+        assert len(attempts) == 2
+
+
+class TestPackMessages:
+    """Test cases for the message splitting and packing helpers."""
+
+    def test_emoji_count_twice(self):
+        assert telegram_length("🔼 up") == 5
+
+    def test_split_at_line_breaks(self):
+        parts = split_message("aaaa\nbbbb\ncccc", max_length=9)
+
+        assert parts == ["aaaa\nbbbb", "cccc"]
+
+    def test_overlong_line_is_cut(self):
+        parts = split_message("🔼" * 5, max_length=4)
+
+        assert parts == ["🔼🔼", "🔼🔼", "🔼"]
+        assert all(telegram_length(part) <= 4 for part in parts)
+
+    def test_messages_are_coalesced_within_the_limit(self):
+        packed = pack_messages(["a" * 40, "b" * 40, "c" * 40], max_length=100)
+
+        assert packed == [f"{'a' * 40}\n\n{'b' * 40}", "c" * 40]
+
+
+class TestDigestSignals:
+    """Test cases for the digest mode against a local fake Bot API."""
+
+    @pytest.fixture
+    def client(self, bot_api):
+        client = TelegramClient(
+            "token", base_url=bot_api.base_url, per_chat_interval_s=0
+        )
+        with patch("utils.signal_utils.get_telegram_client", return_value=client):
+            yield client
+        client.close()
+
+    def test_signals_are_coalesced_per_chat(self, bot_api, client):
+        with digest_signals():
+            send_message("1", "a1", "token")
+            send_message("2", "b1", "token")
+            send_message("1", "a2", "token")
+            assert bot_api.received == []
+
+        received = sorted((chat_id, text) for chat_id, text, _ in bot_api.received)
+        assert received == [("1", "a1\n\na2"), ("2", "b1")]
+
+    def test_urgent_signal_bypasses_the_digest(self, bot_api, client):
+        with digest_signals():
+            send_message("1", "routine", "token")
+            send_message("1", "state change", "token", urgent=True)
+            assert [text for _, text, _ in bot_api.received] == ["state change"]
+
+        assert [text for _, text, _ in bot_api.received] == ["state change", "routine"]
+
+    def test_digest_is_local_to_its_context(self, bot_api, client):
+        """Test that a run outside of the digest's context, e.g. a concurrent one, sends its signals itself."""
+        outside = contextvars.copy_context()
+        with digest_signals():
+            outside.run(send_message, "1", "outside", "token")
+            send_message("1", "inside", "token")
+            assert [text for _, text, _ in bot_api.received] == ["outside"]
+
+        assert [text for _, text, _ in bot_api.received] == ["outside", "inside"]
+
+    def test_overlong_urgent_signal_is_split(self, bot_api, client):
+        message = "\n".join(["a" * 3000, "b" * 3000])
+        with digest_signals():
+            send_message("1", message, "token", urgent=True)
+
+        assert [text for _, text, _ in bot_api.received] == ["a" * 3000, "b" * 3000]
+
+    def test_each_token_logs_its_own_signal_count(self, caplog):
+        with (
+            patch("utils.signal_utils.get_telegram_client") as mock_get_client,
+            caplog.at_level(logging.INFO, logger="utils.signal_utils"),
+        ):
+            mock_get_client.return_value.send_messages.return_value = []
+            with digest_signals():
+                send_message("1", "a1", "token-a")
+                send_message("1", "a2", "token-a")
+                send_message("1", "b1", "token-b")
+
+        assert [r.message for r in caplog.records if "digest" in r.message] == [
+            "Sending a digest of 2 signal(s) in 1 message(s)",
+            "Sending a digest of 1 signal(s) in 1 message(s)",
+        ]
+
+
+class TestSinkSignals:
+    """Test cases for the sink capturing the signals instead of sending them."""
+
+    def test_signals_are_captured(self, bot_api):
+        client = TelegramClient(
+            "token", base_url=bot_api.base_url, per_chat_interval_s=0
+        )
+        with (
+            patch("utils.signal_utils.get_telegram_client", return_value=client),
+            digest_signals(),
+            sink_signals() as sink,
+        ):
+            send_message("1", "routine", "token")
+            send_message("1", "state change", "token", urgent=True)
+        client.close()
+
+        assert [(s.chat_id, s.text, s.urgent) for s in sink.signals] == [
+            ("1", "routine", False),
+            ("1", "state change", True),
+        ]
+        assert bot_api.received == []
@@ -1,18 +1,26 @@
 # Tests generated by Claude Sonnet 4
 
-from datetime import date
+from datetime import date, datetime
 from unittest.mock import patch
+from zoneinfo import ZoneInfo
 
 import pandas as pd
+import polars as pl
 import pytest
-
-from signals.probes.sma_crossover.run import (
+from probes.sma_crossover.run import (
     get_is_market_open,
     get_latest_price_and_sma,
+    get_latest_prices_and_smas,
     get_raw_ohlcv,
+    get_state_key,
     sma_crossover,
     update_state,
 )
+from utils.clock_utils import frozen_clock
+from utils.market_data_utils import OHLCV_SCHEMA
+from utils.resilience_utils import TransientError
+from utils.sma_utils import SmaAccumulator
+from utils.state_utils import get_state_backend
 
 
 class TestUpdateState:
@@ -201,7 +209,7 @@ class TestUpdateState:
 class TestGetRawOhlcv:
     """Test cases for the get_raw_ohlcv function with mocked yf.download."""
 
-    @patch("signals.probes.sma_crossover.run.yf.download")
+    @patch("utils.market_data_utils.yf.download")
     def test_get_raw_ohlcv_success(self, mock_download):
         """Test successful data retrieval from yfinance."""
         # Mock data that yfinance would return
@@ -225,20 +233,20 @@ class TestGetRawOhlcv:
         mock_download.assert_called_once()
         call_args = mock_download.call_args
         assert call_args[1]["interval"] == "1d"
-        assert "AAPL" in call_args[0]
+        assert call_args[0][0] == ["AAPL"]
 
         # Verify the result has the expected structure
         assert "Date" in result.columns
         assert "Close" in result.columns
         assert len(result) == 3
 
-    @patch("signals.probes.sma_crossover.run.yf.download")
+    @patch("utils.market_data_utils.yf.download")
     def test_get_raw_ohlcv_failure(self, mock_download):
         """Test handling of yfinance download failure."""
         mock_download.return_value = None
 
         with pytest.raises(
-            ValueError, match="Ticker download from Yahoo Finance failed"
+            TransientError, match="Ticker download from Yahoo Finance failed"
         ):
             get_raw_ohlcv("INVALID", 30, "America/New_York")
 
@@ -246,33 +254,29 @@ class TestGetRawOhlcv:
 class TestGetIsMarketOpen:
     """Test cases for the get_is_market_open function."""
 
-    @patch("signals.probes.sma_crossover.run.datetime")
-    def test_market_open_normal_hours(self, mock_datetime):
+    def test_market_open_normal_hours(self):
         """Test market open during normal trading hours."""
-        # Mock current time to be 10:30 AM
-        mock_datetime.now.return_value.strftime.return_value = "10:30"
-
-        result = get_is_market_open("09:00", "16:30", "America/New_York")
+        with frozen_clock(
+            datetime(2024, 1, 10, 10, 30, tzinfo=ZoneInfo("America/New_York"))
+        ):
+            result = get_is_market_open("09:00", "16:30", "America/New_York")
 
         assert result is True
 
-    @patch("signals.probes.sma_crossover.run.datetime")
-    def test_market_closed_normal_hours(self, mock_datetime):
+    def test_market_closed_normal_hours(self):
         """Test market closed outside normal trading hours."""
-        # Mock current time to be 8:00 AM (before market open)
-        mock_datetime.now.return_value.strftime.return_value = "08:00"
-
-        result = get_is_market_open("09:00", "16:30", "America/New_York")
+        # Before market open
+        with frozen_clock(
+            datetime(2024, 1, 10, 8, 0, tzinfo=ZoneInfo("America/New_York"))
+        ):
+            result = get_is_market_open("09:00", "16:30", "America/New_York")
 
         assert result is False
 
-    @patch("signals.probes.sma_crossover.run.datetime")
-    def test_market_open_crossing_midnight(self, mock_datetime):
+    def test_market_open_crossing_midnight(self):
         """Test market open when trading hours cross midnight."""
-        # Mock current time to be 22:00 (10:00 PM)
-        mock_datetime.now.return_value.strftime.return_value = "22:00"
-
-        result = get_is_market_open("20:00", "16:30", "Asia/Tokyo")
+        with frozen_clock(datetime(2024, 1, 10, 22, 0, tzinfo=ZoneInfo("Asia/Tokyo"))):
+            result = get_is_market_open("20:00", "16:30", "Asia/Tokyo")
 
         assert result is True
 
@@ -280,7 +284,7 @@ class TestGetIsMarketOpen:
 class TestGetLatestPriceAndSma:
     """Test cases for the get_latest_price_and_sma function."""
 
-    @patch("signals.probes.sma_crossover.run.get_is_market_open")
+    @patch("probes.sma_crossover.run.get_is_market_open")
     def test_get_latest_price_and_sma_market_closed(self, mock_market_open):
         """Test SMA calculation when market is closed."""
         mock_market_open.return_value = False
@@ -305,14 +309,29 @@ class TestGetLatestPriceAndSma:
         assert latest_sma == 107.0  # SMA of last 5 prices: (105+106+107+108+109)/5
         assert isinstance(latest_date, date)
 
-    @patch("signals.probes.sma_crossover.run.get_is_market_open")
-    @patch("signals.probes.sma_crossover.run.datetime")
-    def test_get_latest_price_and_sma_market_open(
-        self, mock_datetime, mock_market_open
-    ):
+    @patch("probes.sma_crossover.run.get_is_market_open")
+    def test_unsorted_bars_are_sorted_by_date(self, mock_market_open):
+        """Test that the SMA is taken over the latest bars whatever the order of the source."""
+        mock_market_open.return_value = False
+        test_data = pd.DataFrame(
+            {
+                "Date": pd.date_range("2024-01-01", periods=10, freq="D")[::-1],
+                "Close": [109 - i for i in range(10)],
+            }
+        )
+
+        latest_close, latest_sma, latest_date = get_latest_price_and_sma(
+            test_data, 5, "09:00", "16:30", "America/New_York"
+        )
+
+        assert latest_close == 109
+        assert latest_sma == 107.0
+        assert latest_date == date(2024, 1, 10)
+
+    @patch("probes.sma_crossover.run.get_is_market_open")
+    def test_get_latest_price_and_sma_market_open(self, mock_market_open):
         """Test SMA calculation when market is open (excludes current day)."""
         mock_market_open.return_value = True
-        mock_datetime.now.return_value.date.return_value = date(2024, 1, 10)
 
         # Create test data including current day
         test_data = pd.DataFrame(
@@ -326,9 +345,12 @@ class TestGetLatestPriceAndSma:
             }
         )
 
-        latest_close, latest_sma, latest_date = get_latest_price_and_sma(
-            test_data, 5, "09:00", "16:30", "America/New_York"
-        )
+        with frozen_clock(
+            datetime(2024, 1, 10, 12, 0, tzinfo=ZoneInfo("America/New_York"))
+        ):
+            latest_close, latest_sma, latest_date = get_latest_price_and_sma(
+                test_data, 5, "09:00", "16:30", "America/New_York"
+            )
 
         # Should exclude current day (2024-01-10), so last price is 108
         assert latest_close == 108
@@ -354,14 +376,123 @@ class TestGetLatestPriceAndSma:
             get_latest_price_and_sma(test_data, 5, "09:00", "16:30", "America/New_York")
 
 
+class TestGetLatestPricesAndSmas:
+    """Test cases for the get_latest_prices_and_smas function."""
+
+    @patch("probes.sma_crossover.run.get_is_market_open")
+    def test_grouped_smas_match_rolling_mean(self, mock_market_open):
+        """Test that the grouped pass gives each pair the SMA of its ticker's history."""
+        mock_market_open.return_value = False
+        ohlcv_by_ticker = {
+            ticker: pd.DataFrame(
+                {
+                    "Date": pd.date_range("2024-01-01", periods=n_bars, freq="D"),
+                    "Close": [100 + i * step for i in range(n_bars)],
+                }
+            )
+            for ticker, n_bars, step in [("A", 30, 1.0), ("B", 12, -0.5)]
+        }
+
+        results = get_latest_prices_and_smas(
+            ohlcv_by_ticker, [5, 20], "09:00", "16:30", "America/New_York"
+        )
+
+        for ticker in ["A", "B"]:
+            closes = ohlcv_by_ticker[ticker]["Close"]
+            latest_close, latest_sma, latest_date = results[(ticker, 5)]
+            assert latest_close == closes.iloc[-1]
+            assert latest_sma == pytest.approx(closes.tail(5).mean())
+            assert latest_date == date(2024, 1, len(closes))
+        assert results[("A", 20)][1] == pytest.approx(
+            ohlcv_by_ticker["A"]["Close"].tail(20).mean()
+        )
+        # B only has 12 bars
+        assert isinstance(results[("B", 20)], ValueError)
+
+    @patch("probes.sma_crossover.run.get_is_market_open")
+    def test_bars_after_last_session_are_left_out(self, mock_market_open):
+        """Test that the exchange's last completed session replaces the trading hours check."""
+        ohlcv = pd.DataFrame(
+            {
+                "Date": pd.date_range("2024-01-01", periods=10, freq="D"),
+                "Close": [100 + i for i in range(10)],
+            }
+        )
+
+        results = get_latest_prices_and_smas(
+            {"A": ohlcv},
+            [5],
+            "09:00",
+            "16:30",
+            "America/New_York",
+            last_session=date(2024, 1, 8),
+        )
+
+        mock_market_open.assert_not_called()
+        assert results[("A", 5)] == (107, 105.0, date(2024, 1, 8))
+
+    @patch("probes.sma_crossover.run.get_is_market_open")
+    def test_accumulators_only_read_the_new_bars(self, mock_market_open):
+        """Test that the bars before the last accumulated one aren't read."""
+        mock_market_open.return_value = False
+        accumulator = SmaAccumulator(
+            5, window=[103, 104, 105, 106, 107], total=525, last_date=date(2024, 1, 8)
+        )
+        # The bars before Jan 8th are wrong, they would spoil the SMA if read
+        ohlcv = pl.DataFrame(
+            {
+                "Date": pl.date_range(date(2024, 1, 1), date(2024, 1, 10), eager=True),
+                "Close": [0.0] * 7 + [107.0, 108.0, 109.0],
+            }
+        )
+
+        results = get_latest_prices_and_smas(
+            {"A": ohlcv.lazy()},
+            [5],
+            "09:00",
+            "16:30",
+            "America/New_York",
+            {("A", 5): accumulator},
+        )
+
+        assert results[("A", 5)] == (109.0, 107.0, date(2024, 1, 10))
+        assert accumulator.last_date == date(2024, 1, 10)
+
+    @patch("probes.sma_crossover.run.get_is_market_open")
+    def test_restated_accumulator_reads_the_trailing_window(self, mock_market_open):
+        """Test that an accumulator whose last close changed is recomputed from the history."""
+        mock_market_open.return_value = False
+        accumulator = SmaAccumulator(
+            5, window=[206, 208, 210, 212, 214], total=1050, last_date=date(2024, 1, 8)
+        )
+        # 2:1 split since the last run
+        ohlcv = pl.DataFrame(
+            {
+                "Date": pl.date_range(date(2024, 1, 1), date(2024, 1, 10), eager=True),
+                "Close": [100.0 + i for i in range(10)],
+            }
+        )
+
+        results = get_latest_prices_and_smas(
+            {"A": ohlcv},
+            [5],
+            "09:00",
+            "16:30",
+            "America/New_York",
+            {("A", 5): accumulator},
+        )
+
+        assert results[("A", 5)] == (109.0, 107.0, date(2024, 1, 10))
+
+
 class TestSmaCrossoverIntegration:
     """Integration tests for the main sma_crossover function."""
 
-    @patch("signals.probes.sma_crossover.run.send_message")
-    @patch("signals.probes.sma_crossover.run.os.getenv")
-    @patch("signals.probes.sma_crossover.run.get_raw_ohlcv")
+    @patch("probes.sma_crossover.run.send_message")
+    @patch("probes.sma_crossover.run.os.getenv")
+    @patch("probes.sma_crossover.run.get_market_data_provider")
     def test_sma_crossover_state_change(
-        self, mock_get_raw, mock_getenv, mock_send_message
+        self, mock_get_provider, mock_getenv, mock_send_message
     ):
         """Test complete sma_crossover function with state change."""
         # Mock environment variables
@@ -392,19 +523,19 @@ class TestSmaCrossoverIntegration:
                 "Volume": [1000000] * 10,
             }
         )
-        mock_get_raw.return_value = test_data
+        mock_get_provider.return_value.get_ohlcv.return_value = {"AAPL": test_data}
 
         # Capture the printed state
         with patch("builtins.print") as mock_print:
             sma_crossover(
-                ticker="AAPL",
-                lookback=5,
+                tickers=["AAPL"],
+                lookbacks="5",
                 trading_hours_open="09:00",
                 trading_hours_close="16:30",
                 timezone="America/New_York",
                 upward_tolerance=2.0,
                 downward_tolerance=2.0,
-                previous_state="neutral",
+                previous_state=["neutral"],
             )
 
         # Verify send_message was called
@@ -412,3 +543,120 @@ class TestSmaCrossoverIntegration:
 
         # Verify the state was printed
         mock_print.assert_called_once()
+
+    @patch("probes.sma_crossover.run.send_message")
+    @patch("probes.sma_crossover.run.os.getenv")
+    @patch("probes.sma_crossover.run.get_market_data_provider")
+    def test_sma_crossover_reads_and_writes_state_store(
+        self, mock_get_provider, mock_getenv, mock_send_message, tmp_path
+    ):
+        """Test that the previous state comes from, and the new one goes to, the state store."""
+        mock_getenv.side_effect = lambda key: {
+            "TELEGRAM_CHAT_ID": "test_chat_id",
+            "TELEGRAM_BOT_TOKEN": "test_token",
+        }.get(key)
+        mock_get_provider.return_value.get_ohlcv.return_value = {
+            "AAPL": pd.DataFrame(
+                {
+                    "Date": pd.date_range("2024-01-01", periods=10, freq="D"),
+                    "Close": [110, 109, 108, 107, 106, 105, 104, 103, 102, 100],
+                }
+            )
+        }
+        state_url = f"sqlite://{tmp_path / 'state.db'}"
+        state_key = get_state_key("AAPL", 5, 2.0, 2.0)
+        state_backend = get_state_backend(state_url)
+        state_backend.set(state_key, "above")
+
+        states = sma_crossover(
+            tickers=["AAPL"],
+            lookbacks="5",
+            trading_hours_open="09:00",
+            trading_hours_close="16:30",
+            timezone="America/New_York",
+            upward_tolerance=2.0,
+            downward_tolerance=2.0,
+            state_url=state_url,
+        )
+
+        assert states == ["below"]
+        assert (
+            "State changed from above to below"
+            in mock_send_message.call_args.kwargs["message"]
+        )
+        assert state_backend.get(state_key) == "below"
+        state_backend.close()
+
+    @patch("probes.sma_crossover.run.send_message")
+    @patch("probes.sma_crossover.run.os.getenv")
+    @patch("probes.sma_crossover.run.get_market_data_provider")
+    def test_sma_crossover_multiple_tickers_and_lookbacks(
+        self, mock_get_provider, mock_getenv, mock_send_message, capsys
+    ):
+        """Test that all the tickers are fetched in one download and all the pairs are reported together."""
+        mock_getenv.side_effect = lambda key: {
+            "TELEGRAM_CHAT_ID": "test_chat_id",
+            "TELEGRAM_BOT_TOKEN": "test_token",
+        }.get(key)
+        rising = pd.DataFrame(
+            {
+                "Date": pd.date_range("2024-01-01", periods=10, freq="D"),
+                "Close": [100 + i for i in range(10)],
+            }
+        )
+        falling = rising.assign(Close=rising["Close"][::-1].values)
+
+        mock_get_ohlcv = mock_get_provider.return_value.get_ohlcv
+        mock_get_ohlcv.return_value = {
+            "AAPL": rising,
+            "MSFT": falling,
+            "BAD": pl.DataFrame(schema=OHLCV_SCHEMA),
+        }
+
+        states = sma_crossover(
+            tickers=["AAPL", "MSFT", "BAD"],
+            lookbacks="3,5",
+            trading_hours_open="09:00",
+            trading_hours_close="16:30",
+            timezone="America/New_York",
+            previous_state=["neutral", "below", "neutral", "neutral", "above", "below"],
+        )
+
+        mock_get_ohlcv.assert_called_once()
+        assert mock_get_ohlcv.call_args.args[0] == ["AAPL", "MSFT", "BAD"]
+        assert states == ["above", "above", "below", "below", "above", "below"]
+        assert capsys.readouterr().out.splitlines() == states
+        mock_send_message.assert_called_once()
+        message = mock_send_message.call_args.kwargs["message"]
+        assert "[MSFT, SMA3 crossover, 0/0%]" in message
+        assert "[BAD, SMA5 crossover]: error" in message
+
+    @patch("probes.sma_crossover.run.send_message")
+    @patch("probes.sma_crossover.run.os.getenv")
+    @patch("probes.sma_crossover.run.get_market_data_provider")
+    def test_sma_crossover_download_failure_is_reported_per_pair(
+        self, mock_get_provider, mock_getenv, mock_send_message
+    ):
+        """Test that the failure of the grouped download is reported for every pair, keeping their states."""
+        mock_getenv.side_effect = lambda key: {
+            "TELEGRAM_CHAT_ID": "test_chat_id",
+            "TELEGRAM_BOT_TOKEN": "test_token",
+        }.get(key)
+        mock_get_provider.return_value.get_ohlcv.side_effect = TransientError(
+            "Ticker download from Yahoo Finance failed"
+        )
+
+        with patch("builtins.print"):
+            states = sma_crossover(
+                tickers=["AAPL", "MSFT"],
+                lookbacks="5",
+                trading_hours_open="09:00",
+                trading_hours_close="16:30",
+                timezone="America/New_York",
+                previous_state=["above", "below"],
+            )
+
+        assert states == ["above", "below"]
+        message = mock_send_message.call_args.kwargs["message"]
+        assert "[AAPL, SMA5 crossover]: error" in message
+        assert "[MSFT, SMA5 crossover]: error" in message
@@ -0,0 +1,138 @@
+from datetime import date, datetime, timedelta
+from unittest.mock import patch
+
+import numpy as np
+import polars as pl
+import pytest
+from probes.sma_crossover.run import update_state
+from probes.sma_crossover_backtest.run import (
+    STATE_CODES,
+    backtest_sma_crossover,
+    backtest_states,
+    parse_grid,
+    sma_crossover_backtest,
+)
+
+
+def random_walk(n_bars: int, seed: int = 0) -> pl.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pl.DataFrame(
+        {
+            "Date": [datetime(2000, 1, 1) + timedelta(days=i) for i in range(n_bars)],
+            "Close": 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n_bars))),
+        }
+    )
+
+
+def replay_update_state(close, sma, upward_tolerance, downward_tolerance, state):
+    states = []
+    for price, price_sma in zip(close, sma):
+        state = update_state(
+            price, price_sma, upward_tolerance, downward_tolerance, state
+        )
+        states.append(STATE_CODES[state])
+    return states
+
+
+class TestBacktestStates:
+    """Test cases for the backtest_states function."""
+
+    @pytest.mark.parametrize("previous_state", ["neutral", "above", "below"])
+    def test_matches_update_state_replay(self, previous_state):
+        """Test that the vectorized replay matches calling update_state bar by bar."""
+        ohlcv = random_walk(2000).with_columns(
+            pl.col("Close").rolling_mean(window_size=20).alias("SMA")
+        )
+        ohlcv = ohlcv.drop_nulls()
+        close, sma = ohlcv["Close"].to_numpy(), ohlcv["SMA"].to_numpy()
+        upward_tolerances = np.array([0.0, 0.5, 1.0, 3.0])
+        downward_tolerances = np.array([0.0, 2.0, 0.5, 3.0])
+
+        states = backtest_states(
+            close, sma, upward_tolerances, downward_tolerances, previous_state
+        )
+
+        for i, (up, down) in enumerate(zip(upward_tolerances, downward_tolerances)):
+            expected = replay_update_state(close, sma, up, down, previous_state)
+            assert states[i].tolist() == expected
+
+    def test_exact_lower_band_keeps_neutral_but_leaves_above(self):
+        """Test the boundary asymmetry of update_state at the lower band."""
+        close = np.array([98.0])
+        sma = np.array([100.0])
+
+        neutral = backtest_states(close, sma, np.array([2.0]), np.array([2.0]))
+        above = backtest_states(
+            close, sma, np.array([2.0]), np.array([2.0]), previous_state="above"
+        )
+
+        assert neutral.tolist() == [[STATE_CODES["neutral"]]]
+        assert above.tolist() == [[STATE_CODES["below"]]]
+
+    def test_negative_tolerance_raises(self):
+        with pytest.raises(ValueError, match="must be non-negative"):
+            backtest_states(
+                np.array([1.0]), np.array([1.0]), np.array([-1.0]), np.array([0.0])
+            )
+
+
+class TestBacktestSmaCrossover:
+    """Test cases for the backtest_sma_crossover function."""
+
+    def test_one_row_per_combination(self):
+        results = backtest_sma_crossover(
+            random_walk(500), [10, 50], [0.0, 1.0], [0.0, 1.0, 2.0]
+        )
+
+        assert results.height == 2 * 2 * 3
+        assert (results["signal_count"] == results["signal_dates"].list.len()).all()
+        # Wider bands can only filter out signals
+        counts = results.filter(pl.col("lookback") == 10)["signal_count"].to_list()
+        assert counts[0] >= counts[-1]
+
+    def test_signal_dates_are_state_changes(self):
+        ohlcv = pl.DataFrame(
+            {
+                "Date": [date(2024, 1, d) for d in range(1, 7)],
+                "Close": [100.0, 100.0, 110.0, 110.0, 90.0, 90.0],
+            }
+        )
+
+        results = backtest_sma_crossover(ohlcv, [2], [0.0], [0.0])
+
+        # SMA2 = -, 100, 105, 110, 100, 90: the state is neutral, then above on the 3rd,
+        # then below on the 4th since the close doesn't exceed the SMA anymore
+        assert results["signal_dates"][0].to_list() == [
+            date(2024, 1, 3),
+            date(2024, 1, 4),
+        ]
+        assert results["final_state"][0] == "below"
+
+
+class TestParseGrid:
+    """Test cases for the parse_grid function."""
+
+    def test_values_and_ranges(self):
+        assert parse_grid("0,0.5,1:3:1") == [0.0, 0.5, 1.0, 2.0, 3.0]
+
+
+class TestSmaCrossoverBacktestIntegration:
+    """Integration tests for the main sma_crossover_backtest function."""
+
+    @patch("probes.sma_crossover_backtest.run.download_ohlcv")
+    def test_writes_results(self, mock_download, tmp_path):
+        mock_download.return_value = random_walk(300)
+        output = tmp_path / "signals.parquet"
+
+        results = sma_crossover_backtest(
+            ticker="CW8.PA",
+            lookbacks="20,50",
+            upward_tolerances="0:2:1",
+            downward_tolerances="1",
+            start="2000-01-01",
+            output=str(output),
+        )
+
+        mock_download.assert_called_once_with("CW8.PA", date(2000, 1, 1))
+        assert results.height == 6
+        assert pl.read_parquet(output).equals(results)
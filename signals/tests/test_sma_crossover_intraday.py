@@ -0,0 +1,281 @@
+from datetime import date
+from unittest.mock import patch
+
+import polars as pl
+import pytest
+from probes.sma_crossover.run import get_state_key
+from probes.sma_crossover_intraday.run import (
+    evaluate_tick,
+    get_daily_smas,
+    sma_crossover_intraday,
+)
+from utils.market_data_utils import MarketDataProvider
+from utils.resilience_utils import CircuitOpenError
+from utils.sma_utils import SmaAccumulator
+from utils.state_utils import get_state_backend
+
+
+class FakeProvider(MarketDataProvider):
+    """Live prices served from a list of ticks, one per poll."""
+
+    def __init__(self, ticks: list[dict[str, float] | Exception]):
+        self.ticks = iter(ticks)
+
+    def get_ohlcv(self, tickers, start):
+        raise AssertionError("The history shouldn't be fetched")
+
+    def get_latest_prices(self, tickers):
+        tick = next(self.ticks)
+        if isinstance(tick, Exception):
+            raise tick
+        return tick
+
+
+def make_accumulator(lookback: int, closes: list[float], last_date: date):
+    return SmaAccumulator(
+        lookback, window=closes, total=sum(closes), last_date=last_date
+    )
+
+
+class TestEvaluateTick:
+    """Test cases for the evaluate_tick function."""
+
+    def test_only_crossings_of_the_tolerance_bands_are_returned(self):
+        smas = {("CW8.PA", 50): 100.0, ("CW8.PA", 200): 90.0, ("ESE.PA", 50): 20.0}
+        states = {
+            ("CW8.PA", 50): "below",
+            ("CW8.PA", 200): "above",
+            ("ESE.PA", 50): "neutral",
+        }
+
+        changes = evaluate_tick({"CW8.PA": 102.0}, smas, states, 1.0, 1.0)
+
+        # ESE.PA has no price in this tick
+        assert changes == {("CW8.PA", 50): "above"}
+
+    def test_hysteresis_band_holds_the_state(self):
+        smas = {("CW8.PA", 50): 100.0}
+
+        changes = evaluate_tick(
+            {"CW8.PA": 100.5}, smas, {("CW8.PA", 50): "below"}, 1.0, 1.0
+        )
+
+        assert changes == {}
+
+
+class TestGetDailySmas:
+    """Test cases for the get_daily_smas function."""
+
+    @patch("probes.sma_crossover_intraday.run.get_raw_ohlcv_by_ticker")
+    def test_up_to_date_stored_smas_are_reused(self, mock_get_raw):
+        last_session = date(2024, 1, 9)
+        accumulators = {
+            ("CW8.PA", 2): make_accumulator(2, [100.0, 102.0], last_session),
+        }
+
+        smas = get_daily_smas(
+            ["CW8.PA"],
+            [2],
+            "09:00",
+            "17:30",
+            "Europe/Paris",
+            stored_accumulators=accumulators,
+            last_session=last_session,
+        )
+
+        assert smas == {("CW8.PA", 2): 101.0}
+        mock_get_raw.assert_not_called()
+
+    @patch("probes.sma_crossover_intraday.run.get_raw_ohlcv_by_ticker")
+    def test_stale_stored_smas_are_recomputed(self, mock_get_raw):
+        mock_get_raw.return_value = (
+            {
+                "CW8.PA": pl.DataFrame(
+                    {
+                        "Date": [date(2024, 1, 8), date(2024, 1, 9), date(2024, 1, 10)],
+                        "Close": [100.0, 104.0, 110.0],
+                    }
+                )
+            },
+            {},
+        )
+        accumulators = {
+            ("CW8.PA", 2): make_accumulator(2, [100.0, 102.0], date(2024, 1, 5)),
+        }
+
+        smas = get_daily_smas(
+            ["CW8.PA"],
+            [2],
+            "09:00",
+            "17:30",
+            "Europe/Paris",
+            stored_accumulators=accumulators,
+            last_session=date(2024, 1, 9),
+        )
+
+        # The bar of the current session is left out
+        assert smas == {("CW8.PA", 2): 102.0}
+
+
+class TestSmaCrossoverIntraday:
+    """Integration tests for the main sma_crossover_intraday function."""
+
+    @pytest.fixture(autouse=True)
+    def telegram_env(self, monkeypatch):
+        monkeypatch.setenv("TELEGRAM_CHAT_ID", "test_chat_id")
+        monkeypatch.setenv("TELEGRAM_BOT_TOKEN", "test_token")
+
+    @patch("probes.sma_crossover_intraday.run.send_message")
+    @patch(
+        "probes.sma_crossover_intraday.run.get_is_market_open",
+        return_value=True,
+    )
+    @patch("probes.sma_crossover_intraday.run.get_daily_smas")
+    def test_signals_each_crossing_once(
+        self, mock_get_smas, mock_is_open, mock_send_message, tmp_path
+    ):
+        """Test that only the ticks changing a state are signaled, and the states stored."""
+        mock_get_smas.return_value = {("CW8.PA", 50): 100.0}
+        state_url = f"sqlite://{tmp_path / 'state.db'}"
+        provider = FakeProvider(
+            [{"CW8.PA": 98.0}, {"CW8.PA": 102.0}, {"CW8.PA": 103.0}]
+        )
+
+        with (
+            patch(
+                "probes.sma_crossover_intraday.run.get_market_data_provider",
+                return_value=provider,
+            ),
+            patch("builtins.print"),
+        ):
+            states = sma_crossover_intraday(
+                tickers=["CW8.PA"],
+                lookbacks="50",
+                trading_hours_open="09:00",
+                trading_hours_close="17:30",
+                timezone="Europe/Paris",
+                upward_tolerance=1.0,
+                downward_tolerance=1.0,
+                poll_interval=0,
+                max_polls=3,
+                state_url=state_url,
+            )
+
+        assert states == ["above"]
+        # neutral -> below at the first tick, below -> above at the second one
+        assert mock_send_message.call_count == 2
+        assert (
+            "State changed from below to above"
+            in (mock_send_message.call_args.kwargs["message"])
+        )
+        state_backend = get_state_backend(state_url)
+        assert state_backend.get(get_state_key("CW8.PA", 50, 1.0, 1.0)) == "above"
+        state_backend.close()
+
+    @patch("probes.sma_crossover_intraday.run.send_message")
+    @patch(
+        "probes.sma_crossover_intraday.run.get_is_market_open",
+        return_value=True,
+    )
+    @patch("probes.sma_crossover_intraday.run.get_daily_smas")
+    def test_missing_prices_and_failed_polls_are_skipped(
+        self, mock_get_smas, mock_is_open, mock_send_message
+    ):
+        """Test that a ticker without a price or a failed poll doesn't stop the others' polls."""
+        mock_get_smas.return_value = {("CW8.PA", 50): 100.0, ("ESE.PA", 50): 20.0}
+        provider = FakeProvider(
+            [
+                {"ESE.PA": 21.0},
+                CircuitOpenError("query2.finance.yahoo.com failed 5 times in a row"),
+                {"CW8.PA": 98.0},
+            ]
+        )
+
+        with (
+            patch(
+                "probes.sma_crossover_intraday.run.get_market_data_provider",
+                return_value=provider,
+            ),
+            patch("builtins.print"),
+        ):
+            states = sma_crossover_intraday(
+                tickers=["CW8.PA", "ESE.PA"],
+                lookbacks="50",
+                trading_hours_open="09:00",
+                trading_hours_close="17:30",
+                timezone="Europe/Paris",
+                poll_interval=0,
+                max_polls=3,
+            )
+
+        assert states == ["below", "above"]
+        assert mock_send_message.call_count == 2
+
+    @patch(
+        "probes.sma_crossover_intraday.run.get_is_market_open",
+        return_value=True,
+    )
+    @patch("probes.sma_crossover_intraday.run.get_daily_smas")
+    def test_state_updated_by_another_run_is_carried_on(
+        self, mock_get_smas, mock_is_open, tmp_path
+    ):
+        """Test that a state another run wrote meanwhile is kept, locally too."""
+        mock_get_smas.return_value = {("CW8.PA", 50): 100.0}
+        state_url = f"sqlite://{tmp_path / 'state.db'}"
+        state_key = get_state_key("CW8.PA", 50, 0, 0)
+        provider = FakeProvider([{"CW8.PA": 98.0}])
+
+        def send_message(**kwargs):
+            # Another run signals the opposite crossing while this one does
+            state_backend = get_state_backend(state_url)
+            state_backend.set(state_key, "above")
+            state_backend.close()
+
+        with (
+            patch(
+                "probes.sma_crossover_intraday.run.get_market_data_provider",
+                return_value=provider,
+            ),
+            patch(
+                "probes.sma_crossover_intraday.run.send_message",
+                side_effect=send_message,
+            ),
+            patch("builtins.print"),
+        ):
+            states = sma_crossover_intraday(
+                tickers=["CW8.PA"],
+                lookbacks="50",
+                trading_hours_open="09:00",
+                trading_hours_close="17:30",
+                timezone="Europe/Paris",
+                poll_interval=0,
+                max_polls=1,
+                state_url=state_url,
+            )
+
+        assert states == ["above"]
+        state_backend = get_state_backend(state_url)
+        assert state_backend.get(state_key) == "above"
+        state_backend.close()
+
+    @patch("probes.sma_crossover_intraday.run.send_message")
+    @patch(
+        "probes.sma_crossover_intraday.run.get_is_market_open",
+        return_value=False,
+    )
+    @patch("probes.sma_crossover_intraday.run.get_daily_smas")
+    def test_nothing_is_polled_while_the_market_is_closed(
+        self, mock_get_smas, mock_is_open, mock_send_message
+    ):
+        with patch("builtins.print"):
+            states = sma_crossover_intraday(
+                tickers=["CW8.PA"],
+                lookbacks="50",
+                trading_hours_open="09:00",
+                trading_hours_close="17:30",
+                timezone="Europe/Paris",
+            )
+
+        assert states == ["neutral"]
+        mock_get_smas.assert_not_called()
+        mock_send_message.assert_not_called()
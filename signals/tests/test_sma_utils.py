@@ -0,0 +1,108 @@
+import json
+import math
+from datetime import date, timedelta
+
+import numpy as np
+import polars as pl
+import pytest
+from utils.sma_utils import SmaAccumulator
+
+
+def make_ohlcv(n_bars: int, seed: int = 0) -> pl.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pl.DataFrame(
+        {
+            "Date": [date(2024, 1, 1) + timedelta(days=i) for i in range(n_bars)],
+            "Close": 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n_bars))),
+        }
+    )
+
+
+class TestSmaAccumulator:
+    """Test cases for the SmaAccumulator class."""
+
+    def test_incremental_updates_match_rolling_mean(self):
+        """Test that updating run after run gives the SMA of the full history."""
+        ohlcv = make_ohlcv(300)
+        expected = ohlcv["Close"].rolling_mean(window_size=20)
+        accumulator = SmaAccumulator(20)
+
+        assert not accumulator.update(ohlcv["Date"][:100], ohlcv["Close"][:100])
+        accumulator.reset(ohlcv["Date"][:100], ohlcv["Close"][:100])
+        for end in range(101, 301, 7):
+            # Each run only reads the bars from the last accumulated one
+            bars = ohlcv[end - 8 : end]
+            accumulator = SmaAccumulator.from_json(accumulator.to_json())
+
+            assert accumulator.update(bars["Date"], bars["Close"])
+            assert accumulator.sma == pytest.approx(expected[end - 1])
+
+    def test_restatement_requires_a_reset(self):
+        ohlcv = make_ohlcv(60)
+        accumulator = SmaAccumulator(20)
+        accumulator.reset(ohlcv["Date"][:40], ohlcv["Close"][:40])
+        # 2:1 split: the whole history is divided by 2
+        restated = ohlcv.with_columns(pl.col("Close") / 2)
+
+        assert not accumulator.update(restated["Date"][39:], restated["Close"][39:])
+        assert accumulator.last_date == ohlcv["Date"][39]
+        assert accumulator.sma == pytest.approx(ohlcv["Close"][20:40].mean())
+
+    def test_gap_requires_a_reset(self):
+        ohlcv = make_ohlcv(60)
+        accumulator = SmaAccumulator(20)
+        accumulator.reset(ohlcv["Date"][:30], ohlcv["Close"][:30])
+
+        # The new bars don't reach back to the last accumulated one
+        assert not accumulator.update(ohlcv["Date"][35:], ohlcv["Close"][35:])
+        assert accumulator.last_date == ohlcv["Date"][29]
+
+    def test_sma_requires_full_window(self):
+        ohlcv = make_ohlcv(5)
+        accumulator = SmaAccumulator(20)
+        accumulator.reset(ohlcv["Date"], ohlcv["Close"])
+
+        assert accumulator.sma is None
+        assert not accumulator.update(ohlcv["Date"], ohlcv["Close"])
+
+    def test_sum_is_recomputed_every_lookback_bars(self):
+        """Test that the rounding errors of the running sum don't accumulate."""
+        ohlcv = make_ohlcv(100)
+        accumulator = SmaAccumulator(20)
+        accumulator.reset(ohlcv["Date"][:30], ohlcv["Close"][:30])
+        accumulator.total += 1e-6
+        for end in range(31, 51):
+            accumulator.update(
+                ohlcv["Date"][end - 2 : end], ohlcv["Close"][end - 2 : end]
+            )
+
+        assert accumulator.pushes == 0
+        assert accumulator.total == math.fsum(ohlcv["Close"][30:50].to_list())
+
+    def test_ring_buffer_is_stored(self):
+        ohlcv = make_ohlcv(60)
+        accumulator = SmaAccumulator(20)
+        accumulator.reset(ohlcv["Date"], ohlcv["Close"])
+
+        stored = json.loads(accumulator.to_json())
+
+        assert stored["window"] == ohlcv["Close"].tail(20).to_list()
+        assert SmaAccumulator.from_json(accumulator.to_json()) == accumulator
+
+    def test_accumulator_stored_without_its_window_is_reset(self):
+        """Test that an accumulator stored with its sum only is recomputed at its next update."""
+        accumulator = SmaAccumulator.from_json(
+            json.dumps(
+                {
+                    "lookback": 2,
+                    "total": 202.0,
+                    "count": 2,
+                    "last_date": "2024-01-09",
+                    "last_close": 102.0,
+                    "pushes": 0,
+                }
+            )
+        )
+
+        assert accumulator.sma is None
+        assert accumulator.last_date is None
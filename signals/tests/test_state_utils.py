@@ -0,0 +1,85 @@
+import threading
+
+import pytest
+from utils.state_utils import (
+    FileStateBackend,
+    SqliteStateBackend,
+    get_state_backend,
+)
+
+
+@pytest.fixture(params=["sqlite", "file"])
+def backend(request, tmp_path):
+    if request.param == "sqlite":
+        state_backend = SqliteStateBackend(str(tmp_path / "state.db"))
+    else:
+        state_backend = FileStateBackend(str(tmp_path / "state.json"))
+    yield state_backend
+    state_backend.close()
+
+
+class TestStateBackend:
+    """Test cases shared by the state backends."""
+
+    def test_get_missing_key(self, backend):
+        assert backend.get("missing") is None
+        assert backend.get_many(["missing"]) == {}
+
+    def test_set_and_bulk_reads(self, backend):
+        backend.set("sma_crossover:CW8.PA:200:3:3", "above")
+        backend.set("sma_crossover:SPY:50:0:0", "below")
+        backend.set("strava_to_gcal:last_activity_id", "42")
+
+        assert backend.get_many(
+            ["sma_crossover:SPY:50:0:0", "strava_to_gcal:last_activity_id", "missing"]
+        ) == {
+            "sma_crossover:SPY:50:0:0": "below",
+            "strava_to_gcal:last_activity_id": "42",
+        }
+        assert backend.get_all("sma_crossover:") == {
+            "sma_crossover:CW8.PA:200:3:3": "above",
+            "sma_crossover:SPY:50:0:0": "below",
+        }
+
+    def test_compare_and_set(self, backend):
+        assert backend.compare_and_set("key", None, "neutral")
+        # Already created by the previous call
+        assert not backend.compare_and_set("key", None, "above")
+        assert not backend.compare_and_set("key", "below", "above")
+        assert backend.compare_and_set("key", "neutral", "above")
+        assert backend.get("key") == "above"
+
+    def test_concurrent_compare_and_set_has_one_winner(self, backend):
+        backend.set("key", "neutral")
+        results = []
+
+        def update(value):
+            results.append(backend.compare_and_set("key", "neutral", value))
+
+        threads = [threading.Thread(target=update, args=(str(i),)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert results.count(True) == 1
+
+
+class TestGetStateBackend:
+    """Test cases for the get_state_backend function."""
+
+    def test_state_persists_across_backends(self, tmp_path):
+        url = f"sqlite://{tmp_path / 'state.db'}"
+        writer = get_state_backend(url)
+        writer.set("key", "value")
+        writer.close()
+        reader = get_state_backend(url)
+
+        assert reader.get("key") == "value"
+        reader.close()
+
+    def test_unsupported_url_raises(self):
+        with pytest.raises(ValueError, match="Unsupported state store"):
+            get_state_backend("redis://localhost")
+        with pytest.raises(ValueError, match="Invalid state store URL"):
+            get_state_backend("state.db")
@@ -1,14 +1,18 @@
 from unittest.mock import MagicMock, patch
 
 import pytest
-
-from signals.probes.strava_to_gcal.run import (
-    create_gcal_event,
+from googleapiclient.errors import HttpError
+from probes.strava_to_gcal.run import (
+    LAST_ACTIVITY_ID_KEY,
+    REFRESH_TOKEN_KEY,
+    build_gcal_event,
+    create_gcal_events,
     format_description,
-    get_new_runs,
+    iter_new_runs,
     refresh_strava_token,
     strava_to_gcal,
 )
+from utils.state_utils import get_state_backend
 
 SAMPLE_RUN = {
     "id": 17532107224,
@@ -21,6 +25,31 @@ SAMPLE_RUN = {
     "timezone": "(GMT+01:00) Europe/Paris",
 }
 
+def mock_batch_requests(service: MagicMock, statuses: dict[int, int] | None = None):
+    """Make <service>'s batches answer each request with its status in <statuses>."""
+
+    def new_batch_http_request(callback):
+        request_ids = []
+        batch = MagicMock()
+        batch.add.side_effect = lambda request, request_id: request_ids.append(
+            request_id
+        )
+
+        def execute():
+            for request_id in request_ids:
+                status = (statuses or {}).get(int(request_id), 200)
+                if status == 200:
+                    callback(request_id, {"id": f"strava{request_id}"}, None)
+                else:
+                    resp = MagicMock(status=status, reason="error")
+                    callback(request_id, None, HttpError(resp, b"{}"))
+
+        batch.execute.side_effect = execute
+        return batch
+
+    service.new_batch_http_request.side_effect = new_batch_http_request
+
+
 SAMPLE_ACTIVITIES = [
     SAMPLE_RUN,
     {**SAMPLE_RUN, "id": 100, "sport_type": "Ride"},  # non-run, should be filtered out
@@ -51,7 +80,7 @@ class TestFormatDescription:
 
 
 class TestRefreshStravaToken:
-    @patch("signals.probes.strava_to_gcal.run.requests.post")
+    @patch("probes.strava_to_gcal.run.requests.post")
     def test_returns_access_and_refresh_token(self, mock_post):
         mock_post.return_value.json.return_value = {
             "access_token": "new_access",
@@ -64,7 +93,7 @@ class TestRefreshStravaToken:
         assert access_token == "new_access"
         assert refresh_token == "new_refresh"
 
-    @patch("signals.probes.strava_to_gcal.run.requests.post")
+    @patch("probes.strava_to_gcal.run.requests.post")
     def test_raises_on_http_error(self, mock_post):
         from requests.exceptions import HTTPError
         mock_post.return_value.raise_for_status.side_effect = HTTPError("401")
@@ -73,38 +102,83 @@ class TestRefreshStravaToken:
             refresh_strava_token("id", "secret", "bad_token")
 
 
-class TestGetNewRuns:
-    @patch("signals.probes.strava_to_gcal.run.requests.get")
+class TestIterNewRuns:
+    @patch("probes.strava_to_gcal.run.requests.get")
     def test_filters_non_runs_and_old_activities(self, mock_get):
         mock_get.return_value.json.return_value = SAMPLE_ACTIVITIES
         mock_get.return_value.raise_for_status = MagicMock()
 
-        result = get_new_runs("access_token", last_activity_id=17507357013)
+        pages = list(iter_new_runs("access_token", 17507357013, after=1700000000))
 
-        ids = [r["id"] for r in result]
-        assert 17532107224 in ids   # new run — included
-        assert 17532107225 in ids   # new run — included
-        assert 100 not in ids       # Ride — excluded
-        assert 17507357013 not in ids  # at or below threshold — excluded
+        assert [[r["id"] for r in runs] for runs in pages] == [
+            [17532107224, 17532107225]  # Ride and already processed run excluded
+        ]
 
-    @patch("signals.probes.strava_to_gcal.run.requests.get")
-    def test_returns_sorted_oldest_first(self, mock_get):
-        mock_get.return_value.json.return_value = SAMPLE_ACTIVITIES
+    @patch("probes.strava_to_gcal.run.STRAVA_PAGE_SIZE", 2)
+    @patch("probes.strava_to_gcal.run.requests.get")
+    def test_yields_runs_page_by_page_oldest_first(self, mock_get):
+        pages = [
+            [{**SAMPLE_RUN, "id": 3}, {**SAMPLE_RUN, "id": 4}],
+            [{**SAMPLE_RUN, "id": 5}],
+        ]
+        mock_get.return_value.json.side_effect = pages
         mock_get.return_value.raise_for_status = MagicMock()
 
-        result = get_new_runs("access_token", last_activity_id=0)
-        run_ids = [r["id"] for r in result if r["sport_type"] == "Run"]
-        assert run_ids == sorted(run_ids)
+        runs = iter_new_runs("access_token", 3, after=1700000000)
+
+        # A page is only fetched once the previous one is consumed
+        assert [r["id"] for r in next(runs)] == [4]
+        assert mock_get.call_count == 1
+        assert [r["id"] for r in next(runs)] == [5]
+        assert next(runs, None) is None
+        assert mock_get.call_count == 2
+        assert mock_get.call_args.kwargs["params"]["after"] == 1700000000
+
+    @patch("probes.strava_to_gcal.run.STRAVA_PAGE_SIZE", 2)
+    @patch("probes.strava_to_gcal.run.requests.get")
+    def test_recent_activities_listed_down_to_processed_one(self, mock_get):
+        pages = [
+            [{**SAMPLE_RUN, "id": 9}, {**SAMPLE_RUN, "id": 8}],
+            [{**SAMPLE_RUN, "id": 7}, {**SAMPLE_RUN, "id": 5}],
+            [{**SAMPLE_RUN, "id": 4}, {**SAMPLE_RUN, "id": 3}],
+        ]
+        mock_get.return_value.json.side_effect = pages
+        mock_get.return_value.raise_for_status = MagicMock()
 
+        # The processed activity 6 was deleted since
+        runs = list(iter_new_runs("access_token", 6))
 
-class TestCreateGcalEvent:
-    def test_event_structure(self):
-        mock_service = MagicMock()
+        assert [[r["id"] for r in page] for page in runs] == [[7, 8, 9]]
+        assert mock_get.call_count == 2
+        assert "after" not in mock_get.call_args.kwargs["params"]
+
+    @patch("probes.strava_to_gcal.run.STRAVA_PAGE_SIZE", 2)
+    @patch("probes.strava_to_gcal.run.requests.get")
+    def test_only_most_recent_page_without_processed_activity(self, mock_get):
+        mock_get.return_value.json.return_value = [
+            {**SAMPLE_RUN, "id": 9},
+            {**SAMPLE_RUN, "id": 8},
+        ]
+        mock_get.return_value.raise_for_status = MagicMock()
+
+        runs = list(iter_new_runs("access_token", 0))
 
-        create_gcal_event(mock_service, "calendar_id", SAMPLE_RUN)
+        assert [[r["id"] for r in page] for page in runs] == [[8, 9]]
+        mock_get.assert_called_once()
+
+    @patch("probes.strava_to_gcal.run.requests.get")
+    def test_empty_listing_makes_single_request(self, mock_get):
+        mock_get.return_value.json.return_value = []
+        mock_get.return_value.raise_for_status = MagicMock()
+
+        assert list(iter_new_runs("access_token", 3, after=1700000000)) == []
+        mock_get.assert_called_once()
+
+
+class TestBuildGcalEvent:
+    def test_event_structure(self):
+        event = build_gcal_event(SAMPLE_RUN)
 
-        call_kwargs = mock_service.events.return_value.insert.call_args.kwargs
-        event = call_kwargs["body"]
         assert event["summary"] == "Endu"
         assert "7.43 km" in event["description"]
         assert event["start"]["dateTime"] == "2026-02-26T17:28:19"
@@ -112,14 +186,37 @@ class TestCreateGcalEvent:
         # end = start + elapsed_time (2050s = 34m 10s)
         assert event["end"]["dateTime"] == "2026-02-26T18:02:29"
         assert event["end"]["timeZone"] == "Europe/Paris"
-        assert call_kwargs["calendarId"] == "calendar_id"
+        assert event["id"] == "strava17532107224"
+
+
+class TestCreateGcalEvents:
+    @patch("probes.strava_to_gcal.run.GCAL_BATCH_SIZE", 2)
+    def test_inserts_in_batches(self):
+        mock_service = MagicMock()
+        mock_batch_requests(mock_service)
+        runs = [{**SAMPLE_RUN, "id": i} for i in range(1, 6)]
+
+        created_ids = create_gcal_events(mock_service, "calendar_id", runs)
+
+        assert created_ids == {1, 2, 3, 4, 5}
+        assert mock_service.new_batch_http_request.call_count == 3
+        mock_service.events.return_value.insert.return_value.execute.assert_not_called()
+
+    def test_reports_failures_and_accepts_duplicates(self):
+        mock_service = MagicMock()
+        mock_batch_requests(mock_service, statuses={2: 500, 3: 409})
+        runs = [{**SAMPLE_RUN, "id": i} for i in range(1, 4)]
+
+        created_ids = create_gcal_events(mock_service, "calendar_id", runs)
+
+        assert created_ids == {1, 3}
 
 
 class TestStravaToGcalIntegration:
-    @patch("signals.probes.strava_to_gcal.run.build_gcal_service")
-    @patch("signals.probes.strava_to_gcal.run.get_new_runs")
-    @patch("signals.probes.strava_to_gcal.run.refresh_strava_token")
-    @patch("signals.probes.strava_to_gcal.run.os.getenv")
+    @patch("probes.strava_to_gcal.run.build_gcal_service")
+    @patch("probes.strava_to_gcal.run.iter_new_runs")
+    @patch("probes.strava_to_gcal.run.refresh_strava_token")
+    @patch("probes.strava_to_gcal.run.os.getenv")
     def test_creates_events_and_prints_outputs(
         self, mock_getenv, mock_refresh, mock_get_runs, mock_build_gcal, capsys
     ):
@@ -130,19 +227,45 @@ class TestStravaToGcalIntegration:
             "GOOGLE_SERVICE_ACCOUNT_JSON": '{"type": "service_account"}',
         }.get(k)
         mock_refresh.return_value = ("access_token", "new_refresh")
-        mock_get_runs.return_value = [SAMPLE_RUN]
+        mock_get_runs.return_value = iter([[SAMPLE_RUN]])
+        mock_batch_requests(mock_build_gcal.return_value)
 
         strava_to_gcal(last_activity_id=0, calendar_id="cal_id")
 
-        mock_build_gcal.return_value.events.return_value.insert.return_value.execute.assert_called_once()
+        mock_get_runs.assert_called_once_with("access_token", 0, None)
+        mock_build_gcal.return_value.new_batch_http_request.assert_called_once()
         out = capsys.readouterr().out.splitlines()
         assert out[0] == "new_refresh"
         assert out[1] == str(SAMPLE_RUN["id"])
 
-    @patch("signals.probes.strava_to_gcal.run.build_gcal_service")
-    @patch("signals.probes.strava_to_gcal.run.get_new_runs")
-    @patch("signals.probes.strava_to_gcal.run.refresh_strava_token")
-    @patch("signals.probes.strava_to_gcal.run.os.getenv")
+    @patch("probes.strava_to_gcal.run.build_gcal_service")
+    @patch("probes.strava_to_gcal.run.iter_new_runs")
+    @patch("probes.strava_to_gcal.run.refresh_strava_token")
+    @patch("probes.strava_to_gcal.run.os.getenv")
+    def test_failed_event_stops_last_activity_id(
+        self, mock_getenv, mock_refresh, mock_get_runs, mock_build_gcal, capsys
+    ):
+        mock_getenv.side_effect = lambda k: {
+            "STRAVA_CLIENT_ID": "id",
+            "STRAVA_CLIENT_SECRET": "secret",
+            "STRAVA_REFRESH_TOKEN": "old_refresh",
+            "GOOGLE_SERVICE_ACCOUNT_JSON": '{"type": "service_account"}',
+        }.get(k)
+        mock_refresh.return_value = ("access_token", "new_refresh")
+        mock_get_runs.return_value = iter([[{**SAMPLE_RUN, "id": i} for i in (11, 12, 13)]])
+        mock_batch_requests(mock_build_gcal.return_value, statuses={12: 503})
+
+        strava_to_gcal(last_activity_id=10, calendar_id="cal_id")
+
+        out = capsys.readouterr().out.splitlines()
+        assert out[0] == "new_refresh"
+        # 13 was created but 12 must be retried next time
+        assert out[1] == "11"
+
+    @patch("probes.strava_to_gcal.run.build_gcal_service")
+    @patch("probes.strava_to_gcal.run.iter_new_runs")
+    @patch("probes.strava_to_gcal.run.refresh_strava_token")
+    @patch("probes.strava_to_gcal.run.os.getenv")
     def test_no_new_runs_preserves_last_activity_id(
         self, mock_getenv, mock_refresh, mock_get_runs, mock_build_gcal, capsys
     ):
@@ -153,7 +276,7 @@ class TestStravaToGcalIntegration:
             "GOOGLE_SERVICE_ACCOUNT_JSON": '{"type": "service_account"}',
         }.get(k)
         mock_refresh.return_value = ("access_token", "new_refresh")
-        mock_get_runs.return_value = []
+        mock_get_runs.return_value = iter([])
 
         strava_to_gcal(last_activity_id=12345, calendar_id="cal_id")
 
@@ -162,9 +285,41 @@ class TestStravaToGcalIntegration:
         assert out[0] == "new_refresh"
         assert out[1] == "12345"
 
-    @patch("signals.probes.strava_to_gcal.run.os.getenv")
+    @patch("probes.strava_to_gcal.run.os.getenv")
     def test_missing_env_vars_raises(self, mock_getenv):
         mock_getenv.return_value = None
 
         with pytest.raises(ValueError, match="Missing one or more required environment variables"):
             strava_to_gcal(last_activity_id=0, calendar_id="cal_id")
+
+    @patch("probes.strava_to_gcal.run.build_gcal_service")
+    @patch("probes.strava_to_gcal.run.iter_new_runs")
+    @patch("probes.strava_to_gcal.run.refresh_strava_token")
+    @patch("probes.strava_to_gcal.run.os.getenv")
+    def test_state_store_round_trip(
+        self, mock_getenv, mock_refresh, mock_get_runs, mock_build_gcal, tmp_path
+    ):
+        mock_getenv.side_effect = lambda k: {
+            "STRAVA_CLIENT_ID": "id",
+            "STRAVA_CLIENT_SECRET": "secret",
+            "STRAVA_REFRESH_TOKEN": "stale_refresh",
+            "GOOGLE_SERVICE_ACCOUNT_JSON": '{"type": "service_account"}',
+        }.get(k)
+        state_url = f"sqlite://{tmp_path / 'state.db'}"
+        state_backend = get_state_backend(state_url)
+        state_backend.set(LAST_ACTIVITY_ID_KEY, "10")
+        state_backend.set(REFRESH_TOKEN_KEY, "old_refresh")
+        mock_refresh.return_value = ("access_token", "new_refresh")
+        mock_get_runs.return_value = iter([[{**SAMPLE_RUN, "id": 11}]])
+        mock_batch_requests(mock_build_gcal.return_value)
+
+        strava_to_gcal(last_activity_id=0, calendar_id="cal_id", state_url=state_url)
+
+        # The stored values take precedence over the stale env var and argument
+        mock_refresh.assert_called_once_with("id", "secret", "old_refresh")
+        mock_get_runs.assert_called_once_with("access_token", 10, None)
+        assert state_backend.get_many([LAST_ACTIVITY_ID_KEY, REFRESH_TOKEN_KEY]) == {
+            LAST_ACTIVITY_ID_KEY: "11",
+            REFRESH_TOKEN_KEY: "new_refresh",
+        }
+        state_backend.close()
@@ -0,0 +1,69 @@
+import asyncio
+import contextvars
+import functools
+import inspect
+import os
+import threading
+from collections.abc import Iterator
+from concurrent.futures import Executor
+from contextlib import contextmanager
+from typing import Any, Callable
+
+from utils.metrics_utils import upstream
+
+# Maximum number of requests in flight to each upstream host, across all the jobs of the process
+HOST_CONCURRENCY = {
+    "query2.finance.yahoo.com": 4,
+    "www.strava.com": 2,
+    "www.googleapis.com": 4,
+}
+DEFAULT_HOST_CONCURRENCY = 4
+
+_host_semaphores: dict[str, threading.BoundedSemaphore] = {}
+_host_semaphores_lock = threading.Lock()
+
+
+def get_host_concurrency() -> dict[str, int]:
+    """
+    Return HOST_CONCURRENCY, overridden by the SIGNALS_HOST_CONCURRENCY env var
+    (comma-separated <host>=<limit> pairs, e.g. www.strava.com=1).
+    """
+    limits = dict(HOST_CONCURRENCY)
+    for pair in filter(None, os.getenv("SIGNALS_HOST_CONCURRENCY", "").split(",")):
+        host, separator, limit = pair.strip().partition("=")
+        if not (separator and limit.isdigit() and int(limit) > 0):
+            raise ValueError(f"Invalid host concurrency: {pair}")
+        limits[host] = int(limit)
+    return limits
+
+
+@contextmanager
+def host_slot(host: str) -> Iterator[None]:
+    """
+    Hold one of the slots of <host> for the duration of the block, waiting for one to free up.
+    The slots are shared by all the threads of the process, so that blocking calls made by
+    concurrent jobs (e.g., the sync probes of run_jobs) are bounded per upstream host.
+    The time spent, waiting included, is recorded as a call to the upstream.
+    """
+    with _host_semaphores_lock:
+        if host not in _host_semaphores:
+            limit = get_host_concurrency().get(host, DEFAULT_HOST_CONCURRENCY)
+            _host_semaphores[host] = threading.BoundedSemaphore(limit)
+        semaphore = _host_semaphores[host]
+    with upstream(host), semaphore:
+        yield
+
+
+async def call_probe(
+    function: Callable, params: dict[str, Any], executor: Executor | None = None
+) -> Any:
+    """
+    Await the probe <function> called with <params>: coroutine functions run on the loop,
+    sync ones in <executor> (the loop's default one when None), in a copy of the current context.
+    """
+    if inspect.iscoroutinefunction(function):
+        return await function(**params)
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, context.run, functools.partial(function, **params)
+    )
@@ -0,0 +1,147 @@
+import logging
+import os
+import re
+from datetime import date
+from typing import Callable
+
+import polars as pl
+
+logger = logging.getLogger(__name__)
+
+# Relative difference between a cached and a freshly downloaded close above which
+# the history is considered restated (split, dividend adjustment...)
+RESTATEMENT_TOLERANCE = 1e-6
+
+# Key of the Parquet metadata entry recording the first date the file was fetched for
+START_METADATA_KEY = "signals_start"
+# Bars per Parquet row group, about 4 years of daily bars, so that a scan of the latest
+# bars skips the row groups of the older ones
+ROW_GROUP_SIZE = 1024
+
+
+def get_cache_path(cache_dir: str, ticker: str) -> str:
+    """Return the path of the Parquet file caching the OHLCV bars of <ticker>."""
+    # Tickers such as "^VIX" or "BTC-EUR" are valid file names but "/" is not
+    file_name = re.sub(r"[^\w^=.-]", "_", ticker)
+    return os.path.join(cache_dir, f"{file_name}.parquet")
+
+
+def read_cached_start(path: str) -> date | None:
+    """Return the start date the cached bars were fetched from, if any, reading only the file's metadata."""
+    if not os.path.exists(path):
+        return None
+    metadata = pl.read_parquet_metadata(path)
+    if START_METADATA_KEY not in metadata:
+        return None
+    return date.fromisoformat(metadata[START_METADATA_KEY])
+
+
+def write_cached_ohlcv(path: str, ohlcv: pl.DataFrame, start: date) -> None:
+    """Atomically (over)write the cache file so that a crash never leaves it truncated."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    ohlcv.write_parquet(
+        tmp_path,
+        row_group_size=ROW_GROUP_SIZE,
+        metadata={START_METADATA_KEY: start.isoformat()},
+    )
+    os.replace(tmp_path, path)
+
+
+def scan_cached_bars(path: str, start: date) -> pl.LazyFrame:
+    """
+    Lazily scan the cached bars from <start> onwards: the row groups holding only older bars
+    are skipped from their statistics, so that a long history is not read for a trailing window.
+    """
+    return pl.scan_parquet(path).filter(pl.col("Date") >= start)
+
+
+def refresh_cached_ohlcv(
+    ticker: str,
+    start: date,
+    fetch: Callable[[str, date], pl.DataFrame],
+    cache_dir: str,
+) -> str:
+    """
+    Bring the Parquet file caching the daily OHLCV bars of <ticker> from <start> onwards in <cache_dir>
+    up to date, and return its path. <fetch> downloads the bars of a ticker from a given date onwards
+    and is only asked for the bars missing from the cache.
+
+    The download restarts from the penultimate cached bar, which serves as an anchor:
+    if its close changed upstream, past prices were restated (e.g., split or dividend
+    adjustment) and the whole history is downloaded again. The last cached bar is
+    replaced when it changed since it may have been cached while the market was open.
+    Only the last two cached bars are read, and the file is only rewritten when new bars arrived.
+    """
+    path = get_cache_path(cache_dir, ticker)
+    cached_start = read_cached_start(path)
+
+    if cached_start is None:
+        logger.info(f"{ticker}: no cached history, downloading from {start}")
+        _refresh_cache(ticker, start, fetch, path)
+        return path
+    last_bars = pl.scan_parquet(path).tail(2).collect()
+    if cached_start > start or last_bars.height < 2:
+        logger.info(f"{ticker}: cached history too short, downloading from {start}")
+        _refresh_cache(ticker, start, fetch, path)
+        return path
+
+    anchor_date = last_bars["Date"][0]
+    anchor_close = last_bars["Close"][0]
+    fresh = fetch(ticker, _to_date(anchor_date))
+    fresh_anchor = fresh.filter(pl.col("Date") == anchor_date)
+    if fresh_anchor.height != 1 or not _is_close(
+        fresh_anchor["Close"][0], anchor_close
+    ):
+        logger.info(
+            f"{ticker}: close of {_to_date(anchor_date)} changed upstream, discarding the cache"
+        )
+        _refresh_cache(ticker, start, fetch, path)
+        return path
+
+    new_bars = fresh.filter(pl.col("Date") > anchor_date).sort("Date")
+    if new_bars.equals(last_bars.tail(1)):
+        logger.info(f"{ticker}: cache up to date")
+        return path
+    ohlcv = pl.concat(
+        [pl.read_parquet(path).filter(pl.col("Date") <= anchor_date), new_bars],
+        how="vertical_relaxed",
+    )
+    write_cached_ohlcv(path, ohlcv, cached_start)
+    logger.info(f"{ticker}: topped up the cache with {new_bars.height} bar(s)")
+    return path
+
+
+def get_cached_ohlcv(
+    ticker: str,
+    start: date,
+    fetch: Callable[[str, date], pl.DataFrame],
+    cache_dir: str,
+) -> pl.DataFrame:
+    """
+    Return the daily OHLCV bars of <ticker> from <start> onwards, using a Parquet file per ticker
+    in <cache_dir> brought up to date first (see refresh_cached_ohlcv).
+    """
+    path = refresh_cached_ohlcv(ticker, start, fetch, cache_dir)
+    return scan_cached_bars(path, start).collect()
+
+
+def _refresh_cache(
+    ticker: str,
+    start: date,
+    fetch: Callable[[str, date], pl.DataFrame],
+    path: str,
+) -> None:
+    ohlcv = fetch(ticker, start).sort("Date")
+    write_cached_ohlcv(path, ohlcv, start)
+
+
+def _to_date(value) -> date:
+    # Dates are stored as datetimes when coming from pandas
+    return value.date() if hasattr(value, "date") else value
+
+
+def _is_close(fresh: float | None, cached: float | None) -> bool:
+    if fresh is None or cached is None:
+        return fresh is cached
+    return abs(fresh - cached) <= RESTATEMENT_TOLERANCE * max(abs(cached), 1.0)
@@ -0,0 +1,276 @@
+import os
+import threading
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta
+from datetime import timezone as dt_timezone
+from typing import Callable
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+# Bump when the rules below change so that the calendars cached on disk are rebuilt
+CALENDAR_VERSION = 1
+FIRST_YEAR = 2000
+LAST_YEAR = 2050
+
+
+def easter_sunday(year: int) -> date:
+    """Gregorian Easter Sunday (anonymous Gregorian algorithm)."""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7  # noqa: E741
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def nth_weekday(year: int, month: int, weekday: int, n: int) -> date:
+    """<n>th <weekday> (0 is Monday) of the month, counting from its end when <n> is negative."""
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7 + 7 * (-n - 1))
+
+
+def observed(day: date) -> date:
+    """US rule: a holiday falling on a Saturday is observed on Friday, on a Sunday on Monday."""
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+
+def xpar_holidays(year: int) -> set[date]:
+    easter = easter_sunday(year)
+    return {
+        date(year, 1, 1),
+        easter - timedelta(days=2),  # Good Friday
+        easter + timedelta(days=1),  # Easter Monday
+        date(year, 5, 1),
+        date(year, 12, 25),
+        date(year, 12, 26),
+    }
+
+
+def xpar_early_closes(year: int) -> set[date]:
+    return {date(year, 12, 24), date(year, 12, 31)}
+
+
+def xnys_holidays(year: int) -> set[date]:
+    holidays = {
+        nth_weekday(year, 2, 0, 3),  # Washington's Birthday
+        easter_sunday(year) - timedelta(days=2),  # Good Friday
+        nth_weekday(year, 5, 0, -1),  # Memorial Day
+        observed(date(year, 7, 4)),
+        nth_weekday(year, 9, 0, 1),  # Labor Day
+        nth_weekday(year, 11, 3, 4),  # Thanksgiving
+        observed(date(year, 12, 25)),
+    }
+    # New Year's Day falling on a Saturday isn't observed on the Friday before
+    if date(year, 1, 1).weekday() != 5:
+        holidays.add(observed(date(year, 1, 1)))
+    if year >= 1998:
+        holidays.add(nth_weekday(year, 1, 0, 3))  # Martin Luther King Jr. Day
+    if year >= 2022:
+        holidays.add(observed(date(year, 6, 19)))  # Juneteenth
+    return holidays
+
+
+def xnys_early_closes(year: int) -> set[date]:
+    early_closes = {nth_weekday(year, 11, 3, 4) + timedelta(days=1)}
+    # The days before Independence Day and Christmas, unless they're a Friday
+    # (then the holiday is observed on it) or a weekend day
+    for day in (date(year, 7, 3), date(year, 12, 24)):
+        if day.weekday() < 4:
+            early_closes.add(day)
+    return early_closes
+
+
+@dataclass(frozen=True)
+class ExchangeRules:
+    timezone: str
+    open: time
+    close: time
+    early_close: time | None = None
+    # Days of the week with sessions, 0 being Monday
+    weekdays: tuple[int, ...] = (0, 1, 2, 3, 4)
+    holidays: Callable[[int], set[date]] = field(default=lambda year: set())
+    early_closes: Callable[[int], set[date]] = field(default=lambda year: set())
+
+
+# Regular holidays and half-days only: exceptional closures (e.g., national mourning) aren't known in advance
+EXCHANGES = {
+    "XPAR": ExchangeRules(
+        timezone="Europe/Paris",
+        open=time(9, 0),
+        close=time(17, 30),
+        early_close=time(14, 5),
+        holidays=xpar_holidays,
+        early_closes=xpar_early_closes,
+    ),
+    "XNYS": ExchangeRules(
+        timezone="America/New_York",
+        open=time(9, 30),
+        close=time(16, 0),
+        early_close=time(13, 0),
+        holidays=xnys_holidays,
+        early_closes=xnys_early_closes,
+    ),
+    # Crypto markets trade around the clock: one session per UTC day
+    "CRYPTO": ExchangeRules(
+        timezone="UTC",
+        open=time(0, 0),
+        close=time(0, 0),
+        weekdays=(0, 1, 2, 3, 4, 5, 6),
+    ),
+}
+
+
+@dataclass(frozen=True)
+class TradingCalendar:
+    """
+    Sessions of an exchange as sorted arrays (dates, and UTC opens and closes),
+    so that lookups are binary searches.
+    """
+
+    name: str
+    timezone: str
+    sessions: np.ndarray  # datetime64[D]
+    opens: np.ndarray  # datetime64[s], UTC
+    closes: np.ndarray  # datetime64[s], UTC
+
+    def _to_utc(self, at: datetime) -> np.datetime64:
+        if not FIRST_YEAR <= at.year <= LAST_YEAR:
+            raise ValueError(f"{at} is outside of the {self.name} calendar")
+        return np.datetime64(at.astimezone(dt_timezone.utc).replace(tzinfo=None), "s")
+
+    def is_session(self, day: date) -> bool:
+        day = np.datetime64(day, "D")
+        i = np.searchsorted(self.sessions, day)
+        return bool(i < len(self.sessions) and self.sessions[i] == day)
+
+    def is_trading_day(self, at: datetime) -> bool:
+        """Whether the local date of <at> (timezone-aware) at the exchange is a session."""
+        return self.is_session(at.astimezone(ZoneInfo(self.timezone)).date())
+
+    def is_open(self, at: datetime) -> bool:
+        t = self._to_utc(at)
+        i = np.searchsorted(self.opens, t, side="right") - 1
+        return bool(i >= 0 and t < self.closes[i])
+
+    def last_completed_session(self, at: datetime) -> date:
+        """Date of the last session closed at <at> (timezone-aware)."""
+        i = np.searchsorted(self.closes, self._to_utc(at), side="right") - 1
+        if i < 0:
+            raise ValueError(f"No {self.name} session closed before {at}")
+        return self.sessions[i].item()
+
+
+def build_calendar(name: str) -> TradingCalendar:
+    if name not in EXCHANGES:
+        raise ValueError(
+            f"Unknown exchange: {name} (expected one of {', '.join(EXCHANGES)})"
+        )
+    rules = EXCHANGES[name]
+    tz = ZoneInfo(rules.timezone)
+    holidays, early_closes = set(), set()
+    for year in range(FIRST_YEAR, LAST_YEAR + 1):
+        holidays |= rules.holidays(year)
+        early_closes |= rules.early_closes(year)
+
+    weekmask = [int(weekday in rules.weekdays) for weekday in range(7)]
+    all_days = np.arange(
+        np.datetime64(f"{FIRST_YEAR}-01-01"),
+        np.datetime64(f"{LAST_YEAR + 1}-01-01"),
+        dtype="datetime64[D]",
+    )
+    sessions = all_days[
+        np.is_busday(
+            all_days,
+            weekmask=weekmask,
+            holidays=np.array(sorted(holidays), dtype="datetime64[D]"),
+        )
+    ]
+
+    opens, closes = [], []
+    for session in sessions.tolist():
+        open_at = datetime.combine(session, rules.open, tzinfo=tz)
+        close_time = (
+            rules.early_close
+            if session in early_closes and rules.early_close
+            else rules.close
+        )
+        close_at = datetime.combine(session, close_time, tzinfo=tz)
+        if close_at <= open_at:
+            close_at += timedelta(days=1)
+        opens.append(open_at.astimezone(dt_timezone.utc).replace(tzinfo=None))
+        closes.append(close_at.astimezone(dt_timezone.utc).replace(tzinfo=None))
+
+    return TradingCalendar(
+        name=name,
+        timezone=rules.timezone,
+        sessions=sessions,
+        opens=np.array(opens, dtype="datetime64[s]"),
+        closes=np.array(closes, dtype="datetime64[s]"),
+    )
+
+
+def load_calendar(path: str, name: str) -> TradingCalendar | None:
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as arrays:
+        return TradingCalendar(
+            name=name,
+            timezone=EXCHANGES[name].timezone,
+            sessions=arrays["sessions"],
+            opens=arrays["opens"],
+            closes=arrays["closes"],
+        )
+
+
+def save_calendar(path: str, calendar: TradingCalendar) -> None:
+    """Atomically write the calendar's arrays so that a crash never leaves the file truncated."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(
+            f,
+            sessions=calendar.sessions,
+            opens=calendar.opens,
+            closes=calendar.closes,
+        )
+    os.replace(tmp_path, path)
+
+
+_calendars: dict[str, TradingCalendar] = {}
+_calendars_lock = threading.Lock()
+
+
+def get_calendar(name: str, cache_dir: str | None = None) -> TradingCalendar:
+    """
+    Return the trading calendar of the exchange <name> (XPAR, XNYS or CRYPTO), built once per process.
+    It's also cached on disk under <cache_dir>, or else SIGNALS_CACHE_DIR, when set.
+    """
+    with _calendars_lock:
+        if name in _calendars:
+            return _calendars[name]
+        cache_dir = cache_dir or os.getenv("SIGNALS_CACHE_DIR")
+        path = (
+            os.path.join(cache_dir, "calendars", f"{name}-v{CALENDAR_VERSION}.npz")
+            if cache_dir
+            else None
+        )
+        calendar = load_calendar(path, name) if path and name in EXCHANGES else None
+        if calendar is None:
+            calendar = build_calendar(name)
+            if path:
+                save_calendar(path, calendar)
+        _calendars[name] = calendar
+        return calendar
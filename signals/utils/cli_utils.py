@@ -1,33 +1,166 @@
+import ast
+import asyncio
+import functools
 import importlib
+import inspect
 import os
+import time
+from typing import Callable, ClassVar
 
+import click
 import typer
+from typer.core import TyperGroup
+from typer.models import ParameterInfo
+
+
+def import_command(
+    command_name: str, package: str = "probes", common_file_name: str = "run.py"
+) -> Callable:
+    """
+    Import the function named <command_name> from the <package>.<command_name>.<common_file_name> module.
+    """
+    module_name = f"{package}.{command_name}.{common_file_name.replace('.py', '')}"
+    module = importlib.import_module(module_name)
+    function = getattr(module, command_name, None)
+    if not (function and callable(function)):
+        raise ValueError(f"{module_name} has no {command_name} function")
+    return function
+
+
+def get_envvar_params(function: Callable) -> dict:
+    """
+    Return the values of the environment variables backing the typer parameters of <function>.
+    Typer only reads them when parsing the command line, so they're needed when calling a command directly.
+    """
+    params = {}
+    signature = inspect.signature(function, eval_str=True)
+    for name, parameter in signature.parameters.items():
+        for metadata in getattr(parameter.annotation, "__metadata__", ()):
+            if isinstance(metadata, ParameterInfo) and isinstance(metadata.envvar, str):
+                value = os.getenv(metadata.envvar)
+                if value is not None:
+                    params[name] = value
+    return params
+
+
+class LazyCommandGroup(TyperGroup):
+    """
+    Typer group whose lazy commands are only imported when resolved.
+    <lazy_commands> maps the name of each probe to the file name of its module, and
+    <lazy_tool_commands> the name of each other command (e.g., run_jobs) to its function,
+    as <module>:<function>.
+    """
+
+    lazy_commands: ClassVar[dict[str, str]] = {}
+    lazy_tool_commands: ClassVar[dict[str, str]] = {}
+
+    def list_commands(self, ctx: click.Context) -> list[str]:
+        return sorted(
+            {
+                *super().list_commands(ctx),
+                *self.lazy_commands,
+                *self.lazy_tool_commands,
+            }
+        )
+
+    def get_command(self, ctx: click.Context, cmd_name: str) -> click.Command | None:
+        if cmd_name not in self.commands and cmd_name in self.lazy_tool_commands:
+            module_name, _, function_name = self.lazy_tool_commands[cmd_name].partition(
+                ":"
+            )
+            function = getattr(importlib.import_module(module_name), function_name)
+            command_app = typer.Typer(add_completion=False)
+            command_app.command(name=cmd_name)(function)
+            self.commands[cmd_name] = typer.main.get_command(command_app)
+        elif cmd_name not in self.commands and cmd_name in self.lazy_commands:
+            # Only imported once a probe runs, along with the probe's own imports
+            from utils.metrics_utils import instrument
+
+            start = time.perf_counter()
+            function = import_command(
+                cmd_name, common_file_name=self.lazy_commands[cmd_name]
+            )
+            import_s = time.perf_counter() - start
+            # Typer doesn't await commands: async probes get their own event loop
+            if inspect.iscoroutinefunction(function):
+                coroutine_function = function
+
+                @functools.wraps(coroutine_function)
+                def function(*args, **kwargs):
+                    return asyncio.run(coroutine_function(*args, **kwargs))
+
+            function = instrument(function, cmd_name, import_s)
+            command_app = typer.Typer(add_completion=False)
+            command_app.command(name=cmd_name)(function)
+            self.commands[cmd_name] = typer.main.get_command(command_app)
+        return super().get_command(ctx, cmd_name)
+
+
+def discover_commands(dir_abspath: str, common_file_name: str = "run.py") -> list[str]:
+    """
+    Return the names of the subdirectories of <dir_abspath> whose <common_file_name> file defines a function by the same name.
+    The files are parsed, not imported, so that discovery doesn't pay for the imports of every command.
+    """
+    command_names = []
+    for dir_name in sorted(os.listdir(dir_abspath)):
+        file_path = os.path.join(dir_abspath, dir_name, common_file_name)
+        if not os.path.isfile(file_path):
+            continue
+        with open(file_path, encoding="utf-8") as f:
+            tree = ast.parse(f.read(), filename=file_path)
+        if any(
+            isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))
+            and node.name == dir_name
+            for node in tree.body
+        ):
+            command_names.append(dir_name)
+    return command_names
 
 
 def load_and_register_commands(
     app: typer.Typer, dir_abspath: str, common_file_name: str = "run.py"
 ):
     """
-    Import functions from the directories inside <dir_abspath> (subdirectories) and add them as commands to the given typer <app>.
+    Register the functions from the directories inside <dir_abspath> (subdirectories) as commands of the given typer <app>.
     For a command to be registered, its subdirectory must contain a file called <common_file_name>.
     And the <common_file_name> file must contain a function with the same name as the subdirectory.
+
+    Commands are registered lazily: a command's module is only imported when the command is invoked (or listed in the help).
+    This requires <app> to be a group, e.g. by having a callback.
     """
+    lazy_commands = {
+        command_name: common_file_name
+        for command_name in discover_commands(dir_abspath, common_file_name)
+    }
 
-    # Iterate over the subdirectories
-    for dir_name in os.listdir(dir_abspath):
-        dir_path = os.path.join(dir_abspath, dir_name)
+    add_lazy_commands(app, lazy_commands=lazy_commands)
 
-        # Check if the subdirectory contains a file called <common_file_name>
-        if os.path.isdir(dir_path) and os.path.exists(
-            os.path.join(dir_path, common_file_name)
-        ):
-            # Dynamically import the module
-            module_name = f"probes.{dir_name}.{common_file_name.replace('.py', '')}"
-            module = importlib.import_module(module_name)
 
-            # Get the function by the same name as the directory
-            function = getattr(module, dir_name, None)
+def register_lazy_command(app: typer.Typer, name: str, function_path: str) -> None:
+    """
+    Register the function at <function_path> (<module>:<function>) as the command <name> of <app>,
+    its module only being imported when the command is invoked (or listed in the help).
+    """
+    add_lazy_commands(app, lazy_tool_commands={name: function_path})
+
 
-            # If the function exists, add it as a command to the typer app
-            if function and callable(function):
-                app.command(name=dir_name)(function)
+def add_lazy_commands(
+    app: typer.Typer,
+    lazy_commands: dict[str, str] | None = None,
+    lazy_tool_commands: dict[str, str] | None = None,
+) -> None:
+    # Subclassing the group class is how the typer app's click group gets its lazy commands
+    base_cls = app.info.cls
+    if not (isinstance(base_cls, type) and issubclass(base_cls, LazyCommandGroup)):
+        base_cls = LazyCommandGroup
+    app.info.cls = type(
+        base_cls.__name__,
+        (base_cls,),
+        {
+            "lazy_commands": {**base_cls.lazy_commands, **(lazy_commands or {})},
+            "lazy_tool_commands": {
+                **base_cls.lazy_tool_commands,
+                **(lazy_tool_commands or {}),
+            },
+        },
+    )
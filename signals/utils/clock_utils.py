@@ -0,0 +1,36 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, tzinfo
+from typing import Iterator
+
+# The time the probes see as the current one while frozen, e.g., a past date being replayed.
+# A context variable, so that concurrent runs (e.g., the jobs of run_jobs) each see their own
+_frozen_at: ContextVar[datetime | None] = ContextVar("frozen_at", default=None)
+
+
+def get_now(tz: tzinfo | None = None) -> datetime:
+    """
+    The current time in <tz>, or the local time without timezone if None, as datetime.now() does.
+    While the clock is frozen (see frozen_clock), the frozen time instead.
+    """
+    frozen_at = _frozen_at.get()
+    if frozen_at is None:
+        return datetime.now(tz=tz)
+    if tz is None:
+        return frozen_at.astimezone().replace(tzinfo=None)
+    return frozen_at.astimezone(tz)
+
+
+@contextmanager
+def frozen_clock(at: datetime) -> Iterator[datetime]:
+    """
+    Freeze the clock of the probes at <at> (timezone-aware) within the block,
+    and the tasks and threads started in its context (e.g., by call_probe).
+    """
+    if at.tzinfo is None:
+        raise ValueError(f"The frozen time must have a timezone: {at}")
+    token = _frozen_at.set(at)
+    try:
+        yield at
+    finally:
+        _frozen_at.reset(token)
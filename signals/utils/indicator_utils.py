@@ -0,0 +1,215 @@
+import os
+import re
+from dataclasses import dataclass
+
+import polars as pl
+from utils.cache_utils import get_cache_path
+
+# Kinds of indicators, each computed per ticker over the bars sorted by date, with the
+# name of its column in the results, e.g. SMA50 (<kind><window>)
+INDICATOR_NAMES = {
+    "sma": "SMA",  # Simple moving average of the close
+    "ema": "EMA",  # Exponential moving average of the close (span <window>)
+    "rsi": "RSI",  # Wilder's relative strength index, 0 to 100
+    "bbu": "BBU",  # Upper Bollinger band: SMA + <num_std> standard deviations
+    "bbl": "BBL",  # Lower Bollinger band: SMA - <num_std> standard deviations
+    "drawdown": "DRAWDOWN",  # Close relative to its highest close over <window> bars, minus 1
+    "return": "RETURN",  # Close relative to the close <window> bars before, minus 1
+}
+# The recursive indicators depend on the whole history, not on a bounded window of bars
+RECURSIVE_KINDS = {"ema", "rsi"}
+# Number of windows after which the weight of the bars before a recursive indicator's history is negligible
+RECURSIVE_WARMUP = 4
+
+
+def rsi(change: pl.Expr, window: int) -> pl.Expr:
+    """Wilder's RSI of the closes whose changes from a bar to the next are <change>."""
+    gain = change.clip(lower_bound=0).ewm_mean(
+        alpha=1 / window, adjust=False, min_samples=window
+    )
+    loss = (
+        (-change)
+        .clip(lower_bound=0)
+        .ewm_mean(alpha=1 / window, adjust=False, min_samples=window)
+    )
+    return (
+        pl.when(loss == 0).then(pl.lit(100.0)).otherwise(100 - 100 / (1 + gain / loss))
+    )
+
+
+@dataclass(frozen=True)
+class Indicator:
+    """An indicator of the close, computed over a window of <window> bars."""
+
+    kind: str
+    window: int
+    num_std: float = 2.0
+
+    def __post_init__(self):
+        if self.kind not in INDICATOR_NAMES:
+            raise ValueError(f"Unknown indicator: {self.kind}")
+        if self.window < 1:
+            raise ValueError(f"Invalid window of {self.kind}: {self.window}")
+
+    @classmethod
+    def parse(cls, spec: str) -> "Indicator":
+        """Parse an indicator spec like sma50, EMA20, rsi14 or bbu20."""
+        match = re.fullmatch(r"([a-z]+)(\d+)", spec.strip().lower())
+        if match is None:
+            raise ValueError(f"Invalid indicator: {spec}")
+        return cls(match[1], int(match[2]))
+
+    @property
+    def name(self) -> str:
+        return f"{INDICATOR_NAMES[self.kind]}{self.window}"
+
+    @property
+    def required_bars(self) -> int | None:
+        """Number of trailing bars the latest value depends on, None for the whole history."""
+        if self.kind in RECURSIVE_KINDS:
+            return None
+        return self.window + 1 if self.kind == "return" else self.window
+
+    @property
+    def history_bars(self) -> int:
+        """Number of bars to compute the latest value over: the recursive indicators are warmed up over several windows."""
+        return self.required_bars or RECURSIVE_WARMUP * self.window
+
+    def inputs(self) -> dict[str, pl.Expr]:
+        """Intermediate columns the indicator is computed from, shared by name with the other indicators."""
+        close = pl.col("Close")
+        window = self.window
+        if self.kind in ("sma", "bbu", "bbl"):
+            inputs = {f"_mean{window}": close.rolling_mean(window)}
+            if self.kind != "sma":
+                inputs[f"_std{window}"] = close.rolling_std(window)
+            return inputs
+        if self.kind == "rsi":
+            return {"_change": close.diff()}
+        if self.kind == "drawdown":
+            return {f"_max{window}": close.rolling_max(window)}
+        return {}
+
+    def expr(self) -> pl.Expr:
+        close = pl.col("Close")
+        window = self.window
+        if self.kind == "sma":
+            value = pl.col(f"_mean{window}")
+        elif self.kind in ("bbu", "bbl"):
+            sign = 1 if self.kind == "bbu" else -1
+            value = pl.col(f"_mean{window}") + sign * self.num_std * pl.col(
+                f"_std{window}"
+            )
+        elif self.kind == "ema":
+            value = close.ewm_mean(span=window, adjust=False, min_samples=window)
+        elif self.kind == "rsi":
+            value = rsi(pl.col("_change"), window)
+        elif self.kind == "drawdown":
+            value = close / pl.col(f"_max{window}") - 1
+        else:
+            value = close / close.shift(window) - 1
+        return value.alias(self.name)
+
+    def latest_expr(self) -> pl.Expr:
+        """Aggregation of the bars of a ticker into the indicator's value at its last bar."""
+        close = pl.col("Close")
+        window = self.window
+        if self.kind == "rsi":
+            return rsi(close.diff(), window).last().alias(self.name)
+        if self.kind == "ema":
+            return self.expr().last()
+        # The windowed indicators only aggregate the trailing bars
+        trailing = close.tail(self.required_bars)
+        if self.kind == "sma":
+            value = trailing.mean()
+        elif self.kind in ("bbu", "bbl"):
+            sign = 1 if self.kind == "bbu" else -1
+            value = trailing.mean() + sign * self.num_std * trailing.std()
+        elif self.kind == "drawdown":
+            value = close.last() / trailing.max() - 1
+        else:
+            value = close.last() / trailing.first() - 1
+        return pl.when(pl.len() >= self.required_bars).then(value).alias(self.name)
+
+
+def parse_indicators(specs: str) -> list[Indicator]:
+    """Parse comma-separated indicator specs, e.g. "sma50,ema20,rsi14"."""
+    return [Indicator.parse(spec) for spec in specs.split(",") if spec.strip()]
+
+
+def to_lazy_ohlcv(ohlcv_by_ticker: dict[str, pl.DataFrame]) -> pl.LazyFrame:
+    """Stack the bars of each ticker into one lazy frame of (Ticker, Date, Close) rows."""
+    return pl.concat(
+        [
+            pl.LazyFrame(ohlcv).select(
+                pl.lit(ticker).alias("Ticker"),
+                pl.col("Date").cast(pl.Date),
+                pl.col("Close").cast(pl.Float64),
+            )
+            for ticker, ohlcv in ohlcv_by_ticker.items()
+        ],
+        how="vertical_relaxed",
+    )
+
+
+def scan_cached_ohlcv(cache_dir: str, tickers: list[str]) -> pl.LazyFrame:
+    """Lazily scan the cached bars of <tickers> (see cache_utils), those without a cache file being left out."""
+    return pl.concat(
+        [
+            pl.scan_parquet(path).select(
+                pl.lit(ticker).alias("Ticker"),
+                pl.col("Date").cast(pl.Date),
+                pl.col("Close").cast(pl.Float64),
+            )
+            for ticker in tickers
+            if os.path.exists(path := get_cache_path(cache_dir, ticker))
+        ]
+        or [
+            pl.LazyFrame(
+                schema={"Ticker": pl.String, "Date": pl.Date, "Close": pl.Float64}
+            )
+        ],
+        how="vertical_relaxed",
+    )
+
+
+def compute_indicators(
+    ohlcv: pl.LazyFrame, indicators: list[Indicator]
+) -> pl.LazyFrame:
+    """
+    Add a column per indicator to <ohlcv>, (Ticker, Date, Close) rows of many tickers with the bars
+    of each ticker sorted by date (as returned by the market data providers and the cache).
+    It's a single query plan: the inputs shared by several indicators (rolling windows, changes)
+    are computed once.
+    """
+    indicators = list(dict.fromkeys(indicators))
+    inputs = {}
+    for indicator in indicators:
+        inputs.update(indicator.inputs())
+    return (
+        ohlcv.drop_nulls("Close")
+        .with_columns(expr.over("Ticker").alias(name) for name, expr in inputs.items())
+        .with_columns(indicator.expr().over("Ticker") for indicator in indicators)
+        .drop(list(inputs))
+    )
+
+
+def compute_latest_indicators(
+    ohlcv: pl.LazyFrame, indicators: list[Indicator]
+) -> pl.DataFrame:
+    """
+    Return one row per ticker of <ohlcv> (see compute_indicators) with its number of bars and
+    the date, close and indicators of its last bar, aggregated in a single pass over the bars
+    grouped by ticker. An indicator lacking bars to be computed is null.
+    """
+    return (
+        ohlcv.drop_nulls("Close")
+        .group_by("Ticker", maintain_order=True)
+        .agg(
+            pl.len().alias("Bars"),
+            pl.col("Date").last(),
+            pl.col("Close").last(),
+            *(indicator.latest_expr() for indicator in dict.fromkeys(indicators)),
+        )
+        .collect()
+    )
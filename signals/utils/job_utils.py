@@ -0,0 +1,213 @@
+import asyncio
+import inspect
+import logging
+import time
+import tomllib
+from concurrent.futures import Executor, ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+import typer
+from typing_extensions import Annotated
+from utils.async_utils import call_probe
+from utils.cli_utils import get_envvar_params, import_command
+from utils.metrics_utils import IMPORT, ProbeMetrics, phase, record_probe, write_report
+from utils.signal_utils import digest_signals
+
+logging.basicConfig(
+    format="%(asctime)s %(levelname)-8s %(message)s",
+    level=logging.INFO,
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Job:
+    """A monitoring job: a probe and the parameters it's called with."""
+
+    name: str
+    probe: str
+    params: dict[str, Any] = field(default_factory=dict)
+    # Cron expression of the job's runs in serve mode, evaluated in <timezone>
+    schedule: str | None = None
+    timezone: str = "UTC"
+
+
+@dataclass
+class JobResult:
+    """The outcome of a monitoring job run."""
+
+    name: str
+    probe: str
+    succeeded: bool
+    duration_s: float
+    result: Any = None
+    error: str | None = None
+    metrics: ProbeMetrics | None = None
+
+
+def load_jobs(manifest_path: str) -> list[Job]:
+    """
+    Load the jobs of a TOML manifest with one [[jobs]] table per monitoring job, e.g.:
+
+        [[jobs]]
+        name = "Euronext SMA crossovers"
+        probe = "sma_crossover"
+        params = { tickers = ["CW8.PA", "ESE.PA"], lookbacks = "50,200", ... }
+        schedule = "31 17 * * 1-5"  # Only used by serve
+        timezone = "Europe/Paris"
+    """
+    with open(manifest_path, "rb") as f:
+        manifest = tomllib.load(f)
+
+    jobs = []
+    for i, job in enumerate(manifest.get("jobs", [])):
+        if "probe" not in job:
+            raise ValueError(f"Job #{i} of {manifest_path} has no probe")
+        jobs.append(
+            Job(
+                name=job.get("name", f"{job['probe']} #{i}"),
+                probe=job["probe"],
+                params=job.get("params", {}),
+                schedule=job.get("schedule"),
+                timezone=job.get("timezone", "UTC"),
+            )
+        )
+    names = [job.name for job in jobs]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Job names of {manifest_path} must be unique")
+    return jobs
+
+
+def resolve_job_function(job: Job) -> Callable:
+    """Import the probe of <job> and check its parameters before anything runs."""
+    function = import_command(job.probe)
+    try:
+        inspect.signature(function).bind(
+            **{**get_envvar_params(function), **job.params}
+        )
+    except TypeError as e:
+        raise ValueError(f"Invalid params for job {job.name}: {e}") from e
+    return function
+
+
+async def run_job(
+    job: Job,
+    function: Callable,
+    executor: Executor,
+    semaphore: asyncio.Semaphore,
+    metrics: ProbeMetrics,
+) -> JobResult:
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            with record_probe(metrics):
+                result = await call_probe(
+                    function, {**get_envvar_params(function), **job.params}, executor
+                )
+        except Exception as e:
+            logger.exception(f"Job {job.name} failed")
+            return JobResult(
+                name=job.name,
+                probe=job.probe,
+                succeeded=False,
+                duration_s=time.perf_counter() - start,
+                error=f"{type(e).__name__}: {e}",
+                metrics=metrics,
+            )
+        return JobResult(
+            name=job.name,
+            probe=job.probe,
+            succeeded=True,
+            duration_s=time.perf_counter() - start,
+            result=result,
+            metrics=metrics,
+        )
+
+
+async def run_jobs_async(jobs: list[Job], max_workers: int) -> list[JobResult]:
+    """
+    Run independent <jobs> concurrently, at most <max_workers> at a time.
+    Async probes run on the event loop, sync ones in a pool of <max_workers> threads
+    (the probes mostly wait on I/O). Results are returned in the order of <jobs>.
+    """
+    metrics = [ProbeMetrics(probe=job.probe, job=job.name) for job in jobs]
+    functions = []
+    for job, job_metrics in zip(jobs, metrics):
+        with record_probe(job_metrics), phase(IMPORT):
+            functions.append(resolve_job_function(job))
+    semaphore = asyncio.Semaphore(max_workers)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(
+            await asyncio.gather(
+                *(
+                    run_job(job, function, executor, semaphore, job_metrics)
+                    for job, function, job_metrics in zip(jobs, functions, metrics)
+                )
+            )
+        )
+
+
+def run_jobs_concurrently(jobs: list[Job], max_workers: int) -> list[JobResult]:
+    return asyncio.run(run_jobs_async(jobs, max_workers))
+
+
+def format_report(results: list[JobResult]) -> str:
+    lines = []
+    for r in results:
+        outcome = f"ok → {r.result}" if r.succeeded else f"FAILED → {r.error}"
+        lines.append(f"{r.name} [{r.probe}] {r.duration_s:.2f}s {outcome}")
+    n_failed = sum(not r.succeeded for r in results)
+    lines.append(f"{len(results) - n_failed} succeeded, {n_failed} failed")
+    return "\n".join(lines)
+
+
+def run_jobs(
+    manifest: Annotated[
+        str, typer.Argument(help="Path to the TOML manifest listing the jobs to run")
+    ],
+    max_workers: Annotated[
+        int, typer.Option(help="Maximum number of jobs running at the same time")
+    ] = 4,
+    digest: Annotated[
+        bool,
+        typer.Option(
+            envvar="SIGNALS_DIGEST",
+            help="Coalesce the messages of all the jobs into one or a few messages per chat, sent once they're all done",
+        ),
+    ] = False,
+    digest_urgent: Annotated[
+        bool,
+        typer.Option(
+            help="In digest mode, send the urgent messages (e.g., state changes) right away"
+        ),
+    ] = True,
+    metrics_path: Annotated[
+        str | None,
+        typer.Option(
+            envvar="SIGNALS_METRICS_PATH",
+            help="Path of the run report with the timings and counters of each job, in the Prometheus text format if it ends with .prom, in JSON otherwise",
+        ),
+    ] = None,
+) -> list[JobResult]:
+    """
+    Run all the monitoring jobs of a manifest in one process
+    """
+    jobs = load_jobs(manifest)
+    logger.info(f"Running {len(jobs)} job(s) from {manifest}")
+
+    start = time.perf_counter()
+    with digest_signals(digest_urgent) if digest else nullcontext():
+        results = run_jobs_concurrently(jobs, max_workers)
+    logger.info(
+        f"Ran {len(jobs)} job(s) in {time.perf_counter() - start:.2f}s\n"
+        + format_report(results)
+    )
+    if metrics_path:
+        write_report(metrics_path, [r.metrics for r in results])
+
+    if not all(r.succeeded for r in results):
+        raise typer.Exit(code=1)
+    return results
@@ -0,0 +1,229 @@
+import logging
+import os
+from abc import ABC, abstractmethod
+from datetime import date
+from urllib.parse import parse_qs
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pandas as pd
+import polars as pl
+import yfinance as yf
+from utils.cache_utils import get_cache_path
+from utils.calendar_utils import get_calendar
+from utils.clock_utils import get_now
+from utils.metrics_utils import count
+from utils.resilience_utils import TransientError, get_host_policy, resilient_call
+
+logger = logging.getLogger(__name__)
+
+OHLCV_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+OHLCV_SCHEMA = {"Date": pl.Date, **{column: pl.Float64 for column in OHLCV_COLUMNS}}
+YAHOO_FINANCE_HOST = "query2.finance.yahoo.com"
+# Interval of the bars the intraday prices are taken from
+INTRADAY_INTERVAL = "1m"
+
+
+class MarketDataProvider(ABC):
+    """Source of daily OHLCV bars, returned as normalized polars frames, and of intraday prices."""
+
+    @abstractmethod
+    def get_ohlcv(self, tickers: list[str], start: date) -> dict[str, pl.DataFrame]:
+        """
+        Return the daily bars of each of <tickers> since <start>, with the columns of OHLCV_SCHEMA,
+        sorted by date and without the bars lacking a close.
+        A ticker without data gets an empty frame, while a failure of the whole source raises.
+        """
+
+    def get_latest_prices(self, tickers: list[str]) -> dict[str, float]:
+        """
+        Return the latest traded price of each of <tickers> in a single request, e.g. the close
+        of the last intraday bar. A ticker without a price today is left out.
+        """
+        raise NotImplementedError(f"{type(self).__name__} has no intraday prices")
+
+
+class YFinanceProvider(MarketDataProvider):
+    """Bars downloaded from Yahoo Finance, all the tickers in a single request."""
+
+    def get_ohlcv(self, tickers: list[str], start: date) -> dict[str, pl.DataFrame]:
+        # yfinance fans the grouped request out over its own bounded thread pool,
+        # while the host slot taken by resilient_call bounds the downloads of concurrent jobs
+        raw = resilient_call(
+            YAHOO_FINANCE_HOST,
+            lambda: download_from_yahoo(
+                "Ticker", tickers, interval="1d", start=start.strftime("%Y-%m-%d")
+            ),
+        )
+        # yfinance doesn't expose the size of its responses: the bars are counted instead
+        count("bars_downloaded", raw.shape[0] * len(tickers))
+        return ohlcv_from_pandas(raw, tickers)
+
+    def get_latest_prices(self, tickers: list[str]) -> dict[str, float]:
+        # Only today's 1-minute bars are downloaded, whatever the number of tickers
+        raw = resilient_call(
+            YAHOO_FINANCE_HOST,
+            lambda: download_from_yahoo(
+                "Intraday", tickers, period="1d", interval=INTRADAY_INTERVAL
+            ),
+        )
+        count("bars_downloaded", raw.shape[0] * len(tickers))
+        return {
+            ticker: ohlcv["Close"][-1]
+            for ticker, ohlcv in ohlcv_from_pandas(raw, tickers).items()
+            if not ohlcv.is_empty()
+        }
+
+
+def download_from_yahoo(kind: str, tickers: list[str], **kwargs) -> pd.DataFrame:
+    """
+    Download the bars of <tickers> with yf.download, raising a TransientError when the whole
+    download failed, so that resilient_call retries it and counts it against the circuit breaker
+    of Yahoo Finance: yfinance only logs the failures, returning None, an empty frame or NaN columns.
+    The tickers that failed on their own (e.g., a delisted one) are left with NaN columns,
+    which get them an empty frame rather than failing the others.
+    """
+    raw = yf.download(
+        tickers, timeout=get_host_policy(YAHOO_FINANCE_HOST).timeout_s, **kwargs
+    )
+    if raw is None or raw.empty or raw.isna().all(axis=None):
+        raise TransientError(f"{kind} download from Yahoo Finance failed")
+    return raw
+
+
+class ReplayProvider(MarketDataProvider):
+    """
+    Bars replayed from <directory>, holding one <ticker>.parquet or <ticker>.csv file per ticker
+    (e.g., an OHLCV cache directory), to run the probes offline.
+    The bars after the current day are left out, and so is the current day's bar until the session
+    of <exchange> (see calendar_utils) has closed, so that a past day replayed with a frozen clock
+    (see clock_utils) looks as it did then. Without <exchange>, the current day's bar, in UTC, is always left out.
+    """
+
+    def __init__(self, directory: str, exchange: str | None = None):
+        self.directory = directory
+        self.exchange = exchange
+
+    def read_ohlcv(self, ticker: str) -> pl.DataFrame:
+        parquet_path = get_cache_path(self.directory, ticker)
+        csv_path = parquet_path.removesuffix(".parquet") + ".csv"
+        if os.path.exists(parquet_path):
+            return pl.read_parquet(parquet_path)
+        if os.path.exists(csv_path):
+            return pl.read_csv(csv_path, try_parse_dates=True)
+        logger.warning(f"No recorded bars for {ticker} in {self.directory}")
+        return empty_ohlcv()
+
+    def is_completed(self) -> pl.Expr:
+        """Whether a bar's session had closed at the current time."""
+        if self.exchange is None:
+            return pl.col("Date") < get_now(tz=ZoneInfo("UTC")).date()
+        calendar = get_calendar(self.exchange)
+        now = get_now(tz=ZoneInfo(calendar.timezone))
+        if calendar.last_completed_session(now) == now.date():
+            return pl.col("Date") <= now.date()
+        return pl.col("Date") < now.date()
+
+    def read_bars_until_today(self, ticker: str) -> pl.DataFrame:
+        return normalize_ohlcv(self.read_ohlcv(ticker)).filter(self.is_completed())
+
+    def get_ohlcv(self, tickers: list[str], start: date) -> dict[str, pl.DataFrame]:
+        return {
+            ticker: self.read_bars_until_today(ticker).filter(pl.col("Date") >= start)
+            for ticker in tickers
+        }
+
+    def get_latest_prices(self, tickers: list[str]) -> dict[str, float]:
+        # The last recorded close stands for the live price
+        prices = {}
+        for ticker in tickers:
+            closes = self.read_bars_until_today(ticker)["Close"]
+            if len(closes):
+                prices[ticker] = closes[-1]
+        return prices
+
+
+def empty_ohlcv() -> pl.DataFrame:
+    return pl.DataFrame(schema=OHLCV_SCHEMA)
+
+
+def normalize_ohlcv(ohlcv: pl.DataFrame) -> pl.DataFrame:
+    """
+    Cast the bars to OHLCV_SCHEMA, filling the missing columns with nulls.
+    The columns already of the right type are kept as is, and the bars are only filtered
+    and sorted when some lack a close or are out of order, so that the columns aren't
+    copied again otherwise.
+    """
+    ohlcv = ohlcv.select(
+        pl.col("Date").cast(pl.Date),
+        *(
+            pl.col(column).cast(pl.Float64)
+            if column in ohlcv.columns
+            else pl.lit(None, dtype=pl.Float64).alias(column)
+            for column in OHLCV_COLUMNS
+        ),
+    )
+    if ohlcv["Close"].null_count():
+        ohlcv = ohlcv.drop_nulls("Close")
+    if not ohlcv["Date"].is_sorted():
+        ohlcv = ohlcv.sort("Date")
+    return ohlcv
+
+
+def ohlcv_from_pandas(raw: pd.DataFrame, tickers: list[str]) -> dict[str, pl.DataFrame]:
+    """
+    Split <raw>, the bars of many tickers indexed by date with (Price, Ticker) columns, as
+    downloaded by yfinance, into the normalized bars of each of <tickers> (see normalize_ohlcv).
+    The prices are read as a single float64 array, each column of which is copied once into
+    its polars series, with the NaNs turned into nulls, and the dates are converted once
+    for all the tickers. A ticker without a close column gets an empty frame.
+    """
+    # A view of the frame's block when all its columns are float64, a single copy otherwise
+    values = raw.to_numpy(dtype=np.float64)
+    index = raw.index
+    if isinstance(index, pd.DatetimeIndex) and index.tz is not None:
+        # The local dates of the exchange, not the UTC ones
+        index = index.tz_localize(None)
+    dates = pl.Series("Date", index.to_numpy()).cast(pl.Date)
+    if index.is_monotonic_increasing:
+        dates = dates.set_sorted()
+    positions = {column: i for i, column in enumerate(raw.columns)}
+
+    ohlcv_by_ticker = {}
+    for ticker in tickers:
+        if ("Close", ticker) not in positions:
+            ohlcv_by_ticker[ticker] = empty_ohlcv()
+            continue
+        ohlcv_by_ticker[ticker] = normalize_ohlcv(
+            pl.DataFrame(
+                [
+                    dates,
+                    *(
+                        pl.Series(
+                            column,
+                            values[:, positions[column, ticker]],
+                            nan_to_null=True,
+                        )
+                        for column in OHLCV_COLUMNS
+                        if (column, ticker) in positions
+                    ),
+                ]
+            )
+        )
+    return ohlcv_by_ticker
+
+
+def get_market_data_provider(url: str | None = None) -> MarketDataProvider:
+    """
+    Return the provider described by <url>, or else by the SIGNALS_MARKET_DATA env var:
+    yfinance (the default) or replay://<directory>[?exchange=<exchange>].
+    """
+    url = url or os.getenv("SIGNALS_MARKET_DATA") or "yfinance"
+    if url == "yfinance":
+        return YFinanceProvider()
+    scheme, separator, path = url.partition("://")
+    path, _, query = path.partition("?")
+    if scheme == "replay" and separator and path:
+        exchange = parse_qs(query).get("exchange")
+        return ReplayProvider(path, exchange[0] if exchange else None)
+    raise ValueError(f"Unsupported market data provider: {url}")
@@ -0,0 +1,203 @@
+import functools
+import json
+import os
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Callable
+
+# Phases of a probe invocation, in the order they usually happen
+IMPORT = "import"
+FETCH = "fetch"
+COMPUTE = "compute"
+SIGNAL = "signal"
+# Reads and writes of the state store
+PERSIST = "persist"
+
+
+@dataclass
+class ProbeMetrics:
+    """Timings and counters of one probe invocation (e.g., a job of run_jobs)."""
+
+    probe: str
+    job: str | None = None
+    started_at: str = field(
+        default_factory=lambda: datetime.now(timezone.utc).isoformat()
+    )
+    duration_s: float = 0.0
+    succeeded: bool | None = None
+    # Seconds spent in each phase, summed over the phase's occurrences
+    phases_s: dict[str, float] = field(default_factory=dict)
+    # Seconds spent in the calls to each upstream host, including the wait for a slot
+    upstreams_s: dict[str, float] = field(default_factory=dict)
+    # e.g., bytes_downloaded, rows_downloaded, retries
+    counters: dict[str, float] = field(default_factory=dict)
+
+    def add_time(self, phase: str, seconds: float) -> None:
+        self.phases_s[phase] = self.phases_s.get(phase, 0.0) + seconds
+
+    def add_upstream_time(self, host: str, seconds: float) -> None:
+        self.upstreams_s[host] = self.upstreams_s.get(host, 0.0) + seconds
+
+    def add(self, counter: str, value: float = 1) -> None:
+        self.counters[counter] = self.counters.get(counter, 0) + value
+
+
+# The probe invocation being recorded: each job runs in its own context
+# (asyncio task, or thread started from a copy of the task's context)
+_current: ContextVar[ProbeMetrics | None] = ContextVar("probe_metrics", default=None)
+
+
+def current_metrics() -> ProbeMetrics | None:
+    return _current.get()
+
+
+@contextmanager
+def record_probe(metrics: ProbeMetrics) -> Iterator[ProbeMetrics]:
+    """
+    Record the phases and counters of the code run within the block into <metrics>,
+    along with its duration and outcome.
+    """
+    token = _current.set(metrics)
+    start = time.perf_counter()
+    try:
+        yield metrics
+        metrics.succeeded = True
+    except BaseException:
+        metrics.succeeded = False
+        raise
+    finally:
+        metrics.duration_s += time.perf_counter() - start
+        _current.reset(token)
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Time the block as the phase <name> of the probe invocation being recorded, if any."""
+    metrics = _current.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            metrics.add_time(name, time.perf_counter() - start)
+
+
+@contextmanager
+def upstream(host: str) -> Iterator[None]:
+    """Time the block as a call to the upstream <host>."""
+    metrics = _current.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            metrics.add_upstream_time(host, time.perf_counter() - start)
+
+
+def count(counter: str, value: float = 1) -> None:
+    """Add <value> to the <counter> of the probe invocation being recorded, if any."""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.add(counter, value)
+
+
+def format_json(metrics: list[ProbeMetrics]) -> str:
+    return json.dumps(
+        {
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+            "probes": [asdict(m) for m in metrics],
+        },
+        indent=2,
+        ensure_ascii=False,
+    )
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels: str | None) -> str:
+    return ",".join(
+        f'{name}="{_escape_label(value)}"'
+        for name, value in labels.items()
+        if value is not None
+    )
+
+
+def format_prometheus(metrics: list[ProbeMetrics]) -> str:
+    """Format <metrics> in the Prometheus text exposition format (e.g., for the node exporter's textfile collector)."""
+    samples: dict[str, list[str]] = {}
+
+    def sample(name: str, value: float, **labels: str | None) -> None:
+        samples.setdefault(name, []).append(f"{name}{{{_labels(**labels)}}} {value}")
+
+    for m in metrics:
+        sample("signals_probe_duration_seconds", m.duration_s, probe=m.probe, job=m.job)
+        sample(
+            "signals_probe_succeeded", int(bool(m.succeeded)), probe=m.probe, job=m.job
+        )
+        for name, seconds in m.phases_s.items():
+            sample(
+                "signals_probe_phase_seconds",
+                seconds,
+                probe=m.probe,
+                job=m.job,
+                phase=name,
+            )
+        for host, seconds in m.upstreams_s.items():
+            sample(
+                "signals_probe_upstream_seconds",
+                seconds,
+                probe=m.probe,
+                job=m.job,
+                host=host,
+            )
+        for name, value in m.counters.items():
+            sample(f"signals_probe_{name}", value, probe=m.probe, job=m.job)
+
+    lines = []
+    for name, name_samples in samples.items():
+        lines.append(f"# TYPE {name} gauge")
+        lines.extend(name_samples)
+    return "\n".join(lines) + "\n"
+
+
+def write_report(path: str, metrics: list[ProbeMetrics]) -> None:
+    """
+    Atomically write the run report of <metrics> to <path>:
+    in the Prometheus text format if it ends with .prom, in JSON otherwise.
+    """
+    report = (
+        format_prometheus(metrics) if path.endswith(".prom") else format_json(metrics)
+    )
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(report)
+    os.replace(tmp_path, path)
+
+
+def instrument(function: Callable, probe: str, import_s: float = 0.0) -> Callable:
+    """
+    Wrap the probe <function>, run as a command, so that its invocation is recorded
+    and reported to SIGNALS_METRICS_PATH, if set.
+    """
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        metrics = ProbeMetrics(probe=probe)
+        metrics.add_time(IMPORT, import_s)
+        try:
+            with record_probe(metrics):
+                return function(*args, **kwargs)
+        finally:
+            if metrics_path := os.getenv("SIGNALS_METRICS_PATH"):
+                write_report(metrics_path, [metrics])
+
+    return wrapper
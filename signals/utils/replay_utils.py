@@ -0,0 +1,225 @@
+import asyncio
+import inspect
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+import typer
+from typing_extensions import Annotated
+from utils.async_utils import call_probe
+from utils.calendar_utils import EXCHANGES
+from utils.cli_utils import get_envvar_params
+from utils.clock_utils import frozen_clock
+from utils.job_utils import Job, load_jobs, resolve_job_function
+from utils.schedule_utils import CronSchedule
+from utils.signal_utils import sink_signals
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ReplayRun:
+    """A run of a job at one of its scheduled times, on its exchange's <day>."""
+
+    job: Job
+    at: datetime
+    day: date
+
+
+def get_replay_runs(jobs: list[Job], start: date, end: date) -> list[ReplayRun]:
+    """The runs of <jobs> on their cron schedules from <start> to <end> (included), in time order."""
+    unscheduled = [job.name for job in jobs if not job.schedule]
+    if unscheduled:
+        raise ValueError(f"Jobs without a schedule: {', '.join(unscheduled)}")
+    runs = []
+    for job in jobs:
+        tz = ZoneInfo(job.timezone)
+        schedule = CronSchedule.parse(job.schedule, job.timezone)
+        at = schedule.next_after(
+            datetime.combine(start, time(0), tzinfo=tz) - timedelta(microseconds=1)
+        )
+        while at.date() <= end:
+            runs.append(ReplayRun(job=job, at=at, day=at.date()))
+            at = schedule.next_after(at)
+    return sorted(runs, key=lambda run: run.at)
+
+
+def split_days(start: date, end: date, chunks: int) -> list[tuple[date, date]]:
+    """Split the days from <start> to <end> (included) into up to <chunks> contiguous ranges of about the same length."""
+    n_days = (end - start).days + 1
+    chunks = max(1, min(chunks, n_days))
+    ranges = []
+    first = 0
+    for i in range(chunks):
+        last = first + n_days // chunks + (i < n_days % chunks) - 1
+        ranges.append((start + timedelta(days=first), start + timedelta(days=last)))
+        first = last + 1
+    return ranges
+
+
+def get_job_exchange(job: Job) -> str | None:
+    """The exchange of the job's <exchange> param, or else the one in the job's timezone, if any."""
+    if job.params.get("exchange"):
+        return job.params["exchange"]
+    return next(
+        (name for name, rules in EXCHANGES.items() if rules.timezone == job.timezone),
+        None,
+    )
+
+
+def init_worker() -> None:
+    # The signals are captured, the credentials are only checked for
+    os.environ.setdefault("TELEGRAM_CHAT_ID", "replay")
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "replay")
+    # The logs of thousands of runs would drown the report
+    logging.getLogger().setLevel(logging.WARNING)
+
+
+def replay_runs(
+    runs: list[ReplayRun], first_day: date, state_url: str, data_dir: str
+) -> list[dict]:
+    """
+    Run each of <runs> in order with the clock frozen at its time against the bars of <data_dir>,
+    and return its signals and failures, except for the runs before <first_day>, which only warm up
+    the states kept in <state_url>.
+    """
+    functions = {}
+    records = []
+    for run in runs:
+        job = run.job
+        if job.name not in functions:
+            functions[job.name] = resolve_job_function(job)
+        function = functions[job.name]
+        params = {**get_envvar_params(function), **job.params}
+        parameters = inspect.signature(function).parameters
+        # Each worker keeps the states of its runs in its own store, away from the live one
+        if "state_url" in parameters:
+            params["state_url"] = state_url
+        # The replayed bars are read as is, without updating a cache
+        if "cache_dir" in parameters:
+            params["cache_dir"] = None
+
+        # The market data of the probe are the bars of <data_dir> whose sessions had closed
+        exchange = get_job_exchange(job)
+        os.environ["SIGNALS_MARKET_DATA"] = f"replay://{data_dir}" + (
+            f"?exchange={exchange}" if exchange else ""
+        )
+
+        record = {"job": job.name, "at": run.at.isoformat()}
+        with frozen_clock(run.at), sink_signals() as sink:
+            try:
+                asyncio.run(call_probe(function, params))
+            except Exception as e:
+                record["error"] = f"{type(e).__name__}: {e}"
+        if run.day < first_day:
+            continue
+        if "error" in record:
+            records.append(record)
+        records.extend(
+            {**record, "chat_id": signal.chat_id, "text": signal.text}
+            for signal in sink.signals
+        )
+    return records
+
+
+def replay_jobs(
+    jobs: list[Job],
+    start: date,
+    end: date,
+    data_dir: str,
+    workers: int = 4,
+    warmup_days: int = 10,
+) -> list[dict]:
+    """
+    Replay the runs of <jobs> from <start> to <end> against the bars of <data_dir>, and return the
+    signals they would have sent and their failures, in time order.
+
+    The days are split into contiguous ranges replayed in parallel by <workers> processes.
+    Each one first replays the <warmup_days> before its range without recording them, so that
+    its first days start from about the states (e.g., of sma_crossover) a continuous run would have had.
+    """
+    runs = get_replay_runs(jobs, start - timedelta(days=warmup_days), end)
+    with (
+        tempfile.TemporaryDirectory() as state_dir,
+        ProcessPoolExecutor(
+            max_workers=workers,
+            # Forking a process using polars' thread pool can deadlock
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+        ) as executor,
+    ):
+        futures = [
+            executor.submit(
+                replay_runs,
+                [
+                    run
+                    for run in runs
+                    if first - timedelta(days=warmup_days) <= run.day <= last
+                ],
+                first,
+                f"sqlite://{os.path.join(state_dir, f'{i}.db')}",
+                data_dir,
+            )
+            for i, (first, last) in enumerate(split_days(start, end, workers))
+        ]
+        records = [record for future in futures for record in future.result()]
+    # The days of jobs in different timezones may overlap at the edges of the ranges
+    return sorted(records, key=lambda record: datetime.fromisoformat(record["at"]))
+
+
+def replay(
+    manifest: Annotated[
+        str,
+        typer.Argument(
+            help="Path to the TOML manifest listing the jobs to replay, each with a cron schedule"
+        ),
+    ],
+    start: Annotated[str, typer.Argument(help="First day replayed (YYYY-MM-DD)")],
+    end: Annotated[str, typer.Argument(help="Last day replayed (YYYY-MM-DD)")],
+    data_dir: Annotated[
+        str,
+        typer.Option(
+            envvar="SIGNALS_CACHE_DIR",
+            help="Directory of the replayed bars, one <ticker>.parquet or <ticker>.csv file per ticker (e.g., the OHLCV cache)",
+        ),
+    ],
+    output: Annotated[
+        str,
+        typer.Option(
+            help="Path of the JSON Lines file the signals and failures of the runs are written to"
+        ),
+    ] = "replay.jsonl",
+    workers: Annotated[
+        int, typer.Option(help="Number of processes replaying the days in parallel")
+    ] = 4,
+    warmup_days: Annotated[
+        int,
+        typer.Option(
+            help="Days each process replays before its range without recording them, to warm up the states"
+        ),
+    ] = 10,
+) -> None:
+    """
+    Replay the monitoring jobs of a manifest on past days, capturing the signals they would have sent
+    """
+    jobs = load_jobs(manifest)
+    start_day, end_day = date.fromisoformat(start), date.fromisoformat(end)
+    if start_day > end_day:
+        raise ValueError(f"The start ({start}) is after the end ({end})")
+    logger.info(
+        f"Replaying {len(jobs)} job(s) from {start_day} to {end_day} with {workers} worker(s)"
+    )
+    records = replay_jobs(jobs, start_day, end_day, data_dir, workers, warmup_days)
+    with open(output, "w") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    failures = sum("error" in record for record in records)
+    logger.info(
+        f"{len(records) - failures} signal(s) and {failures} failure(s) written to {output}"
+    )
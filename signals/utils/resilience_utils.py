@@ -0,0 +1,224 @@
+import logging
+import random
+import threading
+import time
+from collections.abc import Mapping
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable
+
+import requests
+from utils.async_utils import host_slot
+from utils.metrics_utils import count
+
+logger = logging.getLogger(__name__)
+
+# HTTP statuses worth retrying: the upstream is overloaded or temporarily failing
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+@dataclass(frozen=True)
+class HostPolicy:
+    """How the calls to an upstream host are bounded and retried."""
+
+    timeout_s: float = 10.0
+    max_retries: int = 3
+    backoff_base_s: float = 1.0
+    max_backoff_s: float = 30.0
+    # A longer Retry-After than this fails the call rather than stalling the run
+    max_retry_after_s: float = 60.0
+    # Consecutive failed attempts after which the host is short-circuited
+    failure_threshold: int = 5
+    # Delay after which a short-circuited host gets a trial call, to find out whether it recovered
+    cooldown_s: float = 60.0
+
+
+DEFAULT_HOST_POLICY = HostPolicy()
+HOST_POLICIES = {
+    "query2.finance.yahoo.com": HostPolicy(timeout_s=30.0),
+    "www.strava.com": HostPolicy(timeout_s=10.0),
+    "www.googleapis.com": HostPolicy(timeout_s=30.0),
+    "api.telegram.org": HostPolicy(timeout_s=10.0, max_retries=5),
+}
+
+
+def get_host_policy(host: str) -> HostPolicy:
+    return HOST_POLICIES.get(host, DEFAULT_HOST_POLICY)
+
+
+class TransientError(Exception):
+    """A failure of an upstream worth retrying, reported by a client library rather than an HTTP status."""
+
+
+class CircuitOpenError(Exception):
+    """The upstream host failed too many times in a row: it isn't called anymore."""
+
+
+class CircuitBreaker:
+    """
+    Counts the consecutive failed calls to a host and opens after <failure_threshold> of them,
+    so that a failing upstream fails fast instead of making every remaining job wait for its
+    timeouts and retries. Once open for <cooldown_s>, it's half-open: a single trial call goes
+    through, closing it if it succeeds, or opening it for another cooldown if it fails.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        failure_threshold: int,
+        cooldown_s: float = DEFAULT_HOST_POLICY.cooldown_s,
+    ):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.cooldown_s = cooldown_s
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.consecutive_failures >= self.failure_threshold
+
+    def check(self) -> None:
+        with self._lock:
+            if not self.is_open:
+                return
+            if time.monotonic() - self.opened_at >= self.cooldown_s:
+                # The calls made while the trial is pending still fail fast
+                self.opened_at = time.monotonic()
+                logger.info(f"Circuit breaker of {self.host} half-open, trying a call")
+                return
+        raise CircuitOpenError(
+            f"{self.host} failed {self.consecutive_failures} times in a row, not calling it for now"
+        )
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.is_open:
+                logger.info(f"Circuit breaker of {self.host} closed")
+            self.consecutive_failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.consecutive_failures == self.failure_threshold:
+                logger.error(f"Circuit breaker of {self.host} opened")
+            if self.is_open:
+                self.opened_at = time.monotonic()
+
+
+_circuit_breakers: dict[str, CircuitBreaker] = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(host: str) -> CircuitBreaker:
+    with _circuit_breakers_lock:
+        if host not in _circuit_breakers:
+            policy = get_host_policy(host)
+            _circuit_breakers[host] = CircuitBreaker(
+                host, policy.failure_threshold, policy.cooldown_s
+            )
+        return _circuit_breakers[host]
+
+
+def reset_circuit_breakers() -> None:
+    """Close all the circuit breakers, e.g. at the start of a new run in a long-lived process."""
+    with _circuit_breakers_lock:
+        _circuit_breakers.clear()
+
+
+def backoff_s(
+    attempt: int, base_s: float = 1.0, max_s: float = DEFAULT_HOST_POLICY.max_backoff_s
+) -> float:
+    """Jittered exponential backoff before the retry following the <attempt>th one (0-based)."""
+    return min(base_s * 2**attempt, max_s) * random.uniform(0.5, 1)
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Seconds to wait according to a Retry-After header, given in seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def get_status(exception: Exception) -> int | None:
+    """HTTP status of the error response behind <exception>, from requests or googleapiclient."""
+    if (response := getattr(exception, "response", None)) is not None:
+        status = getattr(response, "status_code", None)
+    else:
+        # googleapiclient's HttpError holds an httplib2 response
+        status = getattr(getattr(exception, "resp", None), "status", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(exception: Exception) -> bool:
+    """
+    Whether <exception> is transient: a timeout, a connection failure, a retryable HTTP status,
+    or a TransientError.
+    """
+    if (status := get_status(exception)) is not None:
+        return status in RETRYABLE_STATUSES
+    return isinstance(
+        exception,
+        (requests.Timeout, requests.ConnectionError, TimeoutError, TransientError),
+    )
+
+
+def get_retry_after(exception: Exception) -> float | None:
+    response = getattr(exception, "response", None)
+    # httplib2 responses are dicts of lowercase headers
+    headers = (
+        response.headers if response is not None else getattr(exception, "resp", None)
+    )
+    if not isinstance(headers, Mapping):
+        return None
+    return parse_retry_after(headers.get("Retry-After") or headers.get("retry-after"))
+
+
+def resilient_call(host: str, function: Callable[[], Any]) -> Any:
+    """
+    Call <function>, a call to the upstream <host>, within a slot of the host, retrying its
+    transient failures with a jittered exponential backoff, or after the delay asked for
+    by a Retry-After header. <function> is expected to bound its own duration with the
+    host's timeout (get_host_policy(host).timeout_s) and to raise on error statuses
+    (e.g., with raise_for_status).
+
+    Raises CircuitOpenError without calling <function> while the host's circuit breaker is open.
+    """
+    policy = get_host_policy(host)
+    circuit_breaker = get_circuit_breaker(host)
+    attempt = 0
+    while True:
+        circuit_breaker.check()
+        try:
+            with host_slot(host):
+                result = function()
+        except Exception as e:
+            if not is_retryable(e):
+                raise
+            circuit_breaker.record_failure()
+            if attempt >= policy.max_retries or circuit_breaker.is_open:
+                raise
+            delay_s = get_retry_after(e)
+            if delay_s is None:
+                delay_s = backoff_s(
+                    attempt, policy.backoff_base_s, policy.max_backoff_s
+                )
+            elif delay_s > policy.max_retry_after_s:
+                raise
+            logger.warning(f"{host}: {e}, retrying in {delay_s:.1f}s")
+            count("retries")
+            attempt += 1
+            time.sleep(delay_s)
+            continue
+        circuit_breaker.record_success()
+        return result
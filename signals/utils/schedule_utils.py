@@ -0,0 +1,128 @@
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+# (name, min, max) of the five fields of a cron expression
+CRON_FIELDS = [
+    ("minute", 0, 59),
+    ("hour", 0, 23),
+    ("day of month", 1, 31),
+    ("month", 1, 12),
+    ("day of week", 0, 7),
+]
+CRON_ALIASES = {
+    "@hourly": "0 * * * *",
+    "@daily": "0 0 * * *",
+    "@weekly": "0 0 * * 0",
+    "@monthly": "0 0 1 * *",
+}
+# Further than any date a valid expression can match (e.g., February 29th on a Monday)
+MAX_SEARCH_DAYS = 366 * 29
+
+
+def parse_cron_field(field: str, name: str, low: int, high: int) -> frozenset[int]:
+    """Values matched by a cron <field>: *, <n>, <a>-<b>, with /<step>, comma-separated."""
+    values = set()
+    for part in field.split(","):
+        range_part, _, step = part.partition("/")
+        if range_part == "*":
+            start, end = low, high
+        elif "-" in range_part:
+            start, end = (int(v) for v in range_part.split("-", 1))
+        else:
+            start = end = int(range_part)
+            if step:
+                end = high
+        step = int(step) if step else 1
+        if not (low <= start <= end <= high and step > 0):
+            raise ValueError(f"Invalid cron {name}: {field}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+@dataclass(frozen=True)
+class CronSchedule:
+    """A standard five-field cron expression, evaluated in <timezone>."""
+
+    expression: str
+    minutes: frozenset[int]
+    hours: frozenset[int]
+    days: frozenset[int]
+    months: frozenset[int]
+    # 0 is Sunday, as in cron
+    weekdays: frozenset[int]
+    # As in cron, when both the day of month and the day of week are restricted,
+    # a day matching either of them matches
+    days_or_weekdays: bool
+    timezone: str = "UTC"
+
+    @classmethod
+    def parse(cls, expression: str, timezone: str = "UTC") -> "CronSchedule":
+        fields = CRON_ALIASES.get(expression.strip(), expression).split()
+        if len(fields) != len(CRON_FIELDS):
+            raise ValueError(
+                f"Invalid cron expression (expected 5 fields): {expression}"
+            )
+        try:
+            minutes, hours, days, months, weekdays = (
+                parse_cron_field(field, *spec)
+                for field, spec in zip(fields, CRON_FIELDS)
+            )
+        except ValueError as e:
+            raise ValueError(f"{e} in {expression}") from None
+        return cls(
+            expression=expression,
+            minutes=minutes,
+            hours=hours,
+            days=days,
+            months=months,
+            # 7 is Sunday too
+            weekdays=frozenset(weekday % 7 for weekday in weekdays),
+            days_or_weekdays=fields[2] != "*" and fields[4] != "*",
+            timezone=timezone,
+        )
+
+    def matches_day(self, day: date) -> bool:
+        if day.month not in self.months:
+            return False
+        day_matches = day.day in self.days
+        # date.weekday() is 0 on Monday
+        weekday_matches = (day.weekday() + 1) % 7 in self.weekdays
+        if self.days_or_weekdays:
+            return day_matches or weekday_matches
+        return day_matches and weekday_matches
+
+    def next_after(self, at: datetime) -> datetime:
+        """First time strictly after <at> (timezone-aware) matched by the schedule, in its timezone."""
+        tz = ZoneInfo(self.timezone)
+        local = at.astimezone(tz)
+        day = local.date()
+        # Only the times from <at> on are considered on its own day
+        earliest = (local.hour, local.minute)
+        for _ in range(MAX_SEARCH_DAYS):
+            if self.matches_day(day):
+                for hour, minute in (
+                    (hour, minute)
+                    for hour in sorted(self.hours)
+                    for minute in sorted(self.minutes)
+                    if day != local.date() or (hour, minute) >= earliest
+                ):
+                    candidate = datetime.combine(day, time(hour, minute), tzinfo=tz)
+                    # Skipped by a DST transition: the wall time doesn't exist
+                    if candidate.astimezone(timezone.utc).astimezone(tz).time() != time(
+                        hour, minute
+                    ):
+                        continue
+                    if candidate > at:
+                        return candidate
+            day += timedelta(days=1)
+        raise ValueError(f"{self.expression} never matches")
+
+    def previous_before(self, at: datetime, limit: timedelta) -> datetime | None:
+        """Last time at or before <at> matched by the schedule, looking back at most <limit>."""
+        candidate = self.next_after(at - limit)
+        previous = None
+        while candidate <= at:
+            previous = candidate
+            candidate = self.next_after(candidate)
+        return previous
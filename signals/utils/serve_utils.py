@@ -0,0 +1,272 @@
+import asyncio
+import logging
+import random
+import signal
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+
+import typer
+from typing_extensions import Annotated
+from utils.job_utils import (
+    Job,
+    JobResult,
+    format_report,
+    load_jobs,
+    resolve_job_function,
+    run_job,
+)
+from utils.metrics_utils import ProbeMetrics, write_report
+from utils.resilience_utils import reset_circuit_breakers
+from utils.schedule_utils import CronSchedule
+from utils.state_utils import StateBackend, get_state_backend
+
+logger = logging.getLogger(__name__)
+
+# The scheduler wakes up at least this often, so that clock jumps (e.g., after the host slept) are noticed
+MAX_SLEEP_S = 60.0
+
+
+def get_last_run_key(job: Job) -> str:
+    return f"serve:last_run:{job.name}"
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+@dataclass
+class ScheduledJob:
+    job: Job
+    function: Callable
+    schedule: CronSchedule
+    # Scheduled time of the next run, and the time it actually fires at, once jittered
+    run_at: datetime
+    fire_at: datetime
+    task: asyncio.Task | None = None
+
+
+def get_first_run_at(
+    schedule: CronSchedule,
+    now: datetime,
+    last_run_at: datetime | None,
+    catch_up: timedelta,
+) -> datetime:
+    """
+    Scheduled time of the first run of a job: the last one missed since <last_run_at>,
+    if it's not older than <catch_up>, so that it's run right away, or else the next one.
+    Several missed runs are caught up with a single one.
+    """
+    if last_run_at is not None:
+        missed = schedule.previous_before(now, catch_up)
+        if missed is not None and missed > last_run_at:
+            return missed
+    return schedule.next_after(now)
+
+
+class Scheduler:
+    """
+    Fires the jobs of a manifest on their cron schedules, in one long-lived process,
+    so that the probes' modules, HTTP clients and caches stay warm between runs.
+
+    Each run fires up to <jitter_s> after its scheduled time. A job still running
+    when it's due again skips that run. With a <state_backend>, the scheduled time
+    of each job's last run is kept, so that a run missed while the process was down
+    is caught up on start, if it's not older than <catch_up>.
+    """
+
+    def __init__(
+        self,
+        jobs: list[Job],
+        max_workers: int = 4,
+        jitter_s: float = 0.0,
+        catch_up: timedelta = timedelta(hours=6),
+        state_backend: StateBackend | None = None,
+        metrics_path: str | None = None,
+    ):
+        if not jobs:
+            raise ValueError("No jobs to serve: the manifest lists none")
+        unscheduled = [job.name for job in jobs if not job.schedule]
+        if unscheduled:
+            raise ValueError(f"Jobs without a schedule: {', '.join(unscheduled)}")
+        self.jobs = jobs
+        self.max_workers = max_workers
+        self.jitter_s = jitter_s
+        self.catch_up = catch_up
+        self.state_backend = state_backend
+        self.metrics_path = metrics_path
+        # The probes are imported once, upfront
+        self.functions = {job.name: resolve_job_function(job) for job in jobs}
+        self.schedules = {
+            job.name: CronSchedule.parse(job.schedule, job.timezone) for job in jobs
+        }
+        self.latest_metrics: dict[str, ProbeMetrics] = {}
+        self.stop_event = asyncio.Event()
+
+    def jitter(self, run_at: datetime) -> datetime:
+        return run_at + timedelta(seconds=random.uniform(0, self.jitter_s))
+
+    def schedule_jobs(self, now: datetime) -> list[ScheduledJob]:
+        stored = (
+            self.state_backend.get_many([get_last_run_key(job) for job in self.jobs])
+            if self.state_backend
+            else {}
+        )
+        scheduled_jobs = []
+        for job in self.jobs:
+            last_run_at = stored.get(get_last_run_key(job))
+            run_at = get_first_run_at(
+                self.schedules[job.name],
+                now,
+                datetime.fromisoformat(last_run_at) if last_run_at else None,
+                self.catch_up,
+            )
+            if run_at <= now:
+                logger.info(f"Catching up the run of {job.name} missed at {run_at}")
+            scheduled_jobs.append(
+                ScheduledJob(
+                    job=job,
+                    function=self.functions[job.name],
+                    schedule=self.schedules[job.name],
+                    run_at=run_at,
+                    fire_at=self.jitter(run_at) if run_at > now else now,
+                )
+            )
+            logger.info(f"{job.name} [{job.schedule}] next runs at {run_at}")
+        return scheduled_jobs
+
+    async def fire(
+        self,
+        scheduled_job: ScheduledJob,
+        run_at: datetime,
+        executor: Executor,
+        semaphore: asyncio.Semaphore,
+    ) -> JobResult:
+        job = scheduled_job.job
+        metrics = ProbeMetrics(probe=job.probe, job=job.name)
+        result = await run_job(
+            job, scheduled_job.function, executor, semaphore, metrics
+        )
+        logger.info(
+            f"Ran {job.name} (scheduled at {run_at})\n" + format_report([result])
+        )
+        if self.state_backend:
+            self.state_backend.set(get_last_run_key(job), run_at.isoformat())
+        if self.metrics_path:
+            self.latest_metrics[job.name] = metrics
+            write_report(self.metrics_path, list(self.latest_metrics.values()))
+        return result
+
+    async def run(self) -> None:
+        """Fire the jobs on their schedules until stop() is called, then wait for the running ones."""
+        scheduled_jobs = self.schedule_jobs(utcnow())
+        semaphore = asyncio.Semaphore(self.max_workers)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while not self.stop_event.is_set():
+                now = utcnow()
+                for scheduled_job in scheduled_jobs:
+                    if scheduled_job.fire_at > now:
+                        continue
+                    run_at = scheduled_job.run_at
+                    if scheduled_job.task and not scheduled_job.task.done():
+                        logger.warning(
+                            f"{scheduled_job.job.name} is still running, skipping its run scheduled at {run_at}"
+                        )
+                    else:
+                        if not any(
+                            s.task and not s.task.done() for s in scheduled_jobs
+                        ):
+                            # A failing upstream is only short-circuited until the next runs
+                            reset_circuit_breakers()
+                        scheduled_job.task = asyncio.create_task(
+                            self.fire(scheduled_job, run_at, executor, semaphore)
+                        )
+                    # Runs missed meanwhile (e.g., the host slept) are coalesced into this one
+                    scheduled_job.run_at = scheduled_job.schedule.next_after(
+                        max(run_at, now)
+                    )
+                    scheduled_job.fire_at = self.jitter(scheduled_job.run_at)
+
+                sleep_s = min(s.fire_at for s in scheduled_jobs) - utcnow()
+                try:
+                    await asyncio.wait_for(
+                        self.stop_event.wait(),
+                        timeout=min(max(sleep_s.total_seconds(), 0), MAX_SLEEP_S),
+                    )
+                except TimeoutError:
+                    pass
+
+            running = [s.task for s in scheduled_jobs if s.task and not s.task.done()]
+            if running:
+                logger.info(f"Waiting for {len(running)} running job(s)")
+                await asyncio.gather(*running)
+
+    def stop(self) -> None:
+        self.stop_event.set()
+
+
+async def serve_jobs(scheduler: Scheduler) -> None:
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, scheduler.stop)
+    await scheduler.run()
+
+
+def serve(
+    manifest: Annotated[
+        str,
+        typer.Argument(
+            help="Path to the TOML manifest listing the jobs to run, each with a cron schedule"
+        ),
+    ],
+    max_workers: Annotated[
+        int, typer.Option(help="Maximum number of jobs running at the same time")
+    ] = 4,
+    jitter: Annotated[
+        float,
+        typer.Option(
+            help="Maximum random delay (in seconds) of each run after its scheduled time, to spread the load on the upstreams"
+        ),
+    ] = 0.0,
+    catch_up_hours: Annotated[
+        float,
+        typer.Option(
+            help="On start, the runs missed since the last run are caught up if they're not older than this"
+        ),
+    ] = 6.0,
+    state_url: Annotated[
+        str | None,
+        typer.Option(
+            envvar="SIGNALS_STATE_URL",
+            help="State store (sqlite://<path> or file://<path>) keeping the last run of each job, to catch up the missed ones",
+        ),
+    ] = None,
+    metrics_path: Annotated[
+        str | None,
+        typer.Option(
+            envvar="SIGNALS_METRICS_PATH",
+            help="Path of the report of the latest run of each job, updated after each run",
+        ),
+    ] = None,
+) -> None:
+    """
+    Run the monitoring jobs of a manifest on their schedules, in a long-lived process
+    """
+    jobs = load_jobs(manifest)
+    state_backend = get_state_backend(state_url) if state_url else None
+    scheduler = Scheduler(
+        jobs,
+        max_workers=max_workers,
+        jitter_s=jitter,
+        catch_up=timedelta(hours=catch_up_hours),
+        state_backend=state_backend,
+        metrics_path=metrics_path,
+    )
+    logger.info(f"Serving {len(jobs)} job(s) from {manifest}")
+    try:
+        asyncio.run(serve_jobs(scheduler))
+    finally:
+        if state_backend:
+            state_backend.close()
+    logger.info("Stopped")
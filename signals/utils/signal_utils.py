@@ -1,25 +1,388 @@
 import asyncio
+import atexit
 import logging
+import os
+import threading
+import warnings
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Iterator, Self
+from urllib.parse import urlparse
 
-from telegram import Bot
+import httpx
+from telegram import Bot, Message
+from telegram.error import BadRequest, NetworkError, RetryAfter
+from telegram.request import HTTPXRequest
+from telegram.warnings import PTBDeprecationWarning
+from utils.metrics_utils import ProbeMetrics, current_metrics
+from utils.resilience_utils import backoff_s, get_circuit_breaker, get_host_policy
 
 # Suppress HTTP request logs that contain the bot token
 logging.getLogger("httpx").setLevel(logging.WARNING)
 logging.getLogger("telegram").setLevel(logging.WARNING)
 
+logger = logging.getLogger(__name__)
 
-async def send_message_async(chat_id: str, message: str, token: str):
-    bot = Bot(token=token)
-    await bot.send_message(chat_id=chat_id, text=message)
+TELEGRAM_BASE_URL = "https://api.telegram.org/bot"
 
+# Telegram allows about one message per second in a given chat
+# https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this
+PER_CHAT_INTERVAL_S = 1.0
+MAX_RETRIES = 5
+MAX_BACKOFF_S = 30.0
+# https://core.telegram.org/bots/api#sendmessage
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096
 
-def send_message(chat_id: str, message: str, token: str):
+
+def is_unsent(error: NetworkError) -> bool:
+    """Whether <error> was raised before the request reached Telegram, so that retrying it can't send a message twice."""
+    return isinstance(
+        error.__cause__, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+    )
+
+
+class TelegramClient:
+    """
+    Long-lived Telegram client sending all its messages through one bot, and thus one pool of HTTP connections.
+
+    The client runs its own event loop in a background thread so that synchronous callers,
+    including concurrent ones (e.g., the jobs of run_jobs), can share it.
+    Messages to a given chat are sent in order and spaced by <per_chat_interval_s>.
+    Flood control errors are retried after the delay Telegram asks for,
+    and the network errors raised before a request reached Telegram (e.g., a refused connection)
+    with a jittered exponential backoff. The others (e.g., a read timeout) aren't retried, as the
+    message may have been delivered already.
+    Requests time out after the timeout of the Bot API host's policy, and once the host's
+    circuit breaker is open, the messages fail right away.
+    """
+
+    def __init__(
+        self,
+        token: str,
+        base_url: str = TELEGRAM_BASE_URL,
+        per_chat_interval_s: float = PER_CHAT_INTERVAL_S,
+        max_retries: int = MAX_RETRIES,
+        connection_pool_size: int = 8,
+    ):
+        self.per_chat_interval_s = per_chat_interval_s
+        self.max_retries = max_retries
+        host = urlparse(base_url).netloc
+        timeout_s = get_host_policy(host).timeout_s
+        self._circuit_breaker = get_circuit_breaker(host)
+        self._bot = Bot(
+            token=token,
+            base_url=base_url,
+            request=HTTPXRequest(
+                connection_pool_size=connection_pool_size,
+                connect_timeout=timeout_s,
+                read_timeout=timeout_s,
+                write_timeout=timeout_s,
+            ),
+        )
+        self._chat_locks: dict[str, asyncio.Lock] = {}
+        self._last_sent_at: dict[str, float] = {}
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="telegram-client", daemon=True
+        )
+        self._thread.start()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    async def _send(
+        self, chat_id: str, message: str, metrics: ProbeMetrics | None = None
+    ) -> Message:
+        # Only ever called from the client's loop, so the dicts need no locking
+        lock = self._chat_locks.setdefault(chat_id, asyncio.Lock())
+        async with lock:
+            attempt = 0
+            while True:
+                wait_s = (
+                    self._last_sent_at.get(chat_id, float("-inf"))
+                    + self.per_chat_interval_s
+                    - self._loop.time()
+                )
+                if wait_s > 0:
+                    await asyncio.sleep(wait_s)
+                self._circuit_breaker.check()
+                try:
+                    sent = await self._bot.send_message(chat_id=chat_id, text=message)
+                    self._last_sent_at[chat_id] = self._loop.time()
+                    self._circuit_breaker.record_success()
+                    return sent
+                except RetryAfter as e:
+                    if attempt >= self.max_retries:
+                        raise
+                    with warnings.catch_warnings():
+                        # Opting into the upcoming timedelta type is done by env var
+                        warnings.simplefilter("ignore", PTBDeprecationWarning)
+                        delay_s = e.retry_after
+                    if isinstance(delay_s, timedelta):
+                        delay_s = delay_s.total_seconds()
+                    logger.warning(f"Telegram flood control, retrying in {delay_s}s")
+                except BadRequest:
+                    # A malformed message won't get better by retrying
+                    raise
+                except NetworkError as e:
+                    self._circuit_breaker.record_failure()
+                    if (
+                        not is_unsent(e)
+                        or attempt >= self.max_retries
+                        or self._circuit_breaker.is_open
+                    ):
+                        raise
+                    delay_s = backoff_s(attempt, max_s=MAX_BACKOFF_S)
+                    logger.warning(f"Telegram {e}, retrying in {delay_s:.1f}s")
+                attempt += 1
+                if metrics is not None:
+                    metrics.add("retries")
+                await asyncio.sleep(delay_s)
+
+    async def send_messages_async(
+        self, messages: list[tuple[str, str]], metrics: ProbeMetrics | None = None
+    ) -> list[Message | Exception]:
+        results = await asyncio.gather(
+            *(self._send(chat_id, message, metrics) for chat_id, message in messages),
+            return_exceptions=True,
+        )
+        return list(results)
+
+    # The client's loop doesn't run in the caller's context: the caller's metrics,
+    # if any, are handed over so that the retries are counted
+    def send_message(self, chat_id: str, message: str) -> Message:
+        return self._run(self._send(chat_id, message, current_metrics()))
+
+    def send_messages(
+        self, messages: list[tuple[str, str]]
+    ) -> list[Message | Exception]:
+        """
+        Send a batch of (chat_id, message) pairs.
+        Different chats are served concurrently while the messages of a chat keep their order.
+
+        Returns, in the order of <messages>, the sent message or the exception that made it fail.
+        """
+        return self._run(self.send_messages_async(messages, current_metrics()))
+
+    def close(self) -> None:
+        if self._loop.is_closed():
+            return
+        self._run(self._bot.shutdown())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+_clients: dict[str, TelegramClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_telegram_client(token: str) -> TelegramClient:
+    """
+    Return the client of the process for the given bot <token>, creating it on first use.
+    TELEGRAM_BASE_URL can point the client to another Bot API server (e.g., a local fake one).
+    """
+    with _clients_lock:
+        if token not in _clients:
+            _clients[token] = TelegramClient(
+                token, base_url=os.getenv("TELEGRAM_BASE_URL", TELEGRAM_BASE_URL)
+            )
+        return _clients[token]
+
+
+@atexit.register
+def close_telegram_clients() -> None:
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+def telegram_length(text: str) -> int:
+    # Telegram counts UTF-16 code units, e.g. two per emoji
+    return len(text.encode("utf-16-le")) // 2
+
+
+def split_message(
+    message: str, max_length: int = TELEGRAM_MAX_MESSAGE_LENGTH
+) -> list[str]:
+    """Split <message> into parts within <max_length>, at line breaks when possible."""
+    parts = []
+    part = ""
+    for line in message.split("\n"):
+        while telegram_length(line) > max_length:
+            # A single line too long for a message is cut wherever it must
+            cut = max_length
+            while telegram_length(line[:cut]) > max_length:
+                cut -= 1
+            if part:
+                parts.append(part)
+                part = ""
+            parts.append(line[:cut])
+            line = line[cut:]
+        candidate = f"{part}\n{line}" if part else line
+        if part and telegram_length(candidate) > max_length:
+            parts.append(part)
+            candidate = line
+        part = candidate
+    if part or not parts:
+        parts.append(part)
+    return parts
+
+
+def pack_messages(
+    messages: list[str],
+    max_length: int = TELEGRAM_MAX_MESSAGE_LENGTH,
+    separator: str = "\n\n",
+) -> list[str]:
+    """Coalesce <messages>, in order, into as few messages within <max_length> as possible."""
+    packed = []
+    for message in messages:
+        for part in split_message(message, max_length):
+            candidate = f"{packed[-1]}{separator}{part}" if packed else part
+            if packed and telegram_length(candidate) <= max_length:
+                packed[-1] = candidate
+            else:
+                packed.append(part)
+    return packed
+
+
+@dataclass(frozen=True)
+class Signal:
+    """A message a probe hands over for sending."""
+
+    chat_id: str
+    text: str
+    token: str
+    # e.g., a state change: sent right away rather than with the digest
+    urgent: bool = False
+
+
+class SignalDigest:
+    """
+    Collects the signals of a run to coalesce them per chat into as few messages as Telegram's
+    length limit allows, sent when flushed. Urgent signals bypass it if <urgent_bypass>.
+    """
+
+    def __init__(self, urgent_bypass: bool = True):
+        self.urgent_bypass = urgent_bypass
+        self._signals: list[Signal] = []
+        self._lock = threading.Lock()
+
+    def add(self, signal: Signal) -> None:
+        if signal.urgent and self.urgent_bypass:
+            client = get_telegram_client(signal.token)
+            for part in split_message(signal.text):
+                client.send_message(signal.chat_id, part)
+            return
+        with self._lock:
+            self._signals.append(signal)
+
+    def flush(self) -> list[Message | Exception]:
+        """Send the collected signals, chats being served concurrently. Returns the sent messages or errors."""
+        with self._lock:
+            signals, self._signals = self._signals, []
+        texts_by_chat: dict[tuple[str, str], list[str]] = {}
+        signal_counts: dict[str, int] = {}
+        for signal in signals:
+            texts_by_chat.setdefault((signal.token, signal.chat_id), []).append(
+                signal.text
+            )
+            signal_counts[signal.token] = signal_counts.get(signal.token, 0) + 1
+        messages_by_token: dict[str, list[tuple[str, str]]] = {}
+        for (token, chat_id), texts in texts_by_chat.items():
+            messages_by_token.setdefault(token, []).extend(
+                (chat_id, message) for message in pack_messages(texts)
+            )
+
+        results = []
+        for token, messages in messages_by_token.items():
+            logger.info(
+                f"Sending a digest of {signal_counts[token]} signal(s) in {len(messages)} message(s)"
+            )
+            results.extend(get_telegram_client(token).send_messages(messages))
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Failed to send a digest message: {result}")
+        return results
+
+
+# A context variable, so that concurrent runs each collect their own digest
+_digest: ContextVar[SignalDigest | None] = ContextVar("digest", default=None)
+
+
+@contextmanager
+def digest_signals(urgent_bypass: bool = True) -> Iterator[SignalDigest]:
+    """
+    Collect all the signals sent within the block, and the tasks and threads started in its context
+    (e.g., by call_probe), and flush them at its end.
+    """
+    digest = SignalDigest(urgent_bypass)
+    token = _digest.set(digest)
+    try:
+        yield digest
+    finally:
+        _digest.reset(token)
+        digest.flush()
+
+
+class SignalSink:
+    """Captures the signals of a run instead of sending them, e.g., when replaying past days."""
+
+    def __init__(self):
+        self.signals: list[Signal] = []
+        self._lock = threading.Lock()
+
+    def add(self, signal: Signal) -> None:
+        with self._lock:
+            self.signals.append(signal)
+
+
+# A context variable, so that concurrent runs each capture their own signals
+_sink: ContextVar[SignalSink | None] = ContextVar("sink", default=None)
+
+
+@contextmanager
+def sink_signals() -> Iterator[SignalSink]:
+    """
+    Capture all the signals sent within the block, and the tasks and threads started in its context
+    (e.g., by call_probe), none of them reaching Telegram.
+    """
+    sink = SignalSink()
+    token = _sink.set(sink)
+    try:
+        yield sink
+    finally:
+        _sink.reset(token)
+
+
+def send_message(chat_id: str, message: str, token: str, urgent: bool = False):
     """
-    Send a message to a Telegram chat (synchronous wrapper of the async send_message_async)
+    Send a message to a Telegram chat through the process' shared client for <token>,
+    or hand it to the sink capturing the signals or to the digest being collected, if any
 
     Args:
         chat_id: The Telegram chat ID to send the message to
-        message: The message text to send
+        message: The message text to send, split if longer than Telegram allows
         token: The Telegram bot token
+        urgent: Whether the message bypasses the digest (e.g., a state change)
     """
-    asyncio.run(send_message_async(chat_id, message, token))
+    sink = _sink.get()
+    if sink is not None:
+        sink.add(Signal(chat_id=chat_id, text=message, token=token, urgent=urgent))
+        return
+    digest = _digest.get()
+    if digest is not None:
+        digest.add(Signal(chat_id=chat_id, text=message, token=token, urgent=urgent))
+        return
+    client = get_telegram_client(token)
+    for part in split_message(message):
+        client.send_message(chat_id, part)
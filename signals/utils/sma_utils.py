@@ -0,0 +1,116 @@
+import json
+import logging
+import math
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import date
+
+import polars as pl
+from utils.cache_utils import RESTATEMENT_TOLERANCE
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SmaAccumulator:
+    """
+    Simple moving average of the closes of a ticker, updated bar by bar from its running sum.
+
+    Keeps the ring buffer of the last <lookback> closes along with their sum and the date of the last one,
+    so that a later run only reads the bars it hasn't seen yet: each of them is added to the sum
+    and the close it pushes out of the ring buffer subtracted, in O(1).
+    The sum is recomputed exactly every <lookback> bars, so that the rounding errors don't accumulate,
+    for an amortized O(1) cost per bar.
+    """
+
+    lookback: int
+    window: deque[float] = field(default_factory=deque)
+    total: float = 0.0
+    last_date: date | None = None
+    # Bars added since the sum was last recomputed exactly
+    pushes: int = 0
+
+    def __post_init__(self):
+        self.window = deque(self.window, maxlen=self.lookback)
+
+    @property
+    def sma(self) -> float | None:
+        if len(self.window) < self.lookback:
+            return None
+        return self.total / self.lookback
+
+    @property
+    def last_close(self) -> float | None:
+        return self.window[-1] if self.window else None
+
+    def reset(self, dates: pl.Series, closes: pl.Series) -> None:
+        """Recompute the accumulator from the full history of (sorted) bars."""
+        self.window = deque(closes.tail(self.lookback).to_list(), maxlen=self.lookback)
+        self.total = math.fsum(self.window)
+        self.last_date = dates.cast(pl.Date)[-1] if len(dates) else None
+        self.pushes = 0
+
+    def push(self, bar_date: date, close: float) -> None:
+        if len(self.window) == self.lookback:
+            self.total -= self.window[0]
+        self.window.append(close)
+        self.total += close
+        self.last_date = bar_date
+        self.pushes += 1
+        if self.pushes >= self.lookback:
+            self.total = math.fsum(self.window)
+            self.pushes = 0
+
+    def update(self, dates: pl.Series, closes: pl.Series) -> bool:
+        """
+        Push the (sorted) bars after the last accumulated one, which must be among them.
+
+        Returns False, leaving the accumulator untouched, when it has no full window yet,
+        or when the last accumulated bar is missing (gap) or its close changed (restatement,
+        e.g., after a split or a dividend adjustment): it must then be reset from the full history.
+        """
+        if self.sma is None or self.last_date is None:
+            return False
+        dates = dates.cast(pl.Date)
+        i = dates.search_sorted(self.last_date)
+        if (
+            i >= len(dates)
+            or dates[i] != self.last_date
+            or not math.isclose(
+                closes[i], self.last_close, rel_tol=RESTATEMENT_TOLERANCE
+            )
+        ):
+            logger.info(
+                f"Bar of {self.last_date} missing or restated, recomputing the SMA{self.lookback}"
+            )
+            return False
+        for bar_date, close in zip(dates[i + 1 :], closes[i + 1 :]):
+            self.push(bar_date, close)
+        return True
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {
+                "lookback": self.lookback,
+                "window": list(self.window),
+                "total": self.total,
+                "last_date": self.last_date.isoformat() if self.last_date else None,
+                "pushes": self.pushes,
+            }
+        )
+
+    @classmethod
+    def from_json(cls, value: str) -> "SmaAccumulator":
+        data = json.loads(value)
+        if "window" not in data:
+            # Accumulator stored without its closes by an earlier version, recomputed at its next update
+            return cls(lookback=data["lookback"])
+        return cls(
+            lookback=data["lookback"],
+            window=data["window"],
+            total=data["total"],
+            last_date=date.fromisoformat(data["last_date"])
+            if data["last_date"]
+            else None,
+            pushes=data.get("pushes", 0),
+        )
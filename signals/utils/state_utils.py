@@ -0,0 +1,166 @@
+import fcntl
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class StateBackend(ABC):
+    """
+    Persistent key-value store of the probes' states (e.g., the sma_crossover state or the last processed Strava activity).
+    Values are strings, structured ones being serialized by their probe.
+    """
+
+    @abstractmethod
+    def get_many(self, keys: list[str]) -> dict[str, str]:
+        """Return the values of the existing <keys>, in one read."""
+
+    @abstractmethod
+    def get_all(self, prefix: str = "") -> dict[str, str]:
+        """Return all the values whose key starts with <prefix>, in one read."""
+
+    @abstractmethod
+    def compare_and_set(self, key: str, expected: str | None, value: str) -> bool:
+        """
+        Atomically set <key> to <value> if its current value is <expected> (None meaning absent).
+        Returns whether it was set: False means that another run changed it in the meantime.
+        """
+
+    @abstractmethod
+    def set(self, key: str, value: str) -> None:
+        """Unconditionally set <key> to <value>."""
+
+    def get(self, key: str) -> str | None:
+        return self.get_many([key]).get(key)
+
+    def close(self) -> None:
+        pass
+
+
+class SqliteStateBackend(StateBackend):
+    """State store backed by a SQLite database, safe across threads and processes."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        # Autocommit mode: each statement is its own (atomic) transaction
+        self._connection = sqlite3.connect(
+            path, isolation_level=None, check_same_thread=False, timeout=30
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+
+    def get_many(self, keys: list[str]) -> dict[str, str]:
+        if not keys:
+            return {}
+        placeholders = ", ".join("?" for _ in keys)
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT key, value FROM state WHERE key IN ({placeholders})", keys
+            ).fetchall()
+        return dict(rows)
+
+    def get_all(self, prefix: str = "") -> dict[str, str]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT key, value FROM state WHERE substr(key, 1, ?) = ?",
+                (len(prefix), prefix),
+            ).fetchall()
+        return dict(rows)
+
+    def compare_and_set(self, key: str, expected: str | None, value: str) -> bool:
+        with self._lock:
+            if expected is None:
+                cursor = self._connection.execute(
+                    "INSERT INTO state (key, value) VALUES (?, ?) ON CONFLICT DO NOTHING",
+                    (key, value),
+                )
+            else:
+                cursor = self._connection.execute(
+                    "UPDATE state SET value = ? WHERE key = ? AND value = ?",
+                    (value, key, expected),
+                )
+        return cursor.rowcount == 1
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO state (key, value) VALUES (?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                (key, value),
+            )
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+class FileStateBackend(StateBackend):
+    """
+    State store backed by a JSON file, for setups where a single human-readable file is handier.
+    Updates hold an exclusive lock on a sibling lock file and replace the file atomically.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self) -> Iterator[dict[str, str]]:
+        with self._lock, open(f"{self.path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield self._read()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read(self) -> dict[str, str]:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write(self, states: dict[str, str]) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(states, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def get_many(self, keys: list[str]) -> dict[str, str]:
+        with self._locked() as states:
+            return {key: states[key] for key in keys if key in states}
+
+    def get_all(self, prefix: str = "") -> dict[str, str]:
+        with self._locked() as states:
+            return {k: v for k, v in states.items() if k.startswith(prefix)}
+
+    def compare_and_set(self, key: str, expected: str | None, value: str) -> bool:
+        with self._locked() as states:
+            if states.get(key) != expected:
+                return False
+            states[key] = value
+            self._write(states)
+        return True
+
+    def set(self, key: str, value: str) -> None:
+        with self._locked() as states:
+            states[key] = value
+            self._write(states)
+
+
+def get_state_backend(url: str) -> StateBackend:
+    """
+    Return the state backend described by <url>: sqlite://<path> or file://<path>,
+    e.g. sqlite:///var/lib/signals/state.db or file://state.json (relative path).
+    """
+    scheme, separator, path = url.partition("://")
+    if not separator or not path:
+        raise ValueError(f"Invalid state store URL: {url}")
+    if scheme == "sqlite":
+        return SqliteStateBackend(path)
+    if scheme == "file":
+        return FileStateBackend(path)
+    raise ValueError(f"Unsupported state store: {scheme}")